@@ -1,9 +1,10 @@
-from utils import call_openai_api
+from utils import call_openai_api, config
 
 def fetch_user_stories_from_rally(rally_endpoint, rally_api_key):
     # Simulated fetch logic
     return ["User Story 1", "User Story 2", "User Story 3"]
 
-def generate_code(user_story, language="python", prompt="", model="gpt-4"):
+def generate_code(user_story, language="python", prompt="", model="gpt-4", stream=False):
+    """Generate code for a user story; with stream=True returns an iterator of text chunks"""
     code_prompt = f"Generate {language} code for the following user story:\n\n{user_story}\n\nAdditional context:\n{prompt}"
-    return call_openai_api(code_prompt, config.get("openai_api_key"), model)
+    return call_openai_api(code_prompt, config.get("openai_api_key"), model, stream=stream)
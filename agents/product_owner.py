@@ -1,23 +1,63 @@
-import PyPDF2
-from io import BytesIO
-from utils import call_openai_api
-import openai
+from utils import call_openai_api, config
+from document_extraction import DEFAULT_EXTRACTION_WORKERS, extract_text
+from document_pipeline import (
+    DEFAULT_CHUNK_TOKENS,
+    DocumentPipelineError,
+    count_tokens,
+    iter_document_to_user_stories
+)
 
-def handle_file_upload(file, model="gpt-4"):
+def extract_document_text(file):
+    """Return the text of an uploaded PDF, .docx or text file (cached by file hash)"""
+    return extract_text(
+        file,
+        cache_dir=config.get("extraction_cache_dir"),
+        max_workers=config.get("extraction_workers", DEFAULT_EXTRACTION_WORKERS)
+    )
+
+def needs_chunking(file_content):
+    """True when a document is too large for a single user story prompt"""
+    return count_tokens(file_content) > DEFAULT_CHUNK_TOKENS
+
+def iter_user_stories_from_document(file_content, model="gpt-4"):
+    """
+    Map-reduce a large document into one user story per requirement cluster.
+
+    Yields the progress events of ``document_pipeline.iter_document_to_user_stories``;
+    the last one carries the ``stories``.
+    """
+    api_key = config.get("openai_api_key")
+
+    def complete(prompt):
+        text = call_openai_api(prompt, api_key, model)
+        if text.startswith("Error:"):
+            raise DocumentPipelineError(text)
+        return text
+
+    yield from iter_document_to_user_stories(
+        file_content,
+        complete,
+        max_workers=config.get("llm_max_workers", 4)
+    )
+
+def handle_file_upload(file, model="gpt-4", stream=False):
+    """
+    Generate a user story from an uploaded document; with stream=True returns an iterator of text chunks.
+
+    Documents larger than one chunk go through the map-reduce pipeline and
+    return all generated stories as one text, separated by "---" lines.
+    """
     try:
-        if file.type == "application/pdf":
-            pdf_reader = PyPDF2.PdfReader(BytesIO(file.read()))
-            file_content = "\n".join(page.extract_text() for page in pdf_reader.pages if page.extract_text())
-        else:
-            file_content = file.read().decode("utf-8")
+        file_content = extract_document_text(file)
+
+        if needs_chunking(file_content):
+            stories = []
+            for event in iter_user_stories_from_document(file_content, model):
+                stories = event.get("stories", stories)
+            return "\n\n---\n\n".join(stories)
 
         prompt = f"Generate a user story based on the following document:\n\n{file_content}"
-        openai.api_key = config.get("openai_api_key")
-        response = openai.ChatCompletion.create(
-            model=model,
-            messages=[{"role": "user", "content": prompt}]
-        )
-        return response.choices[0].message.content
+        return call_openai_api(prompt, config.get("openai_api_key"), model, stream=stream)
     except UnicodeDecodeError:
         return "File uploaded successfully, but it couldn't be decoded. Please ensure it is a valid text or PDF file."
     except Exception as e:
@@ -1,5 +1,69 @@
-from utils import call_openai_api
+import os
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from utils import call_openai_api, config, get_user_story_description
+from llm_client import TokenBudget
 
-def generate_test_cases(user_story, prompt, openai_api_key):
+def generate_test_cases(user_story, prompt, openai_api_key, stream=False, budget=None):
+    """Generate test cases for a user story; with stream=True returns an iterator of text chunks"""
     test_case_prompt = f"Generate test cases for the following user story:\n\n{user_story}\n\nAdditional context:\n{prompt}"
-    return call_openai_api(test_case_prompt, openai_api_key)
+    return call_openai_api(test_case_prompt, openai_api_key, stream=stream, budget=budget)
+
+def _generate_for_story(story, prompt, openai_api_key, budget):
+    result = {"story_id": story["formatted_id"], "name": story["name"], "test_cases": "", "error": ""}
+    try:
+        description = get_user_story_description(story["object_id"])
+        test_cases = generate_test_cases(f"{story['name']}\n\n{description}", prompt, openai_api_key, budget=budget)
+        if test_cases.startswith("Error:"):
+            result["error"] = test_cases
+        else:
+            result["test_cases"] = test_cases
+    except Exception as e:
+        result["error"] = str(e)
+    return result
+
+def _write_artifact_section(artifact, result):
+    artifact.write(f"## {result['story_id']}: {result['name']}\n\n")
+    if result["error"]:
+        artifact.write(f"> Generation failed: {result['error']}\n\n")
+    else:
+        artifact.write(f"```gherkin\n{result['test_cases']}\n```\n\n")
+    artifact.flush()
+
+def iter_generate_test_cases_batch(stories, prompt, openai_api_key, max_concurrency=None, tokens_per_minute=None, output_path=None):
+    """
+    Generate test cases for many stories concurrently.
+
+    Story descriptions are loaded and generations run on a pool of
+    ``max_concurrency`` workers that share one tokens-per-minute budget.
+    Each finished story is appended to a Markdown artifact at
+    ``output_path`` (default: a timestamped file in ``batch_output_dir``).
+
+    Yields:
+        (result, done, total, output_path) as each story finishes, where
+        result has ``story_id``, ``name``, ``test_cases`` and ``error``
+    """
+    total = len(stories)
+    if not total:
+        return
+    workers = min(max_concurrency or config.get("llm_batch_concurrency", 4), total)
+    budget = TokenBudget(tokens_per_minute or config.get("llm_tokens_per_minute"))
+    if output_path is None:
+        output_dir = config.get("batch_output_dir") or "."
+        os.makedirs(output_dir, exist_ok=True)
+        output_path = os.path.join(output_dir, f"test_cases_{time.strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:6]}.md")
+
+    with open(output_path, "w", encoding="utf-8") as artifact:
+        artifact.write(f"# Generated Test Cases\n\n{total} user stories, generated {time.strftime('%Y-%m-%d %H:%M')}\n\n")
+        artifact.flush()
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="test-case-batch") as executor:
+            futures = [executor.submit(_generate_for_story, story, prompt, openai_api_key, budget) for story in stories]
+            try:
+                for done, future in enumerate(as_completed(futures), start=1):
+                    result = future.result()
+                    _write_artifact_section(artifact, result)
+                    yield result, done, total, output_path
+            finally:
+                for future in futures:
+                    future.cancel()
@@ -0,0 +1,436 @@
+import os
+import sqlite3
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+import numpy as np
+import pandas as pd
+from result_history import DECISIVE_VERDICTS, HISTORY_COLUMNS
+from sqlite_store import SQLiteStore
+from story_test_analytics import TEST_CASE_COLUMNS, test_case_row
+from time_buckets import LABEL_FORMATS, TimeZone, floor_to_bucket, parse_timestamps, resolve_timezone
+
+DEFAULT_ANALYTICS_DB_PATH = os.path.join(".cache", "analytics.sqlite")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS stories (
+    object_id TEXT PRIMARY KEY,
+    formatted_id TEXT NOT NULL,
+    name TEXT,
+    workspace_id TEXT NOT NULL,
+    project_id TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_stories_project ON stories (project_id, formatted_id);
+
+CREATE TABLE IF NOT EXISTS testcases (
+    object_id TEXT PRIMARY KEY,
+    test_case_id TEXT NOT NULL,
+    test_case_name TEXT,
+    tcr_id,
+    date_time,
+    verdict,
+    LastBuild,
+    Duration,
+    Owner TEXT,
+    story_id TEXT NOT NULL,
+    workspace_id TEXT NOT NULL,
+    project_id TEXT NOT NULL,
+    position INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_testcases_story ON testcases (project_id, story_id, position);
+CREATE INDEX IF NOT EXISTS idx_testcases_verdict ON testcases (project_id, verdict);
+CREATE INDEX IF NOT EXISTS idx_testcases_date ON testcases (project_id, date_time);
+
+CREATE TABLE IF NOT EXISTS results (
+    result_oid TEXT PRIMARY KEY,
+    test_case_oid TEXT NOT NULL,
+    story_id TEXT,
+    date TEXT,
+    verdict TEXT,
+    build TEXT,
+    tester TEXT,
+    workspace_id TEXT NOT NULL,
+    project_id TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_results_test_case ON results (test_case_oid, date);
+CREATE INDEX IF NOT EXISTS idx_results_story ON results (project_id, story_id, date);
+CREATE INDEX IF NOT EXISTS idx_results_verdict ON results (project_id, verdict, date);
+
+CREATE TABLE IF NOT EXISTS defects (
+    object_id TEXT PRIMARY KEY,
+    name TEXT,
+    root_cause TEXT,
+    severity TEXT,
+    priority TEXT,
+    state TEXT,
+    creation_date TEXT,
+    created_at TEXT,
+    workspace_id TEXT NOT NULL,
+    project_id TEXT NOT NULL,
+    position INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_defects_project ON defects (project_id, position);
+CREATE INDEX IF NOT EXISTS idx_defects_date ON defects (project_id, creation_date);
+CREATE INDEX IF NOT EXISTS idx_defects_created ON defects (project_id, created_at);
+
+-- Defects of an in-progress reload, swapped into ``defects`` once the last page is in
+CREATE TABLE IF NOT EXISTS defect_loads (
+    load_id TEXT NOT NULL,
+    staged_at REAL NOT NULL,
+    object_id TEXT NOT NULL,
+    name TEXT,
+    root_cause TEXT,
+    severity TEXT,
+    priority TEXT,
+    state TEXT,
+    creation_date TEXT,
+    created_at TEXT,
+    workspace_id TEXT NOT NULL,
+    project_id TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    PRIMARY KEY (load_id, object_id)
+);
+CREATE INDEX IF NOT EXISTS idx_defect_loads_staged ON defect_loads (staged_at);
+
+CREATE TABLE IF NOT EXISTS sync_state (
+    scope TEXT PRIMARY KEY,
+    synced_at REAL NOT NULL
+);
+"""
+
+# Staged defect loads older than this were abandoned by a process that died mid-load
+STALE_LOAD_AGE = 24 * 3600
+
+# Rally type of the work products the story analytics cover (test cases can also belong to defects)
+STORY_TYPE = "HierarchicalRequirement"
+
+# Distributions reported by project_rca_data, by output key and defect column
+RCA_DISTRIBUTIONS = {
+    "rca_summary": "root_cause",
+    "severity_distribution": "severity",
+    "priority_distribution": "priority",
+    "state_distribution": "state"
+}
+
+
+def _month_ranges(first: str, last: str, tz: TimeZone = None) -> List[Tuple[str, str, str]]:
+    """
+    ``(month, start, end)`` for every month from ``first`` to ``last`` in ``tz``.
+
+    Starts and ends are UTC timestamps in Rally's format, so they compare
+    as strings against stored ``CreationDate`` values.
+    """
+    bounds = floor_to_bucket(parse_timestamps([first, last], tz), "month")
+    if bounds.isna().any():
+        return []
+    starts = pd.date_range(bounds.iloc[0], bounds.iloc[1], freq="MS")
+    edges = starts.append(pd.DatetimeIndex([starts[-1] + pd.offsets.MonthBegin()]))
+    edges = edges.tz_localize(
+        resolve_timezone(tz), ambiguous=np.zeros(len(edges), dtype=bool), nonexistent="shift_forward"
+    ).tz_convert("UTC").strftime('%Y-%m-%dT%H:%M:%S.000Z').tolist()
+    return list(zip(starts.strftime(LABEL_FORMATS["month"]), edges[:-1], edges[1:]))
+
+
+def defect_row(defect: Dict[str, Any], workspace_id: str, project_id: str, position: int) -> Tuple[Any, ...]:
+    """A raw Rally defect as a ``defects`` table row; ``position`` keeps Rally's order"""
+    return (
+        str(defect.get('ObjectID') or f"{project_id}:{position}"),
+        defect.get('Name', 'Unnamed Defect'),
+        defect.get('c_RCARootCauseUS', 'Unspecified'),
+        defect.get('Severity', 'None'),
+        defect.get('Priority', 'None'),
+        defect.get('State', 'None'),
+        defect.get('CreationDate', '').split('T')[0],
+        defect.get('CreationDate'),
+        workspace_id,
+        project_id,
+        position
+    )
+
+
+class AnalyticsStore(SQLiteStore):
+    """
+    Embedded analytics database of Rally stories, test cases, test results and defects.
+
+    The Rally fetch layer in ``utils`` writes what it loads here, and the
+    dashboards' aggregates are SQL queries over indexed tables, so reruns
+    and cross-story questions don't go back to Rally or rebuild from JSON.
+    Stored in SQLite (WAL mode, one connection per thread), shared by every
+    app process on the machine. ``sync_state`` records when each scope
+    (e.g. a story's test cases) was last loaded from Rally.
+    """
+
+    def __init__(self, path: str = DEFAULT_ANALYTICS_DB_PATH):
+        super().__init__(path)
+        self._connect().executescript(SCHEMA)
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def _query(self, sql: str, params: Iterable[Any] = ()) -> pd.DataFrame:
+        return pd.read_sql_query(sql, self._connect(), params=list(params))
+
+    # Sync bookkeeping
+
+    def synced_within(self, scope: str, max_age: float) -> bool:
+        """True when ``scope`` was loaded from Rally less than ``max_age`` seconds ago"""
+        if max_age <= 0:
+            return False
+        row = self._connect().execute("SELECT synced_at FROM sync_state WHERE scope = ?", (scope,)).fetchone()
+        return row is not None and time.time() - row[0] < max_age
+
+    def _mark_synced(self, conn: sqlite3.Connection, scope: str) -> None:
+        conn.execute("INSERT OR REPLACE INTO sync_state (scope, synced_at) VALUES (?, ?)", (scope, time.time()))
+
+    def mark_synced(self, scope: str) -> None:
+        """Record that ``scope`` was fully loaded from Rally just now"""
+        self._mark_synced(self._connect(), scope)
+
+    def invalidate(self, scope: str = "") -> None:
+        """Forget the sync time of ``scope`` and the scopes under it (all when empty), so they reload from Rally"""
+        self._connect().execute(
+            "DELETE FROM sync_state WHERE ? = '' OR scope = ? OR substr(scope, 1, ?) = ?",
+            (scope, scope, len(scope) + 1, scope + "|")
+        )
+
+    # Loading
+
+    def replace_stories(self, scope: str, workspace_id: str, project_id: str, stories: List[Dict[str, Any]]) -> None:
+        """Store the full story list of a project"""
+        rows = [
+            (str(story['ObjectID']), story.get('FormattedID', ''), story.get('Name'), workspace_id, project_id)
+            for story in stories
+            if story.get('ObjectID')
+        ]
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM stories WHERE project_id = ?", (project_id,))
+            conn.executemany("INSERT OR REPLACE INTO stories VALUES (?, ?, ?, ?, ?)", rows)
+            self._mark_synced(conn, scope)
+
+    def replace_story_test_cases(
+        self,
+        scope: str,
+        workspace_id: str,
+        project_id: str,
+        story_id: str,
+        test_cases: List[Dict[str, Any]]
+    ) -> None:
+        """Store the full test case list of a story (test cases no longer linked are dropped)"""
+        rows = []
+        for record in test_cases:
+            row = test_case_row(record)
+            if row is not None and record.get('ObjectID'):
+                rows.append((str(record['ObjectID']),) + row + (story_id, workspace_id, project_id, len(rows)))
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM testcases WHERE project_id = ? AND story_id = ?", (project_id, story_id))
+            conn.executemany(f"INSERT OR REPLACE INTO testcases VALUES ({', '.join('?' * 13)})", rows)
+            self._mark_synced(conn, scope)
+
+    def replace_project_test_cases(self, scope: str, workspace_id: str, project_id: str, test_cases: List[Dict[str, Any]]) -> None:
+        """
+        Store the test cases of every story in a project at once.
+
+        Each record's ``WorkProduct.FormattedID`` names its story; records
+        without one, or whose work product isn't a story (e.g. a defect),
+        are skipped.
+        """
+        rows = []
+        positions: Dict[str, int] = {}
+        for record in test_cases:
+            row = test_case_row(record)
+            work_product = (record.get('WorkProduct', {}) or {}) if isinstance(record, dict) else {}
+            story_id = work_product.get('FormattedID') if work_product.get('_type') == STORY_TYPE else None
+            if row is None or not story_id or not record.get('ObjectID'):
+                continue
+            position = positions[story_id] = positions.get(story_id, -1) + 1
+            rows.append((str(record['ObjectID']),) + row + (story_id, workspace_id, project_id, position))
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM testcases WHERE project_id = ?", (project_id,))
+            conn.executemany(f"INSERT OR REPLACE INTO testcases VALUES ({', '.join('?' * 13)})", rows)
+            self._mark_synced(conn, scope)
+
+    def add_results(self, workspace_id: str, project_id: str, rows: List[Tuple[Any, ...]]) -> None:
+        """Upsert test case runs given as ``result_history.result_rows`` tuples"""
+        rows = [tuple(row) + (workspace_id, project_id) for row in rows if row[0]]
+        with self._transaction() as conn:
+            conn.executemany("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+
+    def begin_defect_load(self) -> str:
+        """
+        Start staging a project's defects for a reload; returns the load id.
+
+        Staged rows are invisible to queries until ``commit_defect_load``, so
+        concurrent loads and readers never see a half-filled defect set.
+        """
+        self._connect().execute("DELETE FROM defect_loads WHERE staged_at < ?", (time.time() - STALE_LOAD_AGE,))
+        return uuid.uuid4().hex
+
+    def stage_defects(self, load_id: str, rows: List[Tuple[Any, ...]]) -> None:
+        """Add one page of defects, given as ``defect_row`` tuples, to a load"""
+        staged_at = time.time()
+        with self._transaction() as conn:
+            conn.executemany(
+                f"INSERT OR REPLACE INTO defect_loads VALUES ({', '.join('?' * 13)})",
+                [(load_id, staged_at) + tuple(row) for row in rows]
+            )
+
+    def commit_defect_load(self, scope: str, load_id: str, project_id: str) -> None:
+        """Replace a project's defects with a completed load and mark ``scope`` synced, atomically"""
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM defects WHERE project_id = ?", (project_id,))
+            conn.execute(
+                "INSERT OR REPLACE INTO defects SELECT object_id, name, root_cause, severity, priority, state, "
+                "creation_date, created_at, workspace_id, project_id, position FROM defect_loads WHERE load_id = ?",
+                (load_id,)
+            )
+            conn.execute("DELETE FROM defect_loads WHERE load_id = ?", (load_id,))
+            self._mark_synced(conn, scope)
+
+    def discard_defect_load(self, load_id: str) -> None:
+        """Drop the staged rows of an unfinished load (a no-op once committed)"""
+        self._connect().execute("DELETE FROM defect_loads WHERE load_id = ?", (load_id,))
+
+    # Queries
+
+    def story_test_case_frame(self, project_id: str, story_id: str) -> pd.DataFrame:
+        """A story's test cases in Rally order, as a ``story_test_analytics`` frame"""
+        rows = self._connect().execute(
+            f"SELECT {', '.join(TEST_CASE_COLUMNS)} FROM testcases "
+            "WHERE project_id = ? AND story_id = ? ORDER BY position",
+            (project_id, story_id)
+        ).fetchall()
+        # Object columns keep SQLite's values as stored (ints stay ints, NULL stays None)
+        return pd.DataFrame(rows, columns=TEST_CASE_COLUMNS, dtype=object)
+
+    def project_test_case_frame(self, project_id: str) -> pd.DataFrame:
+        """
+        Every stored test case of a project, grouped by story.
+
+        ``TEST_CASE_COLUMNS`` plus ``story_id`` and ``story_name`` (from the
+        stored story list, or the story ID when the story isn't stored).
+        """
+        columns = TEST_CASE_COLUMNS + ["story_id", "story_name"]
+        rows = self._connect().execute(
+            f"SELECT {', '.join('t.' + column for column in TEST_CASE_COLUMNS)}, t.story_id, "
+            "COALESCE(s.name, t.story_id) FROM testcases t "
+            "LEFT JOIN stories s ON s.project_id = t.project_id AND s.formatted_id = t.story_id "
+            "WHERE t.project_id = ? ORDER BY t.story_id, t.position",
+            (project_id,)
+        ).fetchall()
+        return pd.DataFrame(rows, columns=columns, dtype=object)
+
+    def story_results(self, project_id: str, story_id: str) -> List[Tuple[Any, ...]]:
+        """A story's stored test runs as ``result_history.result_rows`` tuples"""
+        return self._connect().execute(
+            f"SELECT {', '.join(HISTORY_COLUMNS)} FROM results WHERE project_id = ? AND story_id = ?",
+            (project_id, story_id)
+        ).fetchall()
+
+    def latest_result_date(self, project_id: str, story_id: str) -> Optional[str]:
+        """Rally timestamp of a story's newest stored run, for incremental loads"""
+        row = self._connect().execute(
+            "SELECT MAX(date) FROM results WHERE project_id = ? AND story_id = ?", (project_id, story_id)
+        ).fetchone()
+        return row[0]
+
+    def project_rca_data(self, project_id: str, tz: TimeZone = None, limit: int = 1000) -> Dict[str, Any]:
+        """
+        RCA aggregates of a project's stored defects (same shape as ``utils.get_project_rca_data``).
+
+        Every aggregate is a GROUP BY in SQLite; only the first ``limit``
+        defects (in Rally order) are read back for the detail table.
+        """
+        conn = self._connect()
+        rca_data: Dict[str, Any] = {"monthly_trend": {}}
+        rca_data["total_defects"] = conn.execute(
+            "SELECT COUNT(*) FROM defects WHERE project_id = ?", (project_id,)
+        ).fetchone()[0]
+        rca_data["defects"] = self._query(
+            "SELECT name, root_cause, severity, priority, state, creation_date "
+            "FROM defects WHERE project_id = ? ORDER BY position LIMIT ?",
+            (project_id, limit)
+        ).to_dict("records")
+
+        for key, column in RCA_DISTRIBUTIONS.items():
+            rca_data[key] = dict(conn.execute(
+                f"SELECT {column}, COUNT(*) FROM defects WHERE project_id = ? "
+                f"GROUP BY {column} ORDER BY MIN(position)",
+                (project_id,)
+            ).fetchall())
+
+        # Months are cut in ``tz`` by joining on each month's UTC range
+        first, last = conn.execute(
+            "SELECT MIN(created_at), MAX(created_at) FROM defects WHERE project_id = ?", (project_id,)
+        ).fetchone()
+        months = _month_ranges(first, last, tz) if first else []
+        counts = []
+        if months:
+            counts = conn.execute(
+                f"WITH months (month, start_at, end_at) AS (VALUES {', '.join(['(?, ?, ?)'] * len(months))}) "
+                "SELECT m.month, d.root_cause, COUNT(*) FROM months m JOIN defects d "
+                "ON d.project_id = ? AND d.created_at >= m.start_at AND d.created_at < m.end_at "
+                "GROUP BY m.month, d.root_cause",
+                [value for month in months for value in month] + [project_id]
+            ).fetchall()
+        # Defects without a creation timestamp fall back to their creation date's month
+        counts += conn.execute(
+            "SELECT substr(creation_date, 1, 7), root_cause, COUNT(*) FROM defects "
+            "WHERE project_id = ? AND created_at IS NULL GROUP BY 1, 2",
+            (project_id,)
+        ).fetchall()
+        for month, root_cause, count in counts:
+            trend = rca_data["monthly_trend"].setdefault(month, {})
+            trend[root_cause] = trend.get(root_cause, 0) + count
+        return rca_data
+
+    def top_failing_tests(self, project_id: str, limit: int = 10, since: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Test cases with the most failed runs across every story of a project.
+
+        Only stored runs count; ``since`` limits them to runs dated on or
+        after an ISO timestamp. Each test case has the same run statistics
+        as ``ResultHistory.test_case_stats`` (flakiness over its runs in the
+        window) plus its ``story_id``.
+        """
+        decisive = ", ".join(f"'{verdict}'" for verdict in DECISIVE_VERDICTS)
+        # With MAX() the only min/max aggregate, SQLite takes the bare verdict from the latest run
+        rows = self._connect().execute(
+            "WITH runs AS ("
+            "SELECT test_case_oid, story_id, date, verdict, "
+            "LAG(verdict) OVER (PARTITION BY test_case_oid ORDER BY date) AS previous "
+            "FROM results WHERE project_id = ? AND date >= ?) "
+            "SELECT runs.test_case_oid, COALESCE(t.test_case_id, runs.test_case_oid), "
+            "COALESCE(t.test_case_name, 'Unnamed Test'), runs.story_id, "
+            "COUNT(*) AS run_count, SUM(runs.verdict = 'Fail') AS failures, "
+            f"SUM(runs.verdict IN ({decisive}) AND runs.previous IN ({decisive})) AS pairs, "
+            f"SUM(runs.verdict IN ({decisive}) AND runs.previous IN ({decisive}) AND runs.verdict != runs.previous), "
+            "MAX(runs.date), runs.verdict "
+            "FROM runs LEFT JOIN testcases t ON t.object_id = runs.test_case_oid "
+            "GROUP BY runs.test_case_oid HAVING failures > 0 "
+            "ORDER BY failures DESC, run_count ASC LIMIT ?",
+            (project_id, since or "", limit)
+        ).fetchall()
+        return [
+            {
+                "test_case_oid": oid,
+                "test_case_id": test_case_id,
+                "test_case_name": name,
+                "story_id": story_id,
+                "runs": runs,
+                "failures": failures,
+                "failure_rate": failures / runs * 100,
+                "flakiness": flips / pairs * 100 if pairs else 0.0,
+                "last_verdict": last_verdict,
+                "last_run": last_run
+            }
+            for oid, test_case_id, name, story_id, runs, failures, pairs, flips, last_run, last_verdict in rows
+        ]
@@ -1,23 +1,40 @@
 import streamlit as st
-from agents.product_owner import handle_file_upload
+from agents.product_owner import (
+    extract_document_text,
+    handle_file_upload,
+    iter_user_stories_from_document,
+    needs_chunking
+)
+from document_pipeline import DocumentPipelineError
+from rally_upload import story_name_from_text
 from agents.developer import generate_code
-from agents.test_manager import generate_test_cases
+from agents.test_manager import generate_test_cases, iter_generate_test_cases_batch
 from utils import (
     check_rally_config,
     upload_user_story_to_rally,
+    iter_upload_user_stories_to_rally,
     config,
     test_rally_connection,
     get_rally_workspaces,
     get_rally_projects,
     get_rally_user_stories,
-    get_user_story_test_data,
-    get_project_rca_data
+    get_user_story_description,
+    search_rally_user_stories,
+    iter_project_rca_data,
+    get_project_top_failing_tests,
+    get_llm_cache_stats
 )
+import rally_async
+from rally_async import run_concurrently
+from rally_errors import RallyAPIError
+from time_buckets import GRANULARITIES, TREND_WINDOWS
 import openai
 import pandas as pd
 import plotly.express as px
 import urllib3
 import warnings
+import time
+import os
 import plotly.graph_objects as go
  
 # Disable SSL warnings
@@ -181,6 +198,18 @@ else:
  
 # Settings section in sidebar
 st.sidebar.markdown("## ⚙️ Settings")
+config["llm_cache_enabled"] = st.sidebar.checkbox(
+    "Reuse cached AI responses",
+    value=config.get("llm_cache_enabled", True),
+    help="Identical generation requests are answered from a local cache instead of calling the model again"
+)
+llm_cache_stats = get_llm_cache_stats()
+if llm_cache_stats:
+    st.sidebar.caption(
+        f"AI cache: {llm_cache_stats['hit_rate']:.0%} hit rate "
+        f"({llm_cache_stats['hits']} hits, {llm_cache_stats['misses']} misses, "
+        f"{llm_cache_stats['entries']} entries, {llm_cache_stats['bytes'] / 1024:.0f} KB)"
+    )
 if st.sidebar.checkbox("Show Configuration"):
     st.sidebar.markdown("### 🔑 Rally Configuration")
    
@@ -203,7 +232,11 @@ if st.sidebar.checkbox("Show Configuration"):
                 success, message = test_rally_connection(config["rally_endpoint"], config["rally_api_key"])
                 if success:
                     st.sidebar.markdown(f'<div class="success-message">✅ {message}</div>', unsafe_allow_html=True)
-                    workspaces = get_rally_workspaces()
+                    try:
+                        workspaces = get_rally_workspaces()
+                    except RallyAPIError as e:
+                        st.sidebar.error(f"Could not load workspaces: {str(e)}")
+                        workspaces = []
                     if workspaces:
                         st.session_state['workspaces'] = workspaces
                 else:
@@ -333,7 +366,11 @@ def show_workspace_project_selector():
        
         if selected_workspace_name:
             selected_workspace = workspace_names[selected_workspace_name]
-            projects = get_rally_projects(selected_workspace)
+            try:
+                projects = get_rally_projects(selected_workspace)
+            except RallyAPIError as e:
+                st.error(f"Could not load projects: {str(e)}")
+                projects = []
            
             if projects:
                 project_names = {p["name"]: p["id"] for p in projects}
@@ -346,6 +383,319 @@ def show_workspace_project_selector():
    
     return selected_workspace, selected_project
  
+# Searchable user story picker backed by server-side Rally queries
+def show_user_story_picker(selected_workspace, selected_project, key):
+    """
+    Render story search filters and a selectbox over the matching stories.
+   
+    Only the matching slice is fetched from Rally, one page at a time via a
+    "Load more" button. Text inputs only submit on Enter or blur, so a lookup
+    runs once per edited filter rather than once per keystroke.
+   
+    Returns:
+        Tuple of (stories loaded so far, selected story or None)
+    """
+    search_col, iteration_col, owner_col = st.columns([2, 1, 1])
+    with search_col:
+        search = st.text_input("Search User Stories (name or ID)", key=f"{key}_story_search")
+    with iteration_col:
+        iteration = st.text_input("Iteration", key=f"{key}_story_iteration")
+    with owner_col:
+        owner = st.text_input("Owner", key=f"{key}_story_owner")
+   
+    filters = (selected_workspace, selected_project, search.strip(), iteration.strip(), owner.strip())
+    state_key = f"{key}_story_pages"
+    if st.session_state.get(f"{key}_story_filters") != filters or state_key not in st.session_state:
+        try:
+            first_page = search_rally_user_stories(
+                selected_workspace, selected_project, search, iteration, owner
+            )
+        except RallyAPIError as e:
+            st.error(f"Could not load user stories: {str(e)}")
+            return [], None
+        st.session_state[f"{key}_story_filters"] = filters
+        st.session_state[state_key] = first_page
+    pages = st.session_state[state_key]
+   
+    user_stories = pages["stories"]
+    if not user_stories:
+        return user_stories, None
+   
+    story_options = {story["display_name"]: story for story in user_stories}
+    selected_story_name = st.selectbox(
+        f"Select User Story ({len(user_stories)} of {pages['total']})",
+        list(story_options.keys()),
+        key=f"{key}_story_select"
+    )
+   
+    if pages["next_cursor"] and st.button("Load more stories", key=f"{key}_story_more"):
+        try:
+            next_page = search_rally_user_stories(
+                selected_workspace, selected_project, search, iteration, owner, cursor=pages["next_cursor"]
+            )
+        except RallyAPIError as e:
+            st.error(f"Could not load more user stories: {str(e)}")
+            return user_stories, story_options.get(selected_story_name)
+        pages["stories"] = user_stories + next_page["stories"]
+        pages["next_cursor"] = next_page["next_cursor"]
+        st.rerun()
+   
+    return user_stories, story_options.get(selected_story_name)
+ 
+# Streamed LLM output is redrawn at most this often (seconds)
+STREAM_RENDER_INTERVAL = 0.1
+ 
+# How the LLM helpers report a failed generation (possibly after partial output)
+GENERATION_ERROR_PREFIXES = ("Error:", "An error occurred")
+ 
+def render_stream(chunks, language):
+    """
+    Render LLM output into a single code block as it streams in.
+   
+    Accepts an iterator of text chunks (or a plain string) and returns
+    ``(text, complete)`` once the stream is finished. ``complete`` is False
+    when the stream broke off or reported an error, so callers don't keep
+    partial output as a result.
+    """
+    if isinstance(chunks, str):
+        st.code(chunks, language=language)
+        return chunks, not chunks.startswith(GENERATION_ERROR_PREFIXES)
+    placeholder = st.empty()
+    text = ""
+    last_chunk = ""
+    last_render = 0.0
+    try:
+        for chunk in chunks:
+            text += chunk
+            last_chunk = chunk
+            if time.monotonic() - last_render >= STREAM_RENDER_INTERVAL:
+                placeholder.code(text + "▌", language=language)
+                last_render = time.monotonic()
+    except Exception as e:
+        placeholder.code(text, language=language)
+        st.error(f"Generation stopped early: {str(e)}")
+        return text, False
+    placeholder.code(text, language=language)
+    failed = text.startswith(GENERATION_ERROR_PREFIXES) or last_chunk.startswith(GENERATION_ERROR_PREFIXES)
+    return text, not failed
+ 
+PIPELINE_STAGE_LABELS = {
+    "map": "Extracting requirements",
+    "combine": "Merging requirement notes",
+    "reduce": "Writing user stories"
+}
+ 
+def upload_stories_with_progress(stories, project_id):
+    """Bulk-create stories in Rally with a progress bar, then show per-story results"""
+    # Creates run concurrently; results arrive in completion order
+    upload_progress = st.progress(0.0, text="Uploading stories...")
+    results = []
+    try:
+        for result, done, total in iter_upload_user_stories_to_rally(stories, project_id):
+            results.append(result)
+            upload_progress.progress(done / total, text=f"Uploaded {done} of {total} stories...")
+    except RallyAPIError as e:
+        st.error(f"Rally rejected the upload: {str(e)}")
+    upload_progress.empty()
+    if not results:
+        return
+   
+    results_df = pd.DataFrame(results).sort_values("index")
+    status_counts = results_df["status"].value_counts()
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Created", int(status_counts.get("created", 0)))
+    col2.metric("Already in Rally", int(status_counts.get("existing", 0)))
+    col3.metric("Failed", int(status_counts.get("failed", 0)))
+    st.dataframe(
+        results_df[["name", "status", "formatted_id", "error"]],
+        hide_index=True,
+        use_container_width=True
+    )
+ 
+def show_trend_selectors():
+    """Trend window and bucket size pickers shared by the failure analysis views"""
+    trend_col1, trend_col2 = st.columns(2)
+    with trend_col1:
+        trend_window = st.selectbox(
+            "Trend Window",
+            list(TREND_WINDOWS.keys()),
+            index=list(TREND_WINDOWS.values()).index(10),
+            key="failure_trend_window"
+        )
+    with trend_col2:
+        trend_granularity = st.radio(
+            "Group By",
+            GRANULARITIES,
+            format_func=str.title,
+            horizontal=True,
+            key="failure_trend_granularity"
+        )
+    return trend_window, trend_granularity
+ 
+def show_project_rollups(test_data, trend_window, trend_granularity):
+    """Worst stories, worst owners and story hot spots of a project-wide analysis"""
+    worst_stories = test_data.get("worst_stories", [])
+    worst_owners = test_data.get("worst_owners", [])
+    if not worst_stories:
+        st.success("No failing test cases in this project")
+        return
+   
+    col1, col2 = st.columns(2)
+    with col1:
+        st.subheader("📚 Worst Stories")
+        fig = go.Figure(go.Bar(
+            x=[story["failed"] for story in worst_stories][::-1],
+            y=[f"{story['story_id']}: {story['story_name']}"[:60] for story in worst_stories][::-1],
+            orientation="h",
+            marker_color="#ff4b4b",
+            customdata=[[story["total"], story["failure_rate"]] for story in worst_stories][::-1],
+            hovertemplate="%{y}<br>Failed: %{x} of %{customdata[0]}<br>Failure Rate: %{customdata[1]:.1f}%<extra></extra>"
+        ))
+        fig.update_layout(height=400, xaxis_title="Failed Test Cases", margin=dict(l=0, r=0, t=20, b=0))
+        st.plotly_chart(fig, use_container_width=True)
+    with col2:
+        st.subheader("👥 Worst Owners")
+        fig = go.Figure(go.Bar(
+            x=[owner["failed"] for owner in worst_owners][::-1],
+            y=[owner["owner"] for owner in worst_owners][::-1],
+            orientation="h",
+            marker_color="#ffa64b",
+            customdata=[[owner["total"], owner["failure_rate"]] for owner in worst_owners][::-1],
+            hovertemplate="%{y}<br>Failed: %{x} of %{customdata[0]}<br>Failure Rate: %{customdata[1]:.1f}%<extra></extra>"
+        ))
+        fig.update_layout(height=400, xaxis_title="Failed Test Cases", margin=dict(l=0, r=0, t=20, b=0))
+        st.plotly_chart(fig, use_container_width=True)
+   
+    hot_spots = test_data.get("hot_spots", {})
+    st.subheader(f"🗺️ Failure Hot Spots ({trend_window}, by {trend_granularity})")
+    if any(any(counts.values()) for counts in hot_spots.values()):
+        story_ids = list(hot_spots.keys())
+        buckets = list(next(iter(hot_spots.values())).keys())
+        fig = go.Figure(data=go.Heatmap(
+            z=[list(hot_spots[story_id].values()) for story_id in story_ids],
+            x=buckets,
+            y=story_ids,
+            colorscale="Reds",
+            hovertemplate="Story: %{y}<br>Period: %{x}<br>Failed: %{z}<extra></extra>"
+        ))
+        fig.update_layout(height=max(300, 40 * len(story_ids)), xaxis_title="Period", yaxis_title="User Story")
+        st.plotly_chart(fig, use_container_width=True)
+    else:
+        st.info("None of the worst stories ran a failing test in this window")
+ 
+def load_story_failure_analysis(selected_workspace, selected_project, selected_story, trend_window, trend_granularity):
+    """Test data, run history (None when it fails to load) and failing test cases of one story"""
+    # Test cases and defects are independent, so fetch them concurrently;
+    # the run history is optional and settled on its own
+    try:
+        story_data = run_concurrently({
+            "test_data": lambda: rally_async.get_user_story_test_data(
+                selected_workspace, selected_project, selected_story["id"],
+                TREND_WINDOWS[trend_window], trend_granularity),
+            "history": lambda: rally_async.settle(rally_async.get_user_story_test_history(
+                selected_workspace, selected_project, selected_story["id"],
+                TREND_WINDOWS[trend_window], trend_granularity)),
+            "defects": lambda: rally_async.get_user_story_defects(
+                selected_workspace, selected_project, selected_story["id"])
+        })
+    except RallyAPIError as e:
+        st.error(f"Could not load test data from Rally: {str(e)}")
+        story_data = {"test_data": None, "history": (None, None), "defects": []}
+    test_data = story_data["test_data"]
+    # Trends and failure counts come from the full run history when it loads
+    history, history_error = story_data["history"]
+    if history_error is not None:
+        st.warning(f"Test run history is unavailable, showing latest verdicts only: {str(history_error)}")
+    if test_data and story_data["defects"]:
+        test_data["defects"] = story_data["defects"]
+    top_failing = [tc for tc in (history or {}).get("test_cases", []) if tc["failures"] > 0]
+    return test_data, history, top_failing
+ 
+def load_project_failure_analysis(selected_workspace, selected_project, trend_window, trend_granularity):
+    """Test data and failing test cases across every story of a project, after rendering its rollups"""
+    test_data = None
+    with st.spinner("Loading test cases for every story in the project..."):
+        try:
+            test_data = run_concurrently({
+                "test_data": lambda: rally_async.get_project_test_data(
+                    selected_workspace, selected_project,
+                    TREND_WINDOWS[trend_window], trend_granularity)
+            })["test_data"]
+        except RallyAPIError as e:
+            st.error(f"Could not load test data from Rally: {str(e)}")
+    if test_data and test_data["total_tests"]:
+        show_project_rollups(test_data, trend_window, trend_granularity)
+    elif test_data:
+        st.info("No test cases are linked to stories in this project")
+    # Runs of the stories whose history has been loaded, within the trend window
+    since = (pd.Timestamp.now(tz="UTC") - pd.Timedelta(days=TREND_WINDOWS[trend_window])).strftime('%Y-%m-%dT%H:%M:%S.000Z')
+    top_failing = get_project_top_failing_tests(selected_project, since=since)
+    return test_data, None, top_failing
+ 
+def show_batch_test_case_generation(selected_workspace, selected_project):
+    """Generate test cases for many stories of a project at once, with a downloadable Markdown artifact"""
+    try:
+        all_stories = get_rally_user_stories(selected_workspace, selected_project)
+    except RallyAPIError as e:
+        st.error(f"Could not load user stories: {str(e)}")
+        return
+   
+    story_filter = st.text_input("Filter Stories (name or ID contains)", key="batch_story_filter").strip().lower()
+    matching = [s for s in all_stories if story_filter in s["display_name"].lower()]
+    if st.checkbox(f"Use all {len(matching)} matching stories", value=True, key="batch_use_all"):
+        batch_stories = matching
+    else:
+        story_options = {s["display_name"]: s for s in matching}
+        picked = st.multiselect("User Stories", list(story_options.keys()), key="batch_story_select")
+        batch_stories = [story_options[name] for name in picked]
+   
+    col1, col2 = st.columns(2)
+    with col1:
+        max_concurrency = st.slider(
+            "Concurrent Generations", 1, 16, int(config.get("llm_batch_concurrency", 4)), key="batch_concurrency"
+        )
+    with col2:
+        tokens_per_minute = st.number_input(
+            "Token Budget per Minute",
+            min_value=1000,
+            value=int(config.get("llm_tokens_per_minute")),
+            step=1000,
+            key="batch_tpm"
+        )
+    prompt = st.text_area("Additional Test Requirements (Optional)", key="batch_prompt")
+   
+    if batch_stories and st.button(f"Generate Test Cases for {len(batch_stories)} Stories"):
+        batch_progress = st.progress(0.0, text="Generating test cases...")
+        failed = 0
+        for result, done, total, output_path in iter_generate_test_cases_batch(
+            batch_stories,
+            prompt,
+            config.get("openai_api_key"),
+            max_concurrency=max_concurrency,
+            tokens_per_minute=tokens_per_minute
+        ):
+            failed += bool(result["error"])
+            batch_progress.progress(done / total, text=f"Generated {done} of {total} stories ({failed} failed)...")
+            with st.expander(f"{result['story_id']}: {result['name']}", expanded=False):
+                if result["error"]:
+                    st.error(result["error"])
+                else:
+                    st.code(result["test_cases"], language="gherkin")
+        batch_progress.empty()
+        st.session_state["batch_artifact_path"] = output_path
+        st.success(f"Generated test cases for {total - failed} of {total} stories")
+   
+    artifact_path = st.session_state.get("batch_artifact_path")
+    if artifact_path and os.path.exists(artifact_path):
+        with open(artifact_path, "rb") as artifact:
+            st.download_button(
+                "Download Test Cases (Markdown)",
+                artifact.read(),
+                file_name=os.path.basename(artifact_path),
+                mime="text/markdown",
+                on_click="ignore"
+            )
+ 
 # Handle main content based on selection
 if task_agents_enabled and selected_task == "👤 Product Owner Agent":
     st.title("👤 Product Owner Agent")
@@ -357,18 +707,95 @@ if task_agents_enabled and selected_task == "👤 Product Owner Agent":
        
         if uploaded_file:
             st.success("File uploaded successfully!")
-            user_story = handle_file_upload(uploaded_file, config.get("openai_api_key"))
            
+            # Generate once per uploaded file so later reruns (e.g. the upload button) reuse it
+            story_key = f"generated_story_{uploaded_file.file_id}"
+            stories_key = f"generated_stories_{uploaded_file.file_id}"
+            if story_key not in st.session_state and stories_key not in st.session_state:
+                try:
+                    document_text = extract_document_text(uploaded_file)
+                except UnicodeDecodeError:
+                    document_text = None
+                    st.error("File uploaded successfully, but it couldn't be decoded. Please ensure it is a valid text or PDF file.")
+               
+                if document_text is not None and needs_chunking(document_text):
+                    # Large documents: extract requirements per chunk in parallel, then cluster into stories
+                    pipeline_progress = st.progress(0.0, text="Splitting document...")
+                    try:
+                        for event in iter_user_stories_from_document(document_text):
+                            if event["stage"] == "done":
+                                st.session_state[stories_key] = event["stories"]
+                                if event.get("warning"):
+                                    st.warning(event["warning"])
+                            elif event["total"]:
+                                pipeline_progress.progress(
+                                    event["done"] / event["total"],
+                                    text=f"{PIPELINE_STAGE_LABELS[event['stage']]} ({event['done']} of {event['total']})..."
+                                )
+                    except DocumentPipelineError as e:
+                        st.error(f"Failed to generate user stories: {str(e)}")
+                    pipeline_progress.empty()
+                elif document_text is not None:
+                    uploaded_file.seek(0)
+                    user_story, complete = render_stream(handle_file_upload(uploaded_file, stream=True), "markdown")
+                    if user_story and complete:
+                        st.session_state[story_key] = user_story
+                    else:
+                        # Never offer partial or failed output for upload
+                        st.session_state.pop(story_key, None)
+                        st.error("User story generation did not complete")
+            elif story_key in st.session_state:
+                st.code(st.session_state[story_key], language="markdown")
+           
+            user_story = st.session_state.get(story_key)
             if user_story:
                 st.success("User Story Generated Successfully!")
-                st.code(user_story, language="markdown")
                
                 if st.button("Upload to Rally"):
-                    rally_response = upload_user_story_to_rally(user_story, selected_project)
+                    try:
+                        rally_response = upload_user_story_to_rally(user_story, selected_project)
+                    except RallyAPIError as e:
+                        st.error(f"Rally rejected the upload: {str(e)}")
+                        rally_response = None
                     if rally_response:
                         st.success(rally_response)
                     else:
                         st.error("Failed to upload user story to Rally")
+           
+            generated_stories = st.session_state.get(stories_key)
+            if generated_stories:
+                st.success(f"Generated {len(generated_stories)} User Stories")
+                for number, story in enumerate(generated_stories, start=1):
+                    with st.expander(f"{number}. {story_name_from_text(story)}"):
+                        st.code(story, language="markdown")
+               
+                if st.button(f"Upload {len(generated_stories)} Stories to Rally", key="upload_generated_stories"):
+                    upload_stories_with_progress(
+                        [{"name": story_name_from_text(story), "description": story} for story in generated_stories],
+                        selected_project
+                    )
+       
+        st.subheader("Import Story Backlog")
+        backlog_file = st.file_uploader(
+            "Upload Story Backlog (CSV with Name and Description columns)", type=["csv"], key="backlog_upload"
+        )
+       
+        if backlog_file:
+            backlog = pd.read_csv(backlog_file).rename(columns=str.lower)
+            if "name" not in backlog.columns:
+                st.error("The backlog file needs a Name column")
+            else:
+                if "description" not in backlog.columns:
+                    backlog["description"] = ""
+                backlog = backlog[backlog["name"].notna()].fillna("")
+                stories = [
+                    {"name": str(row["name"]).strip(), "description": str(row["description"])}
+                    for _, row in backlog.iterrows()
+                ]
+                st.write(f"{len(stories)} stories ready to import")
+               
+                if stories and st.button(f"Upload {len(stories)} Stories to Rally", key="upload_backlog"):
+                    upload_stories_with_progress(stories, selected_project)
  
 elif task_agents_enabled and selected_task == "👨‍💻 Developer Agent":
     st.title("👨‍💻 Developer Agent")
@@ -378,25 +805,30 @@ elif task_agents_enabled and selected_task == "👨‍💻 Developer Agent":
         st.subheader("Generate Code from User Stories")
        
         # Fetch and display user stories
-        user_stories = get_rally_user_stories(selected_workspace, selected_project)
+        user_stories, selected_story = show_user_story_picker(selected_workspace, selected_project, "developer")
         if user_stories:
-            story_options = {story["display_name"]: story for story in user_stories}
-            selected_story_name = st.selectbox("Select User Story", list(story_options.keys()))
-           
-            if selected_story_name:
-                selected_story = story_options[selected_story_name]
-                st.text_area("Story Description", selected_story["description"], height=150)
+            if selected_story:
+                try:
+                    story_description = get_user_story_description(selected_story["object_id"])
+                except RallyAPIError as e:
+                    st.error(f"Could not load the story description: {str(e)}")
+                    story_description = ""
+                st.text_area("Story Description", story_description, height=150)
                
                 language = st.selectbox("Select Programming Language", ["Python", "Java", "JavaScript", "C#"])
                 prompt = st.text_area("Additional Requirements (Optional)")
                
                 if st.button("Generate Code"):
-                    generated_code = generate_code(selected_story["description"], language, prompt, config.get("openai_api_key"))
-                    if generated_code:
+                    generated_code, complete = render_stream(
+                        generate_code(story_description, language, prompt, stream=True),
+                        language.lower()
+                    )
+                    if generated_code and complete:
                         st.success("Code Generated Successfully!")
-                        st.code(generated_code, language=language.lower())
+                    else:
+                        st.error("Code generation did not complete")
         else:
-            st.info("No user stories found in the selected project")
+            st.info("No user stories match the current filters")
  
 elif task_agents_enabled and selected_task == "🧪 Test Manager Agent":
     st.title("🧪 Test Manager Agent")
@@ -404,42 +836,63 @@ elif task_agents_enabled and selected_task == "🧪 Test Manager Agent":
    
     if selected_workspace and selected_project:
         st.subheader("Generate Test Cases from User Stories")
+        generation_mode = st.radio("Mode", ["Single Story", "Batch"], horizontal=True, key="test_manager_mode")
        
-        # Fetch and display user stories
-        user_stories = get_rally_user_stories(selected_workspace, selected_project)
-        if user_stories:
-            story_options = {story["display_name"]: story for story in user_stories}
-            selected_story_name = st.selectbox("Select User Story", list(story_options.keys()))
-           
-            if selected_story_name:
-                selected_story = story_options[selected_story_name]
-                st.text_area("Story Description", selected_story["description"], height=150)
+        if generation_mode == "Batch":
+            show_batch_test_case_generation(selected_workspace, selected_project)
+        else:
+            # Fetch and display user stories
+            user_stories, selected_story = show_user_story_picker(selected_workspace, selected_project, "test_manager")
+            if user_stories:
+                if selected_story:
+                    try:
+                        story_description = get_user_story_description(selected_story["object_id"])
+                    except RallyAPIError as e:
+                        st.error(f"Could not load the story description: {str(e)}")
+                        story_description = ""
+                    st.text_area("Story Description", story_description, height=150)
                
-                prompt = st.text_area("Additional Test Requirements (Optional)")
+                    prompt = st.text_area("Additional Test Requirements (Optional)")
                
-                if st.button("Generate Test Cases"):
-                    test_cases = generate_test_cases(selected_story["description"], prompt, config.get("openai_api_key"))
-                    if test_cases:
-                        st.success("Test Cases Generated Successfully!")
-                        st.code(test_cases, language="gherkin")
-        else:
-            st.info("No user stories found in the selected project")
+                    if st.button("Generate Test Cases"):
+                        test_cases, complete = render_stream(
+                            generate_test_cases(story_description, prompt, config.get("openai_api_key"), stream=True),
+                            "gherkin"
+                        )
+                        if test_cases and complete:
+                            st.success("Test Cases Generated Successfully!")
+                        else:
+                            st.error("Test case generation did not complete")
+            else:
+                st.info("No user stories match the current filters")
  
 elif ops_agents_enabled and selected_ops == "🔍 Failure Analysis":
     st.title("🔍 Failure Analysis")
     selected_workspace, selected_project = show_workspace_project_selector()
    
     if selected_workspace and selected_project:
-        st.subheader("Select User Story")
-        user_stories = get_rally_user_stories(selected_workspace, selected_project)
+        analysis_scope = st.radio(
+            "Analysis Scope", ["Single Story", "Whole Project"], horizontal=True, key="failure_analysis_scope"
+        )
+        whole_project = analysis_scope == "Whole Project"
+        if whole_project:
+            user_stories = selected_story = None
+        else:
+            st.subheader("Select User Story")
+            user_stories, selected_story = show_user_story_picker(selected_workspace, selected_project, "failure_analysis")
        
-        if user_stories:
-            story_options = {story["display_name"]: story for story in user_stories}
-            selected_story_name = st.selectbox("Select User Story", list(story_options.keys()))
-           
-            if selected_story_name:
-                selected_story = story_options[selected_story_name]
-                test_data = get_user_story_test_data(selected_workspace, selected_project, selected_story["id"])
+        if user_stories or whole_project:
+            if selected_story or whole_project:
+                trend_window, trend_granularity = show_trend_selectors()
+               
+                if whole_project:
+                    test_data, history, top_failing = load_project_failure_analysis(
+                        selected_workspace, selected_project, trend_window, trend_granularity
+                    )
+                else:
+                    test_data, history, top_failing = load_story_failure_analysis(
+                        selected_workspace, selected_project, selected_story, trend_window, trend_granularity
+                    )
                
                 if test_data and "test_cases" in test_data:
                     # Display test metrics in columns
@@ -715,7 +1168,7 @@ elif ops_agents_enabled and selected_ops == "🔍 Failure Analysis":
                     # Update the Heatmap with modern design
                     st.markdown("<br>", unsafe_allow_html=True)
                     if test_data and "failure_trend" in test_data:
-                        failure_trend = test_data["failure_trend"]
+                        failure_trend = history["trend"] if history else test_data["failure_trend"]
                         if failure_trend:
                             trend_data = []
                             for date, data in failure_trend.items():
@@ -785,10 +1238,10 @@ elif ops_agents_enabled and selected_ops == "🔍 Failure Analysis":
                                 st.plotly_chart(fig_heatmap, use_container_width=True)
  
                     # Add modernized Failure Trend Heatmap
-                    st.subheader("🔥 Test Case Failure Trend (Last 10 Days)")
+                    st.subheader(f"🔥 Test Case Failure Trend ({trend_window}, by {trend_granularity})")
  
                     if test_data and "failure_trend" in test_data:
-                        failure_trend = test_data["failure_trend"]
+                        failure_trend = history["trend"] if history else test_data["failure_trend"]
                         if failure_trend:
                             trend_data = []
                             for date, data in failure_trend.items():
@@ -847,7 +1300,7 @@ elif ops_agents_enabled and selected_ops == "🔍 Failure Analysis":
                                 st.plotly_chart(fig_heatmap, use_container_width=True)
                                
                                 # Add improved daily trend chart
-                                st.subheader("📈 Daily Test Case Failure Trends")
+                                st.subheader("📈 Test Case Failure Trends")
                                
                                 fig_line = go.Figure()
                                
@@ -895,14 +1348,11 @@ elif ops_agents_enabled and selected_ops == "🔍 Failure Analysis":
                                 # Add Top 5 Failures Analysis
                                 st.subheader("🎯 Top Failing Test Cases")
  
-                                # Create a DataFrame of all failed tests
-                                failed_tests = [tc for tc in test_data["test_cases"] if tc["verdict"] == "Fail"]
+                                # Failed runs per test case, from the story's or the project's run history
+                                failed_tests = top_failing
                                 if failed_tests:
-                                    df_failed = pd.DataFrame(failed_tests)
-                                   
-                                    # Count failures by test case
-                                    failure_counts = df_failed.groupby(['test_case_id', 'test_case_name']).size().reset_index(name='failures')
-                                    failure_counts = failure_counts.sort_values('failures', ascending=False)
+                                    failure_counts = pd.DataFrame(failed_tests)
+                                    failure_counts = failure_counts.sort_values(['failures', 'flakiness'], ascending=False)
                                    
                                     # Get top 5 failing tests
                                     top_5_failures = failure_counts.head(5)
@@ -989,16 +1439,30 @@ elif ops_agents_enabled and selected_ops == "🔍 Failure Analysis":
                                                 <div class="failure-label">Test Name</div>
                                                 <div class="failure-metric" style="font-size: 1.2em">{}</div>
                                                 <div class="failure-label">Failure Count</div>
-                                                <div class="failure-metric">{}</div>
+                                                <div class="failure-metric">{} of {} runs</div>
+                                                <div class="failure-label">Flakiness</div>
+                                                <div class="failure-metric">{:.0f}%</div>
                                             </div>
                                         """.format(
                                             most_common['test_case_id'],
                                             most_common['test_case_name'][:40] + '...' if len(most_common['test_case_name']) > 40 else most_common['test_case_name'],
-                                            most_common['failures']
+                                            most_common['failures'],
+                                            most_common['runs'],
+                                            most_common['flakiness']
                                         ), unsafe_allow_html=True)
+                                   
+                                    # Flaky tests flip between Pass and Fail across consecutive runs
+                                    flaky_tests = failure_counts[failure_counts['flakiness'] > 0]
+                                    if not flaky_tests.empty:
+                                        st.subheader("🎲 Flaky Test Cases")
+                                        df_flaky = flaky_tests.sort_values('flakiness', ascending=False)[
+                                            ['test_case_id', 'test_case_name', 'runs', 'failures', 'flakiness', 'last_verdict']
+                                        ]
+                                        df_flaky.columns = ['Test Case ID', 'Test Case Name', 'Runs', 'Failures', 'Flakiness (%)', 'Last Verdict']
+                                        st.dataframe(df_flaky.round(1), hide_index=True, use_container_width=True)
  
                                 else:
-                                    st.info("No failed tests found for this user story")
+                                    st.info("No failed test runs found")
                             else:
                                 st.info("No trend data available for the selected time period")
                         else:
@@ -1012,18 +1476,34 @@ elif ops_agents_enabled and selected_ops == "🔍 Failure Analysis":
                     if st.button("Analyze Failure"):
                         st.info("Failure Analysis functionality coming soon!")
         else:
-            st.info("No user stories found in the selected project")
+            st.info("No user stories match the current filters")
  
 elif ops_agents_enabled and selected_ops == "🎯 Root Cause Analysis":
     st.title("🎯 Root Cause Analysis")
     selected_workspace, selected_project = show_workspace_project_selector()
    
     if selected_workspace and selected_project:
-        rca_data = get_project_rca_data(selected_workspace, selected_project)
+        # Stream defect pages so a live overview shows while the rest are loading
+        rca_data = None
+        rca_progress = st.empty()
+        rca_preview = st.empty()
+        try:
+            for rca_data, loaded, total in iter_project_rca_data(selected_workspace, selected_project):
+                if loaded < total:
+                    rca_progress.progress(loaded / total, text=f"Loaded {loaded} of {total} defects...")
+                    with rca_preview.container():
+                        st.metric("Defects Loaded", loaded)
+                        if rca_data["rca_summary"]:
+                            st.bar_chart(pd.Series(rca_data["rca_summary"], name="Defects"))
+        except Exception as e:
+            st.error(f"Error fetching RCA data: {str(e)}")
+            rca_data = None
+        rca_progress.empty()
+        rca_preview.empty()
        
-        if rca_data and rca_data["defects"]:
+        if rca_data and rca_data["total_defects"]:
             # Summary metrics
-            total_defects = len(rca_data["defects"])
+            total_defects = rca_data["total_defects"]
             st.subheader("Root Cause Analysis Overview")
            
             # Display summary metrics with custom container
@@ -1133,6 +1613,8 @@ elif ops_agents_enabled and selected_ops == "🎯 Root Cause Analysis":
            
             # Detailed RCA Table
             st.subheader("Detailed Root Cause Analysis")
+            if len(rca_data["defects"]) < total_defects:
+                st.caption(f"Showing the {len(rca_data['defects'])} most recent of {total_defects} defects")
             df_defects = pd.DataFrame(rca_data["defects"])
             st.dataframe(
                 df_defects.style.apply(lambda x: [
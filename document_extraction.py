@@ -0,0 +1,194 @@
+import hashlib
+import multiprocessing
+import os
+import threading
+import zipfile
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+from typing import List, Optional, Tuple
+from xml.etree import ElementTree
+import PyPDF2
+
+PDF_TYPE = "application/pdf"
+DOCX_TYPE = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+
+# PDFs with at least this many pages are extracted by a process pool
+PARALLEL_PAGE_THRESHOLD = 24
+DEFAULT_EXTRACTION_WORKERS = min(os.cpu_count() or 1, 4)
+
+DEFAULT_EXTRACTION_CACHE_DIR = os.path.join(".cache", "extracted_text")
+MEMORY_CACHE_ENTRIES = 16
+HASH_BLOCK_SIZE = 1024 * 1024
+
+WORD_NAMESPACE = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+
+_memory_cache: "OrderedDict[str, str]" = OrderedDict()
+_memory_cache_lock = threading.Lock()
+
+
+def file_digest(file) -> str:
+    """SHA-256 of a file-like object, read in blocks; the position is restored afterwards"""
+    position = file.tell()
+    file.seek(0)
+    digest = hashlib.sha256()
+    for block in iter(lambda: file.read(HASH_BLOCK_SIZE), b""):
+        digest.update(block)
+    file.seek(position)
+    return digest.hexdigest()
+
+
+def _extract_pdf_pages(data: bytes, start: int, stop: int) -> List[str]:
+    """Extract pages ``start:stop`` of a PDF, parsing each page once (runs in worker processes)"""
+    reader = PyPDF2.PdfReader(BytesIO(data))
+    texts = []
+    for index in range(start, stop):
+        text = reader.pages[index].extract_text()
+        if text:
+            texts.append(text)
+    return texts
+
+
+def _page_ranges(page_count: int, parts: int) -> List[Tuple[int, int]]:
+    size = -(-page_count // parts)
+    return [(start, min(start + size, page_count)) for start in range(0, page_count, size)]
+
+
+def extract_pdf_text(file, max_workers: int = DEFAULT_EXTRACTION_WORKERS) -> str:
+    """
+    Extract the text of a PDF, one page at a time.
+
+    Large PDFs are split into contiguous page ranges extracted by a process
+    pool (at most one worker per CPU); page order is preserved. Workers
+    are spawned rather than forked, since forking the multithreaded app
+    server can deadlock. If the pool cannot be used the pages are
+    extracted in this process instead.
+    """
+    file.seek(0)
+    reader = PyPDF2.PdfReader(file)
+    page_count = len(reader.pages)
+
+    workers = min(max_workers, os.cpu_count() or 1)
+    if page_count >= PARALLEL_PAGE_THRESHOLD and workers > 1:
+        file.seek(0)
+        data = file.read()
+        ranges = _page_ranges(page_count, workers)
+        try:
+            with ProcessPoolExecutor(max_workers=len(ranges), mp_context=multiprocessing.get_context("spawn")) as executor:
+                futures = [executor.submit(_extract_pdf_pages, data, start, stop) for start, stop in ranges]
+                return "\n".join(text for future in futures for text in future.result())
+        except (OSError, RuntimeError) as e:
+            print(f"Parallel PDF extraction unavailable, extracting serially: {str(e)}")
+
+    texts = []
+    for page in reader.pages:
+        text = page.extract_text()
+        if text:
+            texts.append(text)
+    return "\n".join(texts)
+
+
+def extract_docx_text(file) -> str:
+    """
+    Extract paragraph text from a .docx file (WordprocessingML in a zip).
+
+    Tabs and line breaks inside a paragraph are kept; table cells come out
+    as their own paragraphs, in document order.
+    """
+    file.seek(0)
+    with zipfile.ZipFile(file) as archive:
+        with archive.open("word/document.xml") as document:
+            paragraphs = []
+            parts: List[str] = []
+            for event, element in ElementTree.iterparse(document, events=("end",)):
+                tag = element.tag
+                if tag == WORD_NAMESPACE + "t":
+                    parts.append(element.text or "")
+                elif tag == WORD_NAMESPACE + "tab":
+                    parts.append("\t")
+                elif tag in (WORD_NAMESPACE + "br", WORD_NAMESPACE + "cr"):
+                    parts.append("\n")
+                elif tag == WORD_NAMESPACE + "p":
+                    paragraphs.append("".join(parts))
+                    parts = []
+                    element.clear()
+    return "\n".join(paragraphs)
+
+
+def _cache_get(digest: str, cache_dir: Optional[str]) -> Optional[str]:
+    with _memory_cache_lock:
+        text = _memory_cache.get(digest)
+        if text is not None:
+            _memory_cache.move_to_end(digest)
+            return text
+    if cache_dir:
+        path = os.path.join(cache_dir, f"{digest}.txt")
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                text = f.read()
+            _cache_remember(digest, text)
+            return text
+    return None
+
+
+def _cache_remember(digest: str, text: str) -> None:
+    with _memory_cache_lock:
+        _memory_cache[digest] = text
+        _memory_cache.move_to_end(digest)
+        while len(_memory_cache) > MEMORY_CACHE_ENTRIES:
+            _memory_cache.popitem(last=False)
+
+
+def _cache_set(digest: str, text: str, cache_dir: Optional[str]) -> None:
+    _cache_remember(digest, text)
+    if cache_dir:
+        os.makedirs(cache_dir, exist_ok=True)
+        path = os.path.join(cache_dir, f"{digest}.txt")
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(temp_path, path)
+
+
+def document_kind(file) -> str:
+    """"pdf", "docx" or "text" for an uploaded file, by MIME type or extension"""
+    file_type = getattr(file, "type", "") or ""
+    name = (getattr(file, "name", "") or "").lower()
+    if file_type == PDF_TYPE or name.endswith(".pdf"):
+        return "pdf"
+    if file_type == DOCX_TYPE or name.endswith(".docx"):
+        return "docx"
+    return "text"
+
+
+def extract_text(
+    file,
+    cache_dir: Optional[str] = DEFAULT_EXTRACTION_CACHE_DIR,
+    max_workers: int = DEFAULT_EXTRACTION_WORKERS
+) -> str:
+    """
+    Return the text of an uploaded PDF, .docx or UTF-8 text file.
+
+    Results are cached by the SHA-256 of the file content, in memory and
+    (unless ``cache_dir`` is falsy) as text files on disk, so re-uploading
+    or re-running on the same document skips extraction.
+
+    Raises:
+        UnicodeDecodeError: if a text upload is not valid UTF-8
+    """
+    digest = file_digest(file)
+    text = _cache_get(digest, cache_dir)
+    if text is not None:
+        return text
+
+    kind = document_kind(file)
+    if kind == "pdf":
+        text = extract_pdf_text(file, max_workers)
+    elif kind == "docx":
+        text = extract_docx_text(file)
+    else:
+        file.seek(0)
+        text = file.read().decode("utf-8")
+
+    _cache_set(digest, text, cache_dir)
+    return text
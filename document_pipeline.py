@@ -0,0 +1,233 @@
+import re
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Callable, Dict, Iterator, List, Optional
+from llm_client import CHARS_PER_TOKEN, count_tokens
+
+# Token bounds sized for an 8k-context model: chunk + prompt + extracted
+# output must fit in one call, and so must each reduce step's input.
+DEFAULT_CHUNK_TOKENS = 2500
+DEFAULT_CHUNK_OVERLAP_TOKENS = 150
+DEFAULT_REDUCE_INPUT_TOKENS = 4000
+DEFAULT_MAP_WORKERS = 4
+# Combine levels before the remaining notes are reduced in several parts
+MAX_REDUCE_LEVELS = 4
+
+STORY_SEPARATOR = "---"
+
+MAP_PROMPT = (
+    "You are analysing part {index} of {total} of a requirements document.\n"
+    "List every distinct functional or non-functional requirement in this excerpt as short "
+    "bullet points. Keep names of actors, systems and business rules. Do not invent requirements. "
+    "If the excerpt contains no requirements, answer with \"NONE\".\n\n"
+    "Excerpt:\n{text}"
+)
+
+COMBINE_PROMPT = (
+    "Merge these requirement notes, extracted from consecutive parts of one document, into a single "
+    "de-duplicated bullet list. Keep every distinct requirement and group related ones together.\n\n"
+    "{text}"
+)
+
+REDUCE_PROMPT = (
+    "Below are the requirements extracted from a requirements document.\n"
+    "Group them into clusters of closely related requirements and write exactly one user story per "
+    "cluster. Each user story starts with a one-line title, followed by \"As a ..., I want ..., so that "
+    "...\" and a list of acceptance criteria.\n"
+    "Separate user stories with a line containing only \"" + STORY_SEPARATOR + "\".\n\n"
+    "Requirements:\n{text}"
+)
+
+
+class DocumentPipelineError(Exception):
+    """Raised by a ``complete`` callable when a model call fails"""
+
+
+def _split_oversized(block: str, max_tokens: int) -> List[str]:
+    """Split a block that alone exceeds ``max_tokens`` at sentence, then word boundaries"""
+    pieces = re.split(r'(?<=[.!?])\s+', block)
+    if len(pieces) == 1:
+        pieces = block.split()
+    parts, current = [], ""
+    for piece in pieces:
+        candidate = f"{current} {piece}".strip()
+        if current and count_tokens(candidate) > max_tokens:
+            parts.append(current)
+            current = piece
+        else:
+            current = candidate
+        # A single word longer than the budget is cut by characters
+        while count_tokens(current) > max_tokens:
+            cut = max_tokens * CHARS_PER_TOKEN
+            parts.append(current[:cut])
+            current = current[cut:]
+    if current:
+        parts.append(current)
+    return parts
+
+
+def split_into_chunks(
+    text: str,
+    max_tokens: int = DEFAULT_CHUNK_TOKENS,
+    overlap_tokens: int = DEFAULT_CHUNK_OVERLAP_TOKENS
+) -> List[str]:
+    """
+    Split text into chunks of at most ``max_tokens`` tokens.
+
+    Paragraphs are kept whole where possible; each chunk after the first
+    starts with the trailing paragraph(s) of the previous one (up to
+    ``overlap_tokens``) so requirements spanning a boundary are not lost.
+    """
+    paragraphs = []
+    for block in re.split(r'\n\s*\n', text):
+        block = block.strip()
+        if not block:
+            continue
+        if count_tokens(block) > max_tokens:
+            paragraphs.extend(_split_oversized(block, max_tokens))
+        else:
+            paragraphs.append(block)
+
+    chunks: List[str] = []
+    current: List[str] = []
+    current_tokens = 0
+    for paragraph in paragraphs:
+        tokens = count_tokens(paragraph)
+        if current and current_tokens + tokens > max_tokens:
+            chunks.append("\n\n".join(current))
+            overlap, overlap_size = [], 0
+            for previous in reversed(current):
+                size = count_tokens(previous)
+                if overlap_size + size > overlap_tokens or overlap_size + size + tokens > max_tokens:
+                    break
+                overlap.insert(0, previous)
+                overlap_size += size
+            current, current_tokens = overlap, overlap_size
+        current.append(paragraph)
+        current_tokens += tokens
+    if current:
+        chunks.append("\n\n".join(current))
+    return chunks
+
+
+def split_user_stories(text: str) -> List[str]:
+    """Split a reduce output into individual user stories"""
+    stories = re.split(rf'^\s*{re.escape(STORY_SEPARATOR)}+\s*$', text, flags=re.MULTILINE)
+    return [story.strip() for story in stories if story.strip()]
+
+
+def _is_empty_extraction(notes: str) -> bool:
+    return not notes.strip() or notes.strip().upper().startswith("NONE")
+
+
+def _batch_by_tokens(notes: List[str], max_tokens: int) -> List[List[str]]:
+    batches, current, size = [], [], 0
+    for note in notes:
+        tokens = count_tokens(note)
+        if current and size + tokens > max_tokens:
+            batches.append(current)
+            current, size = [], 0
+        current.append(note)
+        size += tokens
+    if current:
+        batches.append(current)
+    return batches
+
+
+def _run_parallel(
+    complete: Callable[[str], str],
+    prompts: List[str],
+    max_workers: int,
+    stage: str
+) -> Iterator[Dict[str, Any]]:
+    """Run prompts concurrently; yields progress events and finally one with ``results`` in input order"""
+    results: List[Optional[str]] = [None] * len(prompts)
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(prompts)))) as executor:
+        futures = {executor.submit(complete, prompt): index for index, prompt in enumerate(prompts)}
+        try:
+            for done, future in enumerate(as_completed(futures), start=1):
+                results[futures[future]] = future.result()
+                yield {"stage": stage, "done": done, "total": len(prompts)}
+        finally:
+            # On failure (or an abandoned generator) don't start the remaining calls
+            for future in futures:
+                future.cancel()
+    yield {"stage": stage, "done": len(prompts), "total": len(prompts), "results": results}
+
+
+def iter_document_to_user_stories(
+    text: str,
+    complete: Callable[[str], str],
+    chunk_tokens: int = DEFAULT_CHUNK_TOKENS,
+    reduce_input_tokens: int = DEFAULT_REDUCE_INPUT_TOKENS,
+    max_workers: int = DEFAULT_MAP_WORKERS
+) -> Iterator[Dict[str, Any]]:
+    """
+    Turn a large requirements document into user stories with map-reduce.
+
+    Map: the text is split into token-bounded chunks and the requirements
+    of each chunk are extracted concurrently. Reduce: the extracted notes
+    are merged in token-bounded batches until they fit in one prompt, which
+    groups them into clusters and writes one user story per cluster. If
+    the notes still don't fit after ``MAX_REDUCE_LEVELS`` combine levels,
+    they are reduced in token-bounded parts so no requirement is dropped,
+    and the final event carries a ``warning``.
+
+    ``complete`` sends one prompt to the model and returns its text, raising
+    (e.g. ``DocumentPipelineError``) when the call fails; the first failure
+    cancels the calls not yet started and propagates. Yields progress
+    events ``{"stage", "done", "total"}`` with stage "map", "combine" or
+    "reduce"; the last event has stage "done" and the list of ``stories``.
+    """
+    chunks = split_into_chunks(text, chunk_tokens)
+    if not chunks:
+        yield {"stage": "done", "done": 0, "total": 0, "stories": []}
+        return
+
+    prompts = [MAP_PROMPT.format(index=i + 1, total=len(chunks), text=chunk) for i, chunk in enumerate(chunks)]
+    for event in _run_parallel(complete, prompts, max_workers, "map"):
+        if "results" in event:
+            notes = [n.strip() for n in event["results"] if n and not _is_empty_extraction(n)]
+        else:
+            yield event
+
+    # Merge notes level by level until they fit in a single reduce prompt
+    level = 0
+    warning = None
+    while len(notes) > 1 and count_tokens("\n\n".join(notes)) > reduce_input_tokens:
+        level += 1
+        if level > MAX_REDUCE_LEVELS:
+            notes = split_into_chunks("\n\n".join(notes), reduce_input_tokens, 0)
+            warning = (
+                f"Requirements still exceeded one prompt after {MAX_REDUCE_LEVELS} merge levels; "
+                f"stories were written from {len(notes)} parts and may overlap"
+            )
+            print(f"Warning: {warning}")
+            break
+        batches = _batch_by_tokens(notes, reduce_input_tokens)
+        if len(batches) == len(notes):
+            # Every note fills a batch on its own; merge them pairwise instead
+            batches = [notes[i:i + 2] for i in range(0, len(notes), 2)]
+        prompts = [COMBINE_PROMPT.format(text="\n\n".join(batch)) for batch in batches]
+        for event in _run_parallel(complete, prompts, max_workers, "combine"):
+            if "results" in event:
+                notes = [n.strip() for n in event["results"] if n and n.strip()]
+            else:
+                yield event
+
+    if not notes:
+        yield {"stage": "done", "done": 0, "total": 0, "stories": []}
+        return
+
+    # One reduce prompt, or one per part when the notes never fit in one
+    reduce_inputs = notes if warning else ["\n\n".join(notes)]
+    prompts = [REDUCE_PROMPT.format(text=text) for text in reduce_inputs]
+    yield {"stage": "reduce", "done": 0, "total": len(prompts)}
+    for event in _run_parallel(complete, prompts, max_workers, "reduce"):
+        if "results" in event:
+            stories = [story for output in event["results"] for story in split_user_stories(output)]
+        else:
+            yield event
+    done = {"stage": "done", "done": len(stories), "total": len(stories), "stories": stories}
+    if warning:
+        done["warning"] = warning
+    yield done
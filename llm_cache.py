@@ -0,0 +1,123 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional
+from sqlite_store import SQLiteStore
+
+DEFAULT_LLM_CACHE_PATH = os.path.join(".cache", "llm_responses.sqlite")
+DEFAULT_LLM_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+
+def completion_cache_key(
+    model: str,
+    messages: List[Dict[str, Any]],
+    params: Optional[Dict[str, Any]] = None,
+    backend: Optional[Dict[str, Any]] = None
+) -> str:
+    """
+    Content address of a chat completion request: hash of model, messages and parameters.
+
+    ``backend`` identifies where the request is served (provider, endpoint,
+    API version), so answers from one provider never satisfy another.
+    """
+    payload = json.dumps(
+        {"model": model, "messages": messages, "params": params or {}, "backend": backend or {}},
+        sort_keys=True,
+        ensure_ascii=False
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class LLMResponseCache(SQLiteStore):
+    """
+    On-disk cache of completion texts keyed by ``completion_cache_key``.
+
+    Stored in SQLite (WAL mode, one connection per thread) so reruns and
+    other app processes on the same machine share it. When the stored text
+    exceeds ``max_bytes`` the least recently used rows are evicted. ``hits``
+    and ``misses`` count lookups made by this process.
+    """
+
+    def __init__(self, path: str = DEFAULT_LLM_CACHE_PATH, max_bytes: int = DEFAULT_LLM_CACHE_MAX_BYTES):
+        super().__init__(path)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._stats_lock = threading.Lock()
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS llm_cache (
+                    cache_key TEXT PRIMARY KEY,
+                    model TEXT NOT NULL,
+                    response TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_used REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_last_used ON llm_cache (last_used)")
+
+    def get(self, key: str) -> Optional[str]:
+        conn = self._connect()
+        row = conn.execute("SELECT response FROM llm_cache WHERE cache_key = ?", (key,)).fetchone()
+        with self._stats_lock:
+            if row is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        if row is None:
+            return None
+        conn.execute("UPDATE llm_cache SET last_used = ? WHERE cache_key = ?", (time.time(), key))
+        return row[0]
+
+    def set(self, key: str, model: str, response: str) -> None:
+        size = len(response.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        now = time.time()
+        conn = self._connect()
+        conn.execute(
+            "INSERT OR REPLACE INTO llm_cache (cache_key, model, response, size, created_at, last_used) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (key, model, response, size, now, now)
+        )
+        self._evict(conn)
+
+    def _evict(self, conn: sqlite3.Connection) -> None:
+        """Drop least recently used rows until the stored text fits in ``max_bytes``"""
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM llm_cache").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        excess = total - self.max_bytes
+        freed = 0
+        stale = []
+        for key, size in conn.execute("SELECT cache_key, size FROM llm_cache ORDER BY last_used ASC"):
+            stale.append((key,))
+            freed += size
+            if freed >= excess:
+                break
+        conn.executemany("DELETE FROM llm_cache WHERE cache_key = ?", stale)
+
+    def clear(self) -> None:
+        self._connect().execute("DELETE FROM llm_cache")
+        with self._stats_lock:
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counts and hit rate for this process, plus the size of the store"""
+        entries, size = self._connect().execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM llm_cache"
+        ).fetchone()
+        with self._stats_lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": entries,
+                "bytes": size
+            }
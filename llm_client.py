@@ -0,0 +1,388 @@
+import asyncio
+import queue
+import threading
+import time
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Tuple
+import openai
+
+try:
+    import tiktoken
+except ImportError:  # optional: fall back to a character-based estimate
+    tiktoken = None
+
+CHARS_PER_TOKEN = 4
+
+# Default OpenAI tokens-per-minute allowance for batch generations, and the
+# completion size assumed when reserving budget before a call
+DEFAULT_TOKENS_PER_MINUTE = 40000
+DEFAULT_COMPLETION_TOKENS = 1500
+
+# Concurrent requests per model across all sessions of the process
+DEFAULT_MAX_CONCURRENCY = 8
+
+_encoding = None
+
+
+def count_tokens(text: str) -> int:
+    """Token count with tiktoken when installed, otherwise ~4 characters per token"""
+    global _encoding
+    if tiktoken is None:
+        return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+    if _encoding is None:
+        _encoding = tiktoken.get_encoding("cl100k_base")
+    return len(_encoding.encode(text))
+
+
+class TokenBudget:
+    """
+    Thread-safe tokens-per-minute budget shared by concurrent model calls.
+
+    Works like a token bucket holding one minute of allowance that refills
+    continuously. ``acquire`` reserves an estimate before a call and blocks
+    until it fits; ``settle`` corrects the reservation with the tokens the
+    call actually used. A single request larger than the whole allowance
+    waits for a full bucket and then runs on its own.
+    """
+
+    def __init__(self, tokens_per_minute: float = DEFAULT_TOKENS_PER_MINUTE):
+        self.tokens_per_minute = tokens_per_minute
+        self._available = float(tokens_per_minute)
+        self._updated = time.monotonic()
+        self._condition = threading.Condition()
+        self.used = 0
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._available = min(
+            self.tokens_per_minute,
+            self._available + (now - self._updated) * self.tokens_per_minute / 60.0
+        )
+        self._updated = now
+
+    def acquire(self, tokens: int) -> float:
+        """Reserve ``tokens``; returns the seconds spent waiting for budget"""
+        needed = min(tokens, self.tokens_per_minute)
+        started = time.monotonic()
+        with self._condition:
+            while True:
+                self._refill()
+                if self._available >= needed:
+                    self._available -= tokens
+                    return time.monotonic() - started
+                self._condition.wait((needed - self._available) * 60.0 / self.tokens_per_minute)
+
+    async def acquire_async(self, tokens: int) -> float:
+        """Like ``acquire``, but waits with ``asyncio.sleep`` instead of blocking the thread"""
+        needed = min(tokens, self.tokens_per_minute)
+        started = time.monotonic()
+        while True:
+            with self._condition:
+                self._refill()
+                if self._available >= needed:
+                    self._available -= tokens
+                    return time.monotonic() - started
+                wait = (needed - self._available) * 60.0 / self.tokens_per_minute
+            await asyncio.sleep(wait)
+
+    def settle(self, reserved: int, used: int) -> None:
+        """Replace a reservation with the actual usage (refunds or charges the difference)"""
+        with self._condition:
+            self._refill()
+            self._available += reserved - used
+            self.used += used
+            self._condition.notify_all()
+
+
+def _messages_tokens(messages: List[Dict[str, Any]]) -> int:
+    return sum(count_tokens(str(message.get("content", ""))) for message in messages)
+
+
+class LLMClientPool:
+    """
+    Process-wide async LLM layer shared by every agent and session.
+
+    One background event loop owns pooled ``AsyncOpenAI`` /
+    ``AsyncAzureOpenAI`` clients, one per provider, API key, endpoint and
+    API version, each keeping its own keep-alive connections. Every call
+    passes a per-model semaphore (``max_concurrency``) and tokens-per-minute
+    budget (``tokens_per_minute``), optionally overridden per model in
+    ``model_limits``. Each call reserves its prompt tokens plus
+    ``max_tokens`` (or ``completion_tokens``) and is then charged the usage
+    the API reports. Because all calls run on the one loop these caps hold
+    across all Streamlit sessions. No global ``openai.api_key`` is set, so
+    sessions with different keys never interfere.
+
+    Sync code calls ``complete`` / ``stream``; coroutines on any event loop
+    await ``acomplete`` / iterate ``astream``.
+
+    ``endpoint`` arguments are dicts with ``provider`` ("openai" or
+    "azure"), ``api_key`` and, for Azure, ``azure_endpoint`` and
+    ``api_version``; an optional ``base_url`` overrides the OpenAI URL.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+        tokens_per_minute: float = DEFAULT_TOKENS_PER_MINUTE,
+        model_limits: Optional[Dict[str, Dict[str, float]]] = None,
+        completion_tokens: int = DEFAULT_COMPLETION_TOKENS
+    ):
+        self.max_concurrency = max_concurrency
+        self.tokens_per_minute = tokens_per_minute
+        self.model_limits = dict(model_limits or {})
+        self.completion_tokens = completion_tokens
+        self._clients: Dict[Tuple, Any] = {}
+        self._semaphores: Dict[Tuple[str, int], asyncio.Semaphore] = {}
+        self._budgets: Dict[Tuple[str, float], TokenBudget] = {}
+        self._in_flight: Dict[str, int] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._lock = threading.Lock()
+
+    def configure(
+        self,
+        max_concurrency: Optional[int] = None,
+        tokens_per_minute: Optional[float] = None,
+        model_limits: Optional[Dict[str, Dict[str, float]]] = None,
+        completion_tokens: Optional[int] = None
+    ) -> None:
+        """Update the limits; they apply to calls started afterwards"""
+        if completion_tokens:
+            self.completion_tokens = completion_tokens
+        if max_concurrency:
+            self.max_concurrency = max_concurrency
+        if tokens_per_minute:
+            self.tokens_per_minute = tokens_per_minute
+        if model_limits is not None:
+            self.model_limits = dict(model_limits)
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(target=self._loop.run_forever, name="llm-client-pool", daemon=True).start()
+            return self._loop
+
+    def _limits(self, model: str) -> Tuple[int, float]:
+        limits = self.model_limits.get(model, {})
+        return (
+            int(limits.get("max_concurrency", self.max_concurrency)),
+            float(limits.get("tokens_per_minute", self.tokens_per_minute))
+        )
+
+    def budget(self, model: str) -> TokenBudget:
+        """The shared tokens-per-minute budget of a model"""
+        _, tokens_per_minute = self._limits(model)
+        with self._lock:
+            budget = self._budgets.get((model, tokens_per_minute))
+            if budget is None:
+                budget = self._budgets[(model, tokens_per_minute)] = TokenBudget(tokens_per_minute)
+            return budget
+
+    def _semaphore(self, model: str) -> asyncio.Semaphore:
+        # Only touched on the pool's loop thread
+        max_concurrency, _ = self._limits(model)
+        semaphore = self._semaphores.get((model, max_concurrency))
+        if semaphore is None:
+            semaphore = self._semaphores[(model, max_concurrency)] = asyncio.Semaphore(max_concurrency)
+        return semaphore
+
+    def _client(self, endpoint: Dict[str, Any]):
+        # Only touched on the pool's loop thread: async clients are bound to it
+        provider = endpoint.get("provider", "openai")
+        key = (provider, endpoint.get("api_key"), endpoint.get("azure_endpoint") or endpoint.get("base_url"),
+               endpoint.get("api_version"))
+        client = self._clients.get(key)
+        if client is None:
+            if provider == "azure":
+                client = openai.AsyncAzureOpenAI(
+                    api_key=endpoint["api_key"],
+                    api_version=endpoint["api_version"],
+                    azure_endpoint=endpoint["azure_endpoint"]
+                )
+            else:
+                client = openai.AsyncOpenAI(api_key=endpoint["api_key"], base_url=endpoint.get("base_url"))
+            self._clients[key] = client
+        return client
+
+    def _track(self, model: str, delta: int) -> None:
+        with self._lock:
+            self._in_flight[model] = self._in_flight.get(model, 0) + delta
+
+    async def _complete(
+        self,
+        endpoint: Dict[str, Any],
+        model: str,
+        messages: List[Dict[str, Any]],
+        budget: Optional[TokenBudget],
+        params: Dict[str, Any]
+    ) -> str:
+        prompt_tokens = _messages_tokens(messages)
+        reserved = prompt_tokens + int(params.get("max_tokens") or self.completion_tokens)
+        budgets = [self.budget(model)] + ([budget] if budget is not None else [])
+        for each in budgets:
+            await each.acquire_async(reserved)
+        used = 0
+        try:
+            async with self._semaphore(model):
+                self._track(model, 1)
+                try:
+                    response = await self._client(endpoint).chat.completions.create(
+                        model=model,
+                        messages=messages,
+                        **params
+                    )
+                finally:
+                    self._track(model, -1)
+            text = response.choices[0].message.content or ""
+            used = response.usage.total_tokens if response.usage else prompt_tokens + count_tokens(text)
+            return text
+        finally:
+            for each in budgets:
+                each.settle(reserved, used)
+
+    async def _stream(
+        self,
+        endpoint: Dict[str, Any],
+        model: str,
+        messages: List[Dict[str, Any]],
+        budget: Optional[TokenBudget],
+        params: Dict[str, Any]
+    ) -> AsyncIterator[str]:
+        prompt_tokens = _messages_tokens(messages)
+        reserved = prompt_tokens + int(params.get("max_tokens") or self.completion_tokens)
+        budgets = [self.budget(model)] + ([budget] if budget is not None else [])
+        for each in budgets:
+            await each.acquire_async(reserved)
+        if endpoint.get("provider", "openai") == "openai":
+            params = dict(params, stream_options={"include_usage": True})
+        used = 0
+        completion_tokens = 0
+        try:
+            async with self._semaphore(model):
+                self._track(model, 1)
+                try:
+                    stream = await self._client(endpoint).chat.completions.create(
+                        model=model,
+                        messages=messages,
+                        stream=True,
+                        **params
+                    )
+                    async for chunk in stream:
+                        if getattr(chunk, "usage", None):
+                            used = chunk.usage.total_tokens
+                        if chunk.choices and chunk.choices[0].delta.content:
+                            completion_tokens += count_tokens(chunk.choices[0].delta.content)
+                            yield chunk.choices[0].delta.content
+                finally:
+                    self._track(model, -1)
+        finally:
+            for each in budgets:
+                each.settle(reserved, used or prompt_tokens + completion_tokens)
+
+    def complete(
+        self,
+        endpoint: Dict[str, Any],
+        model: str,
+        messages: List[Dict[str, Any]],
+        budget: Optional[TokenBudget] = None,
+        **params
+    ) -> str:
+        """Run a chat completion on the pool and return its text (blocking)"""
+        return asyncio.run_coroutine_threadsafe(
+            self._complete(endpoint, model, messages, budget, params), self.loop
+        ).result()
+
+    async def acomplete(
+        self,
+        endpoint: Dict[str, Any],
+        model: str,
+        messages: List[Dict[str, Any]],
+        budget: Optional[TokenBudget] = None,
+        **params
+    ) -> str:
+        """Awaitable ``complete`` usable from any event loop"""
+        return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(
+            self._complete(endpoint, model, messages, budget, params), self.loop
+        ))
+
+    def stream(
+        self,
+        endpoint: Dict[str, Any],
+        model: str,
+        messages: List[Dict[str, Any]],
+        budget: Optional[TokenBudget] = None,
+        **params
+    ) -> Iterator[str]:
+        """Yield completion text chunks as the pool receives them (blocking iterator)"""
+        chunks: "queue.Queue[Tuple[str, Any]]" = queue.Queue()
+
+        async def pump():
+            try:
+                async for chunk in self._stream(endpoint, model, messages, budget, params):
+                    chunks.put(("chunk", chunk))
+                chunks.put(("done", None))
+            except BaseException as e:
+                chunks.put(("error", e))
+                raise
+
+        future = asyncio.run_coroutine_threadsafe(pump(), self.loop)
+        try:
+            while True:
+                kind, value = chunks.get()
+                if kind == "done":
+                    return
+                if kind == "error":
+                    raise value
+                yield value
+        finally:
+            future.cancel()
+
+    async def astream(
+        self,
+        endpoint: Dict[str, Any],
+        model: str,
+        messages: List[Dict[str, Any]],
+        budget: Optional[TokenBudget] = None,
+        **params
+    ) -> AsyncIterator[str]:
+        """Async iterator over completion text chunks, usable from any event loop"""
+        loop = asyncio.get_running_loop()
+        chunks: "asyncio.Queue[Tuple[str, Any]]" = asyncio.Queue()
+
+        async def pump():
+            try:
+                async for chunk in self._stream(endpoint, model, messages, budget, params):
+                    loop.call_soon_threadsafe(chunks.put_nowait, ("chunk", chunk))
+                loop.call_soon_threadsafe(chunks.put_nowait, ("done", None))
+            except BaseException as e:
+                loop.call_soon_threadsafe(chunks.put_nowait, ("error", e))
+                raise
+
+        future = asyncio.run_coroutine_threadsafe(pump(), self.loop)
+        try:
+            while True:
+                kind, value = await chunks.get()
+                if kind == "done":
+                    return
+                if kind == "error":
+                    raise value
+                yield value
+        finally:
+            future.cancel()
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Per model: requests in flight and tokens charged to its budget"""
+        with self._lock:
+            models = set(self._in_flight) | {model for model, _ in self._budgets}
+            return {
+                model: {
+                    "in_flight": self._in_flight.get(model, 0),
+                    "tokens_used": sum(b.used for (m, _), b in self._budgets.items() if m == model)
+                }
+                for model in models
+            }
+
+
+# Process-wide pool shared by every agent and session
+llm_pool = LLMClientPool()
@@ -0,0 +1,136 @@
+import asyncio
+import functools
+import threading
+import weakref
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+import utils
+
+# Upper bound on Rally helpers running at once from the async API. Each
+# helper may fan out further (paged queries), which the client pool bounds.
+MAX_CONCURRENT_CALLS = 8
+
+_limits: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = weakref.WeakKeyDictionary()
+
+
+def _limit() -> asyncio.Semaphore:
+    loop = asyncio.get_running_loop()
+    semaphore = _limits.get(loop)
+    if semaphore is None:
+        semaphore = _limits[loop] = asyncio.Semaphore(MAX_CONCURRENT_CALLS)
+    return semaphore
+
+
+async def _run(func: Callable[..., Any], *args, **kwargs) -> Any:
+    """Run a blocking Rally helper on a worker thread"""
+    async with _limit():
+        return await asyncio.to_thread(functools.partial(func, *args, **kwargs))
+
+
+async def test_rally_connection(endpoint: str, api_key: str) -> Tuple[bool, str]:
+    return await _run(utils.test_rally_connection, endpoint, api_key)
+
+
+async def get_rally_workspaces() -> List[Dict[str, str]]:
+    return await _run(utils.get_rally_workspaces)
+
+
+async def get_rally_projects(workspace_id: str) -> List[Dict[str, str]]:
+    return await _run(utils.get_rally_projects, workspace_id)
+
+
+async def get_rally_user_stories(workspace_id: str, project_id: str) -> List[Dict[str, Any]]:
+    return await _run(utils.get_rally_user_stories, workspace_id, project_id)
+
+
+async def get_user_story_description(story_object_id: str) -> str:
+    return await _run(utils.get_user_story_description, story_object_id)
+
+
+async def get_user_story_test_data(
+    workspace_id: str,
+    project_id: str,
+    story_id: str,
+    trend_days: int = utils.FAILURE_TREND_DAYS,
+    granularity: str = "day"
+) -> Dict[str, Any]:
+    return await _run(utils.get_user_story_test_data, workspace_id, project_id, story_id, trend_days, granularity)
+
+
+async def get_project_test_data(
+    workspace_id: str,
+    project_id: str,
+    trend_days: int = utils.FAILURE_TREND_DAYS,
+    granularity: str = "day",
+    limit: int = 10
+) -> Dict[str, Any]:
+    return await _run(utils.get_project_test_data, workspace_id, project_id, trend_days, granularity, limit)
+
+
+async def get_user_story_test_history(
+    workspace_id: str,
+    project_id: str,
+    story_id: str,
+    trend_days: int = utils.FAILURE_TREND_DAYS,
+    granularity: str = "day"
+) -> Dict[str, Any]:
+    return await _run(utils.get_user_story_test_history, workspace_id, project_id, story_id, trend_days, granularity)
+
+
+async def get_user_story_defects(workspace_id: str, project_id: str, story_id: str) -> List[Dict[str, Any]]:
+    return await _run(utils.get_user_story_defects, workspace_id, project_id, story_id)
+
+
+async def get_project_rca_data(workspace_id: str, project_id: str) -> Dict[str, Any]:
+    return await _run(utils.get_project_rca_data, workspace_id, project_id)
+
+
+async def upload_user_story_to_rally(user_story: str, project_id: str) -> Optional[str]:
+    return await _run(utils.upload_user_story_to_rally, user_story, project_id)
+
+
+async def settle(call: Awaitable[Any]) -> Tuple[Any, Optional[Exception]]:
+    """Await an optional call without failing the calls gathered with it; returns ``(result, error)``"""
+    try:
+        return await call, None
+    except Exception as e:
+        return None, e
+
+
+async def gather_named(calls: Dict[str, Awaitable[Any]]) -> Dict[str, Any]:
+    """Await several independent Rally calls at once and return results by name"""
+    results = await asyncio.gather(*calls.values())
+    return dict(zip(calls.keys(), results))
+
+
+def run_concurrently(calls: Dict[str, Callable[[], Awaitable[Any]]]) -> Dict[str, Any]:
+    """
+    Synchronous entry point for code such as the Streamlit script.
+
+    ``calls`` maps a name to a zero-argument callable returning a coroutine
+    (e.g. ``lambda: get_rally_user_stories(ws, project)``), so nothing is
+    created before the event loop exists. Total latency is that of the
+    slowest call rather than the sum of all of them.
+    """
+    async def main() -> Dict[str, Any]:
+        return await gather_named({name: factory() for name, factory in calls.items()})
+
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(main())
+
+    # Already inside an event loop (e.g. a notebook): use a helper thread
+    outcome: Dict[str, Any] = {}
+
+    def runner() -> None:
+        try:
+            outcome["result"] = asyncio.run(main())
+        except BaseException as e:
+            outcome["error"] = e
+
+    thread = threading.Thread(target=runner, name="rally-async")
+    thread.start()
+    thread.join()
+    if "error" in outcome:
+        raise outcome["error"]
+    return outcome["result"]
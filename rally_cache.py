@@ -0,0 +1,263 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+from sqlite_store import SQLiteStore
+
+# Default time-to-live (seconds) per Rally entity type. Entities that are not
+# listed are never cached.
+DEFAULT_CACHE_TTLS: Dict[str, float] = {
+    "workspace": 3600,
+    "project": 900,
+    "hierarchicalrequirement": 300,
+    "testcase": 120,
+    # Test run history is delta-synced; this is how long a sync stays fresh
+    "testcaseresult": 120,
+    "defect": 300
+}
+DEFAULT_MAX_ENTRIES = 512
+
+# Expired rows are kept on disk this long so they can still be revalidated
+DISK_STALE_GRACE = 24 * 3600
+DISK_PURGE_EVERY = 200  # writes between purges of long-expired rows
+
+CacheKey = Tuple[str, ...]
+
+
+def make_cache_key(endpoint: str, key_fingerprint: str, path: str, params: Optional[Dict[str, Any]] = None) -> CacheKey:
+    """
+    Build a cache key from the endpoint, API key hash, workspace, project and
+    the remaining (normalised) query parameters.
+    """
+    params = dict(params or {})
+    workspace = str(params.pop("workspace", ""))
+    project = str(params.pop("project", ""))
+    normalized = json.dumps({k: str(v) for k, v in params.items()}, sort_keys=True)
+    return (endpoint, key_fingerprint, workspace, project, "/" + path.strip("/"), normalized)
+
+
+class CacheEntry:
+    """A cached JSON body plus the validators needed to revalidate it"""
+
+    __slots__ = ("value", "etag", "last_modified", "expires_at")
+
+    def __init__(self, value: Any, ttl: float, etag: Optional[str] = None, last_modified: Optional[str] = None):
+        self.value = value
+        self.etag = etag
+        self.last_modified = last_modified
+        self.expires_at = time.time() + ttl
+
+    def is_fresh(self) -> bool:
+        return time.time() < self.expires_at
+
+    def validator_headers(self) -> Dict[str, str]:
+        """Conditional request headers for revalidating a stale entry"""
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+
+class SQLiteCacheStore(SQLiteStore):
+    """
+    Disk-backed cache tier shared by every process that points at the same file.
+
+    SQLite in WAL mode allows concurrent readers alongside a writer across
+    processes; each thread uses its own connection. Rows carry an absolute
+    expiry time, so every replica applies the same TTL.
+    """
+
+    def __init__(self, path: str):
+        super().__init__(path)
+        self._writes = 0
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS rally_cache (
+                    cache_key TEXT PRIMARY KEY,
+                    path TEXT NOT NULL,
+                    project TEXT NOT NULL,
+                    value TEXT NOT NULL,
+                    etag TEXT,
+                    last_modified TEXT,
+                    expires_at REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_rally_cache_path ON rally_cache (path, project)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_rally_cache_expiry ON rally_cache (expires_at)")
+
+    def get(self, key: CacheKey) -> Optional[CacheEntry]:
+        row = self._connect().execute(
+            "SELECT value, etag, last_modified, expires_at FROM rally_cache WHERE cache_key = ?",
+            (json.dumps(key),)
+        ).fetchone()
+        if row is None:
+            return None
+        entry = CacheEntry(json.loads(row[0]), 0, etag=row[1], last_modified=row[2])
+        entry.expires_at = row[3]
+        return entry
+
+    def set(self, key: CacheKey, entry: CacheEntry) -> None:
+        conn = self._connect()
+        conn.execute(
+            "INSERT OR REPLACE INTO rally_cache "
+            "(cache_key, path, project, value, etag, last_modified, expires_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (json.dumps(key), key[4], key[3], json.dumps(entry.value), entry.etag, entry.last_modified, entry.expires_at)
+        )
+        self._writes += 1
+        if self._writes % DISK_PURGE_EVERY == 0:
+            self.purge_expired()
+
+    def invalidate(self, path: Optional[str] = None, project: Optional[str] = None) -> int:
+        clauses, args = [], []
+        if path is not None:
+            clauses.append("path = ?")
+            args.append(path)
+        if project is not None:
+            clauses.append("project = ?")
+            args.append(project)
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+        return self._connect().execute(f"DELETE FROM rally_cache{where}", args).rowcount
+
+    def purge_expired(self, grace: float = DISK_STALE_GRACE) -> int:
+        """Delete rows that expired more than ``grace`` seconds ago"""
+        return self._connect().execute(
+            "DELETE FROM rally_cache WHERE expires_at < ?", (time.time() - grace,)
+        ).rowcount
+
+
+class RallyResponseCache:
+    """
+    Thread-safe LRU cache of Rally JSON responses with per-entry TTLs.
+
+    Stale entries are kept (until evicted) so their ETag / Last-Modified
+    validators can be used for a conditional request. An optional
+    ``SQLiteCacheStore`` acts as a second tier shared across processes:
+    memory misses fall through to it and writes go to both.
+    """
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES, store: Optional[SQLiteCacheStore] = None):
+        self.max_entries = max_entries
+        self.store = store
+        self._entries: "OrderedDict[CacheKey, CacheEntry]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: CacheKey) -> Optional[CacheEntry]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+        if entry is not None and (entry.is_fresh() or self.store is None):
+            return entry
+
+        # Another process may have refreshed the entry on disk
+        stored = self.store.get(key) if self.store is not None else None
+        if stored is not None and (entry is None or stored.expires_at > entry.expires_at):
+            self._remember(key, stored)
+            return stored
+        return entry
+
+    def set(self, key: CacheKey, entry: CacheEntry) -> None:
+        self._remember(key, entry)
+        if self.store is not None:
+            self.store.set(key, entry)
+
+    def _remember(self, key: CacheKey, entry: CacheEntry) -> None:
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, path: Optional[str] = None, project: Optional[str] = None) -> int:
+        """Drop entries for a WSAPI path and/or project ref; returns how many were removed"""
+        normalized_path = "/" + path.strip("/") if path else None
+        with self._lock:
+            stale = [
+                key for key in self._entries
+                if (normalized_path is None or key[4] == normalized_path)
+                and (project is None or key[3] == project)
+            ]
+            for key in stale:
+                del self._entries[key]
+        removed = len(stale)
+        if self.store is not None:
+            removed = max(removed, self.store.invalidate(normalized_path, project))
+        return removed
+
+    def use_disk_store(self, path: Optional[str]) -> None:
+        """Attach (or with a falsy path, detach) the on-disk tier; no-op if unchanged"""
+        current = self.store.path if self.store is not None else None
+        if (path or None) == current:
+            return
+        self.store = SQLiteCacheStore(path) if path else None
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class SingleFlight:
+    """
+    Collapse concurrent calls for the same key into a single execution.
+
+    The first caller runs the function; callers arriving while it is in
+    flight wait for it and receive the same result (or exception).
+    ``executed`` and ``shared`` count leader runs and coalesced waiters.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[Any, "_Call"] = {}
+        self.executed = 0
+        self.shared = 0
+
+    def do(self, key: Any, fn: Callable[[], Any]) -> Any:
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+                self.executed += 1
+            else:
+                self.shared += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"executed": self.executed, "shared": self.shared, "in_flight": len(self._calls)}
+
+
+class _Call:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+# Process-wide cache shared by every pooled Rally client
+response_cache = RallyResponseCache()
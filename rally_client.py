@@ -0,0 +1,332 @@
+import threading
+import hashlib
+import json
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+import requests
+from requests.adapters import HTTPAdapter
+from rally_cache import CacheEntry, RallyResponseCache, SingleFlight, make_cache_key, response_cache
+from rally_errors import RallyAPIError, error_for_response
+from rally_scheduler import DEFAULT_RATE_LIMIT, RequestScheduler
+
+RALLY_API_PATH = "/slm/webservice/v2.0"
+
+# Connection pool defaults; callers can override them per client
+DEFAULT_POOL_CONNECTIONS = 4
+DEFAULT_POOL_MAXSIZE = 16
+DEFAULT_TIMEOUT = (10, 120)  # (connect, read) seconds
+
+# Paginated query defaults
+DEFAULT_PAGE_SIZE = 200
+DEFAULT_QUERY_WORKERS = 4
+
+
+def normalize_rally_endpoint(endpoint: str) -> str:
+    """
+    Normalise a user supplied Rally URL into the WSAPI base endpoint.
+
+    Strips whitespace, URL fragments and trailing slashes and appends
+    ``/slm/webservice/v2.0`` when it is missing.
+    """
+    base_endpoint = (endpoint or "").strip().split('#')[0].rstrip('/')
+    if not base_endpoint.endswith(RALLY_API_PATH):
+        base_endpoint = f"{base_endpoint}{RALLY_API_PATH}"
+    return base_endpoint
+
+
+def api_key_fingerprint(api_key: str) -> str:
+    """Return a short, non-reversible fingerprint of a Rally API key"""
+    return hashlib.sha256((api_key or "").encode("utf-8")).hexdigest()[:16]
+
+
+class RallyClient:
+    """
+    Long-lived Rally WSAPI client.
+
+    Wraps a single ``requests.Session`` whose HTTP adapter keeps a pool of
+    keep-alive connections, so repeated calls reuse the same TCP/TLS
+    connection instead of paying for a new handshake each time. Every
+    request passes through a ``RequestScheduler`` (rate limit, retries with
+    backoff, per-endpoint circuit breaker).
+    """
+
+    def __init__(
+        self,
+        endpoint: str,
+        api_key: str,
+        pool_connections: int = DEFAULT_POOL_CONNECTIONS,
+        pool_maxsize: int = DEFAULT_POOL_MAXSIZE,
+        verify: bool = False,
+        timeout: Any = DEFAULT_TIMEOUT,
+        cache: Optional[RallyResponseCache] = None,
+        scheduler: Optional[RequestScheduler] = None
+    ):
+        self.base_endpoint = normalize_rally_endpoint(endpoint)
+        self.api_key = api_key
+        self.key_fingerprint = api_key_fingerprint(api_key)
+        self.pool_maxsize = pool_maxsize
+        self.timeout = timeout
+        self.cache = cache if cache is not None else response_cache
+        self.scheduler = scheduler if scheduler is not None else RequestScheduler()
+        self._flights = SingleFlight()
+
+        adapter = HTTPAdapter(
+            pool_connections=pool_connections,
+            pool_maxsize=pool_maxsize,
+            pool_block=True
+        )
+        self.session = requests.Session()
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.verify = verify
+        self.session.headers.update({
+            "zsessionid": api_key,
+            "Content-Type": "application/json",
+            "Accept": "application/json"
+        })
+
+    def url(self, path: str) -> str:
+        """Build an absolute URL for a WSAPI path such as ``/testcase``"""
+        if path.startswith("http://") or path.startswith("https://"):
+            return path
+        return f"{self.base_endpoint}/{path.lstrip('/')}"
+
+    def endpoint_name(self, url: str) -> str:
+        """Circuit breaker scope for a URL: the base endpoint plus the entity type"""
+        relative = url[len(self.base_endpoint):] if url.startswith(self.base_endpoint) else url
+        entity = relative.split('?')[0].strip('/').split('/')[0]
+        return f"{self.base_endpoint}/{entity}"
+
+    def request(self, method: str, path: str, **kwargs) -> requests.Response:
+        """
+        Send a request through the scheduler.
+
+        Raises:
+            RallyAPIError: subclasses for an open circuit or exhausted retries
+        """
+        kwargs.setdefault("timeout", self.timeout)
+        url = self.url(path)
+        return self.scheduler.execute(
+            self.endpoint_name(url),
+            method,
+            path,
+            lambda: self.session.request(method, url, **kwargs)
+        )
+
+    def get(self, path: str, params: Optional[Dict[str, Any]] = None, **kwargs) -> requests.Response:
+        return self.request("GET", path, params=params, **kwargs)
+
+    def post(self, path: str, json: Optional[Dict[str, Any]] = None, **kwargs) -> requests.Response:
+        return self.request("POST", path, json=json, **kwargs)
+
+    def get_json(
+        self,
+        path: str,
+        params: Optional[Dict[str, Any]] = None,
+        ttl: float = 0,
+        **kwargs
+    ) -> Dict[str, Any]:
+        """
+        GET a WSAPI resource and return its decoded JSON body.
+
+        With ``ttl > 0`` the body is cached under the endpoint, API key hash,
+        workspace, project and remaining params. A fresh entry is returned
+        without touching Rally; a stale one is revalidated with
+        If-None-Match / If-Modified-Since when Rally supplied validators, and
+        a 304 simply extends its lifetime.
+
+        Cached or not, concurrent identical GETs (same URL, normalised params
+        and request options) share one in-flight HTTP request, so many
+        sessions opening the same view cost Rally a single call.
+
+        Raises:
+            RallyAPIError: (or a subclass) on any response other than 200, or 304
+                for a cached entry
+        """
+        flight_key = self._flight_key(path, params, kwargs)
+        if ttl <= 0:
+            return self._flights.do(
+                flight_key,
+                lambda: self._decode(self.get(path, params=params, **kwargs), path)
+            )
+
+        extra_headers = kwargs.pop("headers", None) or {}
+        key = make_cache_key(self.base_endpoint, self.key_fingerprint, path, params)
+        entry = self.cache.get(key)
+        if entry is not None and entry.is_fresh():
+            return entry.value
+
+        def revalidate() -> Dict[str, Any]:
+            current = self.cache.get(key)
+            if current is not None and current.is_fresh():
+                return current.value
+
+            headers = dict(extra_headers)
+            if current is not None:
+                headers.update(current.validator_headers())
+            response = self.get(path, params=params, headers=headers, **kwargs)
+
+            if response.status_code == 304 and current is not None:
+                self.cache.set(key, CacheEntry(current.value, ttl, current.etag, current.last_modified))
+                return current.value
+
+            value = self._decode(response, path)
+            self.cache.set(key, CacheEntry(
+                value,
+                ttl,
+                etag=response.headers.get("ETag"),
+                last_modified=response.headers.get("Last-Modified")
+            ))
+            return value
+
+        return self._flights.do(flight_key, revalidate)
+
+    def _flight_key(self, path: str, params: Optional[Dict[str, Any]], options: Dict[str, Any]) -> Tuple:
+        """Coalescing key: the cache key plus any per-request options (headers, verify, ...)"""
+        key = make_cache_key(self.base_endpoint, self.key_fingerprint, path, params)
+        if not options:
+            return key
+        return key + (json.dumps(options, sort_keys=True, default=str),)
+
+    def _decode(self, response: requests.Response, path: str) -> Dict[str, Any]:
+        if response.status_code != 200:
+            raise error_for_response(response, path)
+        return response.json()
+
+    def query_page(
+        self,
+        path: str,
+        params: Optional[Dict[str, Any]] = None,
+        start: int = 1,
+        page_size: int = DEFAULT_PAGE_SIZE,
+        ttl: float = 0
+    ) -> Dict[str, Any]:
+        """
+        Fetch one page of a WSAPI query and return its ``QueryResult``.
+
+        ``ttl`` is passed to ``get_json`` so result pages can be cached.
+
+        Raises:
+            RallyAPIError: on a non-200 response or when Rally reports query errors
+        """
+        page_params = dict(params or {})
+        page_params["start"] = start
+        page_params["pagesize"] = page_size
+
+        query_result = self.get_json(path, params=page_params, ttl=ttl).get('QueryResult', {})
+        if query_result.get('Errors'):
+            raise RallyAPIError(
+                f"Rally query {path} returned errors: {query_result['Errors']}",
+                url=self.url(path)
+            )
+        return query_result
+
+    def iter_query_pages(
+        self,
+        path: str,
+        params: Optional[Dict[str, Any]] = None,
+        page_size: int = DEFAULT_PAGE_SIZE,
+        max_workers: Optional[int] = None,
+        ttl: float = 0
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Yield the ``QueryResult`` pages of a WSAPI query in order.
+
+        The first page is fetched on its own to learn ``TotalResultCount``;
+        every remaining page offset is then known, so those pages are fetched
+        concurrently by a bounded worker pool. At most ``2 * max_workers``
+        pages are in flight or buffered at any time, which keeps memory
+        bounded for very large result sets. The first failing page stops the
+        iteration: pending pages are cancelled and the error is raised.
+        """
+        first_page = self.query_page(path, params, 1, page_size, ttl)
+        yield first_page
+
+        total_results = first_page.get('TotalResultCount', 0)
+        remaining_starts = list(range(1 + page_size, total_results + 1, page_size))
+        if not remaining_starts:
+            return
+
+        workers = min(max_workers or DEFAULT_QUERY_WORKERS, self.pool_maxsize, len(remaining_starts))
+        executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="rally-page")
+        in_flight = deque()
+        starts = iter(remaining_starts)
+        try:
+            for start in starts:
+                in_flight.append(executor.submit(self.query_page, path, params, start, page_size, ttl))
+                if len(in_flight) >= workers * 2:
+                    break
+
+            while in_flight:
+                page = in_flight.popleft().result()
+                next_start = next(starts, None)
+                if next_start is not None:
+                    in_flight.append(executor.submit(self.query_page, path, params, next_start, page_size, ttl))
+                yield page
+        finally:
+            for future in in_flight:
+                future.cancel()
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def query_all(
+        self,
+        path: str,
+        params: Optional[Dict[str, Any]] = None,
+        page_size: int = DEFAULT_PAGE_SIZE,
+        max_workers: Optional[int] = None,
+        ttl: float = 0
+    ) -> List[Dict[str, Any]]:
+        """Fetch every result of a WSAPI query, preserving Rally's ordering"""
+        results = []
+        for page in self.iter_query_pages(path, params, page_size, max_workers, ttl):
+            results.extend(page.get('Results', []))
+        return results
+
+    def close(self) -> None:
+        self.session.close()
+
+
+_clients: Dict[Tuple[str, str, int, int], RallyClient] = {}
+_clients_lock = threading.Lock()
+
+
+def shared_client(
+    endpoint: str,
+    api_key: str,
+    pool_connections: Optional[int] = None,
+    pool_maxsize: Optional[int] = None,
+    rate_limit: Optional[float] = None
+) -> RallyClient:
+    """
+    Return the process-wide client for an endpoint/API key pair.
+
+    Clients are created lazily and reused by every caller (including
+    concurrent Streamlit sessions), so their connection pools stay warm and
+    they share one rate limit and set of circuit breakers. ``rate_limit``
+    (requests per second) only applies when the client is first created.
+    """
+    pool_connections = pool_connections or DEFAULT_POOL_CONNECTIONS
+    pool_maxsize = pool_maxsize or DEFAULT_POOL_MAXSIZE
+    key = (normalize_rally_endpoint(endpoint), api_key_fingerprint(api_key), pool_connections, pool_maxsize)
+
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            client = RallyClient(
+                endpoint,
+                api_key,
+                pool_connections=pool_connections,
+                pool_maxsize=pool_maxsize,
+                scheduler=RequestScheduler(rate=rate_limit or DEFAULT_RATE_LIMIT)
+            )
+            _clients[key] = client
+        return client
+
+
+def close_shared_clients() -> None:
+    """Close every pooled client, e.g. after the Rally configuration changes"""
+    with _clients_lock:
+        for client in _clients.values():
+            client.close()
+        _clients.clear()
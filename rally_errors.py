@@ -0,0 +1,59 @@
+from typing import Optional
+import requests
+
+
+class RallyAPIError(Exception):
+    """Raised when Rally answers a request with an error status or error payload"""
+
+    def __init__(self, message: str, status_code: Optional[int] = None, url: str = ""):
+        super().__init__(message)
+        self.status_code = status_code
+        self.url = url
+
+
+class RallyAuthError(RallyAPIError):
+    """The API key was rejected (401/403)"""
+
+
+class RallyNotFoundError(RallyAPIError):
+    """The requested object does not exist (404)"""
+
+
+class RallyRateLimitError(RallyAPIError):
+    """Rally kept throttling the request (429) after all retries"""
+
+    def __init__(self, message: str, status_code: Optional[int] = None, url: str = "",
+                 retry_after: Optional[float] = None):
+        super().__init__(message, status_code, url)
+        self.retry_after = retry_after
+
+
+class RallyServerError(RallyAPIError):
+    """Rally kept failing with a 5xx status after all retries"""
+
+
+class RallyConnectionError(RallyAPIError):
+    """Rally could not be reached (connection error or timeout) after all retries"""
+
+
+class RallyCircuitOpenError(RallyAPIError):
+    """Requests to this endpoint are short-circuited after repeated failures"""
+
+    def __init__(self, message: str, url: str = "", retry_in: float = 0):
+        super().__init__(message, None, url)
+        self.retry_in = retry_in
+
+
+def error_for_response(response: requests.Response, path: str) -> RallyAPIError:
+    """Build the typed exception matching an unsuccessful Rally response"""
+    status = response.status_code
+    message = f"Rally request {path} failed with status {status}: {response.text[:200]}"
+    if status in (401, 403):
+        return RallyAuthError(message, status, response.url)
+    if status == 404:
+        return RallyNotFoundError(message, status, response.url)
+    if status == 429:
+        return RallyRateLimitError(message, status, response.url)
+    if status >= 500:
+        return RallyServerError(message, status, response.url)
+    return RallyAPIError(message, status, response.url)
@@ -0,0 +1,47 @@
+from typing import Dict, List
+
+# Named Rally fetch projections per entity type. Each call site picks the
+# smallest profile that covers the fields it renders:
+#   list      - selectors and pickers
+#   detail    - a single item shown in full
+#   analytics - the fields aggregated by the dashboards
+FETCH_PROFILES: Dict[str, Dict[str, List[str]]] = {
+    "workspace": {
+        "list": ["ObjectID", "Name"]
+    },
+    "project": {
+        "list": ["ObjectID", "Name"]
+    },
+    "hierarchicalrequirement": {
+        "list": ["ObjectID", "FormattedID", "Name"],
+        # Descriptions are loaded lazily, one story at a time
+        "description": ["Description"]
+    },
+    "testcase": {
+        "detail": ["ObjectID", "FormattedID", "Name", "LastVerdict", "LastRun", "Method", "Priority"],
+        # LastUpdateDate drives incremental sync (see rally_sync)
+        "analytics": ["ObjectID", "FormattedID", "Name", "LastVerdict", "LastRun", "LastBuild",
+                      "Duration", "Owner", "LastUpdateDate"],
+        # Project-wide loads also need the story each test case belongs to
+        "project_analytics": ["ObjectID", "FormattedID", "Name", "LastVerdict", "LastRun", "LastBuild",
+                              "Duration", "Owner", "WorkProduct"]
+    },
+    "testcaseresult": {
+        # ObjectID is needed so nested TestCase refs carry their ObjectID
+        "analytics": ["ObjectID", "Build", "Date", "Verdict", "TestCase", "WorkProduct", "Tester"]
+    },
+    "defect": {
+        "list": ["FormattedID", "Name", "State", "Priority", "Severity", "CreationDate"],
+        "analytics": ["ObjectID", "Name", "State", "Priority", "Severity", "c_RCARootCauseUS", "CreationDate"]
+    }
+}
+
+
+def fetch_fields(entity: str, profile: str = "list") -> str:
+    """
+    Return the comma separated Rally ``fetch`` string for an entity profile.
+
+    Raises:
+        KeyError: if the entity or profile is not defined
+    """
+    return ",".join(FETCH_PROFILES[entity][profile])
@@ -0,0 +1,102 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, List, Optional
+from rally_client import RallyClient
+from rally_fields import fetch_fields
+
+# Rally has no IN operator, so ObjectID lists are sent as nested OR clauses.
+# Chunks keep the query string well below common URL length limits.
+OBJECT_ID_CHUNK_SIZE = 40
+
+
+def build_or_query(field: str, values: Iterable[Any]) -> str:
+    """
+    Build a Rally query matching any of ``values`` for ``field``.
+
+    Rally requires every binary expression to be parenthesised, so
+    ``[1, 2, 3]`` becomes ``(((F = 1) OR (F = 2)) OR (F = 3))``.
+    """
+    query = ""
+    for value in values:
+        clause = f"({field} = {value})"
+        query = clause if not query else f"({query} OR {clause})"
+    return query
+
+
+def format_test_result(result: Dict[str, Any]) -> Dict[str, Any]:
+    """Convert a raw ``/testcaseresult`` record into a history row"""
+    return {
+        "build": result.get('Build', 'N/A'),
+        "date": result.get('Date', 'N/A'),
+        "verdict": result.get('Verdict', 'N/A'),
+        "work_product": (result.get('WorkProduct', {}) or {}).get('_refObjectName', 'N/A'),
+        "tester": (result.get('Tester', {}) or {}).get('_refObjectName', 'N/A')
+    }
+
+
+def fetch_test_case_results(
+    client: RallyClient,
+    workspace_id: str,
+    story_id: Optional[str] = None,
+    test_case_oids: Optional[Iterable[Any]] = None,
+    since: Optional[str] = None,
+    max_workers: Optional[int] = None
+) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    Load test case results in bulk and group them by test case ObjectID.
+
+    With ``story_id`` every result of the story's test cases is read through a
+    single paged ``TestCase.WorkProduct.FormattedID`` query. Otherwise the
+    given ``test_case_oids`` are queried in OR-chunked batches. When both are
+    given, the story query is used and filtered down to those ObjectIDs.
+    ``since`` limits results to those dated on or after an ISO timestamp.
+
+    Returns:
+        Dict mapping test case ObjectID (as str) to its raw result records,
+        newest first
+    """
+    wanted = {str(oid) for oid in test_case_oids} if test_case_oids is not None else None
+    date_clause = f'(Date >= "{since}")' if since else ""
+
+    def with_date(query: str) -> str:
+        return f"({query} AND {date_clause})" if date_clause else query
+
+    def params_for(query: str) -> Dict[str, Any]:
+        return {
+            "workspace": f"/workspace/{workspace_id}",
+            "query": with_date(query),
+            "fetch": fetch_fields("testcaseresult", "analytics"),
+            "order": "Date DESC"
+        }
+
+    if story_id:
+        queries = [f"(TestCase.WorkProduct.FormattedID = \"{story_id}\")"]
+    elif wanted:
+        oids = sorted(wanted)
+        queries = [
+            build_or_query("TestCase.ObjectID", oids[i:i + OBJECT_ID_CHUNK_SIZE])
+            for i in range(0, len(oids), OBJECT_ID_CHUNK_SIZE)
+        ]
+    else:
+        return {}
+
+    if len(queries) == 1:
+        batches = [client.query_all("/testcaseresult", params_for(queries[0]), max_workers=max_workers)]
+    else:
+        with ThreadPoolExecutor(max_workers=min(len(queries), client.pool_maxsize, 4)) as executor:
+            batches = list(executor.map(
+                lambda query: client.query_all("/testcaseresult", params_for(query), max_workers=1),
+                queries
+            ))
+
+    grouped: Dict[str, List[Dict[str, Any]]] = {}
+    for batch in batches:
+        for result in batch:
+            test_case_ref = result.get('TestCase', {}) or {}
+            test_case_oid = str(test_case_ref.get('ObjectID') or test_case_ref.get('_ref', '').rstrip('/').split('/')[-1])
+            if not test_case_oid or (wanted is not None and test_case_oid not in wanted):
+                continue
+            grouped.setdefault(test_case_oid, []).append(result)
+
+    for results in grouped.values():
+        results.sort(key=lambda r: r.get('Date') or '', reverse=True)
+    return grouped
@@ -0,0 +1,236 @@
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Callable, Dict, Optional
+import requests
+from rally_errors import (
+    RallyCircuitOpenError,
+    RallyConnectionError,
+    RallyRateLimitError,
+    error_for_response
+)
+
+# Client-side request rate (requests per second) and burst size per client
+DEFAULT_RATE_LIMIT = 10.0
+DEFAULT_BURST = 20
+
+# Retry policy for throttled / failing requests
+DEFAULT_MAX_RETRIES = 4
+DEFAULT_BACKOFF_BASE = 0.5
+DEFAULT_BACKOFF_MAX = 30.0
+
+# Circuit breaker: open after this many consecutive failures, probe again later
+DEFAULT_FAILURE_THRESHOLD = 5
+DEFAULT_RESET_TIMEOUT = 30.0
+
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+# A non-idempotent request (e.g. a create) is only retried when Rally
+# signalled that it did not process it
+NOT_PROCESSED_STATUSES = {429, 503}
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS"}
+
+
+class TokenBucket:
+    """Thread-safe token bucket; ``acquire`` blocks until a token is available"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: float = 1) -> None:
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                wait = (tokens - self._tokens) / self.rate
+            time.sleep(wait)
+
+    def defer(self, seconds: float) -> None:
+        """Hold every caller back for at least ``seconds`` (e.g. after Rally throttled the client)"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens = min(self._tokens, -seconds * self.rate)
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker.
+
+    Closed: requests flow. After ``failure_threshold`` consecutive failures it
+    opens and rejects requests for ``reset_timeout`` seconds, then lets a
+    single probe through (half-open); the probe's outcome closes or re-opens it.
+    Throttling is not a failure: it only releases a probe so another can follow.
+    """
+
+    def __init__(self, failure_threshold: int = DEFAULT_FAILURE_THRESHOLD,
+                 reset_timeout: float = DEFAULT_RESET_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def before_request(self, name: str) -> None:
+        with self._lock:
+            if self._opened_at is None:
+                return
+            elapsed = time.monotonic() - self._opened_at
+            if elapsed >= self.reset_timeout and not self._probing:
+                self._probing = True
+                return
+            raise RallyCircuitOpenError(
+                f"Rally endpoint {name} is temporarily unavailable after repeated failures",
+                url=name,
+                retry_in=max(self.reset_timeout - elapsed, 0)
+            )
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._probing or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+            self._probing = False
+
+    def release_probe(self) -> None:
+        """End a half-open probe without an outcome, so the next request probes again"""
+        with self._lock:
+            self._probing = False
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Parse a Retry-After header given in seconds or as an HTTP date"""
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+class RequestScheduler:
+    """
+    Central gate for every Rally HTTP request of a client.
+
+    Applies a client-side token-bucket rate limit, retries throttled and
+    failing requests with jittered exponential backoff (honouring
+    Retry-After), and keeps one circuit breaker per endpoint. A throttled
+    response holds back the whole token bucket rather than counting
+    against the breaker. Exhausted retries surface as typed
+    ``RallyAPIError`` subclasses.
+    """
+
+    def __init__(
+        self,
+        rate: float = DEFAULT_RATE_LIMIT,
+        burst: int = DEFAULT_BURST,
+        max_retries: int = DEFAULT_MAX_RETRIES,
+        backoff_base: float = DEFAULT_BACKOFF_BASE,
+        backoff_max: float = DEFAULT_BACKOFF_MAX,
+        failure_threshold: int = DEFAULT_FAILURE_THRESHOLD,
+        reset_timeout: float = DEFAULT_RESET_TIMEOUT
+    ):
+        self.bucket = TokenBucket(rate, burst)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._breakers_lock = threading.Lock()
+
+    def breaker(self, name: str) -> CircuitBreaker:
+        with self._breakers_lock:
+            breaker = self._breakers.get(name)
+            if breaker is None:
+                breaker = self._breakers[name] = CircuitBreaker(self.failure_threshold, self.reset_timeout)
+            return breaker
+
+    def backoff(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        """Full-jitter exponential backoff, never shorter than Retry-After"""
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.backoff_max))
+        return delay
+
+    def execute(self, name: str, method: str, path: str, send: Callable[[], requests.Response]) -> requests.Response:
+        """
+        Send a request through the rate limit, retry policy and breaker for ``name``.
+
+        Returns the response for any status that is not retryable (including
+        ordinary 4xx errors, which the caller interprets).
+
+        Raises:
+            RallyCircuitOpenError: the endpoint's breaker is open
+            RallyRateLimitError: still throttled after all retries
+            RallyServerError: still failing with 5xx after all retries
+            RallyConnectionError: still unreachable after all retries, or at once
+                for a non-idempotent request that may already have been sent
+        """
+        breaker = self.breaker(name)
+        idempotent = method.upper() in IDEMPOTENT_METHODS
+        retryable = RETRYABLE_STATUSES if idempotent else NOT_PROCESSED_STATUSES
+        attempt = 0
+        while True:
+            breaker.before_request(name)
+            self.bucket.acquire()
+            try:
+                response = send()
+            except (requests.ConnectionError, requests.Timeout) as e:
+                breaker.record_failure()
+                # Only a failed connect proves a create was never sent
+                safe_to_retry = idempotent or isinstance(e, requests.ConnectTimeout)
+                if attempt >= self.max_retries or not safe_to_retry:
+                    raise RallyConnectionError(f"Could not reach Rally for {path}: {str(e)}", url=path) from e
+                time.sleep(self.backoff(attempt))
+                attempt += 1
+                continue
+            except BaseException:
+                # Any other error (e.g. a broken chunked body) must still settle a probe
+                breaker.record_failure()
+                raise
+
+            if response.status_code == 429:
+                breaker.release_probe()
+            elif response.status_code < 500:
+                breaker.record_success()
+            else:
+                breaker.record_failure()
+            if response.status_code not in retryable:
+                return response
+
+            retry_after = parse_retry_after(response.headers.get("Retry-After"))
+            if attempt >= self.max_retries:
+                error = error_for_response(response, path)
+                if isinstance(error, RallyRateLimitError):
+                    error.retry_after = retry_after
+                raise error
+
+            delay = self.backoff(attempt, retry_after)
+            print(f"Rally returned {response.status_code} for {path}; retrying in {delay:.1f}s")
+            if response.status_code == 429:
+                # Every request of this client waits out the throttle, not just this one
+                self.bucket.defer(delay)
+            else:
+                time.sleep(delay)
+            attempt += 1
@@ -0,0 +1,112 @@
+import re
+import time
+from typing import Any, Dict, List, Optional
+from rally_cache import CacheEntry, make_cache_key
+from rally_client import RallyClient
+
+# Snapshots older than this are rebuilt with a full query, which also drops
+# test cases that were deleted or moved to another story in the meantime.
+SNAPSHOT_MAX_AGE = 24 * 3600
+
+SNAPSHOT_PATH = "/testcase#snapshot"
+
+
+def _formatted_id_sort_key(record: Dict[str, Any]):
+    formatted_id = record.get('FormattedID') or ''
+    digits = re.sub(r'\D', '', formatted_id)
+    return (int(digits) if digits else 0, formatted_id)
+
+
+def _high_water_mark(records: Dict[str, Dict[str, Any]], current: str = "") -> str:
+    dates = [r.get('LastUpdateDate') or '' for r in records.values()]
+    return max(dates + [current])
+
+
+def sync_story_test_cases(
+    client: RallyClient,
+    workspace_id: str,
+    project_id: str,
+    story_id: str,
+    fetch: str,
+    min_interval: float = 0,
+    max_workers: Optional[int] = None
+) -> List[Dict[str, Any]]:
+    """
+    Return a story's test cases from a local snapshot kept in sync with Rally.
+
+    The first call downloads every test case and records the newest
+    ``LastUpdateDate`` as a high-water mark. Later calls only query
+    ``LastUpdateDate >= <mark>`` and merge those records into the snapshot,
+    so refresh cost follows the number of changes rather than the suite
+    size. A one-row count query guards against deletions and re-parenting:
+    when the snapshot size no longer matches Rally's total, the snapshot is
+    rebuilt. Snapshots are stored through the client's response cache, so
+    they also land in the shared on-disk tier when one is configured.
+
+    Args:
+        fetch: Rally fetch list; must include ObjectID and LastUpdateDate
+        min_interval: Seconds during which a snapshot is served without
+            asking Rally for changes at all
+
+    Raises:
+        RallyAPIError: if any of the underlying queries fails
+    """
+    base_params = {
+        "workspace": f"/workspace/{workspace_id}",
+        "project": f"/project/{project_id}",
+        "query": f"(WorkProduct.FormattedID = \"{story_id}\")",
+        "fetch": fetch,
+        "order": "FormattedID ASC"
+    }
+    key = make_cache_key(
+        client.base_endpoint,
+        client.key_fingerprint,
+        SNAPSHOT_PATH,
+        {"workspace": base_params["workspace"], "project": base_params["project"], "story": story_id, "fetch": fetch}
+    )
+
+    entry = client.cache.get(key)
+    snapshot = entry.value if entry is not None and entry.is_fresh() else None
+
+    if snapshot is not None and time.time() - snapshot["synced_at"] < min_interval:
+        return sorted(snapshot["records"].values(), key=_formatted_id_sort_key)
+
+    if snapshot is not None:
+        # Work on a copy: the cached snapshot may be read by other sessions
+        records = dict(snapshot["records"])
+        delta_params = dict(base_params)
+        delta_params["query"] = (
+            f"({base_params['query']} AND (LastUpdateDate >= \"{snapshot['high_water']}\"))"
+        )
+        changes = client.query_all("/testcase", delta_params, max_workers=max_workers)
+        for record in changes:
+            if record.get('ObjectID'):
+                records[str(record['ObjectID'])] = record
+
+        count_params = dict(base_params, fetch="ObjectID")
+        total = client.query_page("/testcase", count_params, start=1, page_size=1).get('TotalResultCount', 0)
+        print(f"Delta sync for story {story_id}: {len(changes)} changed, {total} total")
+        if total == len(records):
+            snapshot = {
+                "records": records,
+                "high_water": _high_water_mark(records, snapshot["high_water"]),
+                "created_at": snapshot["created_at"]
+            }
+        else:
+            print(f"Snapshot for story {story_id} out of step ({len(records)} vs {total}), rebuilding")
+            snapshot = None
+
+    if snapshot is None:
+        results = client.query_all("/testcase", base_params, max_workers=max_workers)
+        records = {str(r['ObjectID']): r for r in results if r.get('ObjectID')}
+        snapshot = {
+            "records": records,
+            "high_water": _high_water_mark(records),
+            "created_at": time.time()
+        }
+        print(f"Full sync of {len(records)} test cases for story {story_id}")
+
+    snapshot["synced_at"] = time.time()
+    remaining_age = SNAPSHOT_MAX_AGE - (snapshot["synced_at"] - snapshot["created_at"])
+    client.cache.set(key, CacheEntry(snapshot, max(remaining_age, 1)))
+    return sorted(snapshot["records"].values(), key=_formatted_id_sort_key)
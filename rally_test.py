@@ -9,6 +9,9 @@ from datetime import datetime
 import pygwalker as pyg
 import pandas as pd
 import plotly.express as px
+from rally_client import RallyAPIError, shared_client
+from rally_fields import fetch_fields
+from rally_history import fetch_test_case_results, format_test_result
 
 # Disable SSL warnings
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
@@ -356,71 +359,53 @@ def plot_test_case_status(test_cases_results: List[Dict]) -> None:
 
 def get_test_case_results(workspace_id: str, project_id: str, story_id: str) -> Dict[str, Any]:
     """Fetch test case results for a specific user story"""
-    headers = {
-        "zsessionid": RALLY_API_KEY,
-        "Content-Type": "application/json",
-        "Accept": "application/json"
+    # First get all test cases for the user story
+    client = shared_client(RALLY_ENDPOINT, RALLY_API_KEY)
+    test_case_params = {
+        "workspace": f"/workspace/{workspace_id}",
+        "project": f"/project/{project_id}",
+        "query": f"(WorkProduct.FormattedID = {story_id})",
+        "fetch": fetch_fields("testcase", "detail"),
+        "order": "FormattedID ASC"
     }
     
-    # First get all test cases for the user story
-    all_test_cases = []
-    start = 1
-    page_size = 100
+    try:
+        all_test_cases = client.query_all("/testcase", params=test_case_params, page_size=100)
+    except RallyAPIError as e:
+        print(f"Error fetching test cases: {str(e)}")
+        all_test_cases = []
     
-    while True:
-        test_case_params = {
-            "workspace": f"/workspace/{workspace_id}",
-            "project": f"/project/{project_id}",
-            "query": f"(WorkProduct.FormattedID = {story_id})",
-            "fetch": "FormattedID,Name,LastVerdict,LastRun,ObjectID,Method,Priority",
-            "pagesize": page_size,
-            "start": start,
-            "order": "FormattedID ASC"
-        }
-        
-        try:
-            test_case_response = requests.get(
-                f"{RALLY_ENDPOINT}/testcase",
-                headers=headers,
-                params=test_case_params,
-                verify=False
-            )
-            
-            if test_case_response.status_code == 200:
-                result_data = test_case_response.json().get('QueryResult', {})
-                page_test_cases = result_data.get('Results', [])
-                total_results = result_data.get('TotalResultCount', 0)
-                
-                if not page_test_cases:
-                    break
-                    
-                all_test_cases.extend(page_test_cases)
-                
-                if len(all_test_cases) >= total_results:
-                    break
-                    
-                start += page_size
-            else:
-                print(f"Error fetching data: {test_case_response.status_code}")
-                break
-                
-        except Exception as e:
-            print(f"Error fetching test cases: {str(e)}")
-            break
+    # Load the result history of every test case in a few paged queries
+    # (instead of two requests per test case) and group it client side
+    test_cases_by_oid = {
+        str(test_case.get('ObjectID')): test_case
+        for test_case in all_test_cases
+        if test_case.get('ObjectID') and test_case.get('FormattedID')
+    }
+    try:
+        results_by_oid = fetch_test_case_results(
+            client,
+            workspace_id,
+            story_id=story_id,
+            test_case_oids=test_cases_by_oid.keys()
+        )
+    except RallyAPIError as e:
+        print(f"Error fetching test case results: {str(e)}")
+        results_by_oid = {}
     
-    # Process each test case and collect results
+    # Collect results per test case
     all_results = []
-    for test_case in all_test_cases:
-        test_case_id = test_case.get('FormattedID')
+    histories = {}
+    for test_case_oid, test_case in test_cases_by_oid.items():
+        test_case_id = test_case['FormattedID']
         test_case_name = test_case.get('Name', 'Unnamed Test')  # Get test case name
-        if test_case_id:
-            tc_details = get_test_case_details(workspace_id, test_case_id)
-            if tc_details and tc_details.get("results"):
-                # Add test case name to each result
-                for result in tc_details["results"]:
-                    result['test_case_name'] = test_case_name
-                    result['test_case_id'] = test_case_id
-                all_results.extend(tc_details["results"])
+        history = [format_test_result(result) for result in results_by_oid.get(test_case_oid, [])]
+        histories[test_case_id] = {
+            "test_case_id": test_case_id,
+            "results": history
+        }
+        for result in history:
+            all_results.append(dict(result, test_case_name=test_case_name, test_case_id=test_case_id))
     
     # Plot both trends
     print("\nGenerating test execution trends...")
@@ -456,7 +441,7 @@ def get_test_case_results(workspace_id: str, project_id: str, story_id: str) ->
     selected_tc = input("Test Case ID: ")
     
     if selected_tc:
-        tc_details = get_test_case_details(workspace_id, selected_tc)
+        tc_details = histories.get(selected_tc) or get_test_case_details(workspace_id, selected_tc)
         if tc_details and tc_details["results"]:
             print(f"\nDetailed Results for Test Case {selected_tc}:")
             print("=" * 120)
@@ -0,0 +1,230 @@
+import hashlib
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from rally_client import RallyClient
+from rally_errors import RallyAPIError, RallyConnectionError, RallyServerError
+from sqlite_store import SQLiteStore
+
+DEFAULT_UPLOAD_WORKERS = 8
+
+# Stories created by this app, per project, keyed by idempotency key. Kept
+# on disk for a week so re-running an import after a partial failure (or a
+# restart) skips the stories that already made it.
+DEFAULT_UPLOAD_LEDGER_PATH = os.path.join(".cache", "upload_ledger.sqlite")
+LEDGER_TTL = 7 * 24 * 3600
+
+# Create attempts per story. A create that failed ambiguously (timeout, 5xx)
+# is only retried after Rally has been checked for the story.
+MAX_CREATE_ATTEMPTS = 2
+
+STORY_NAME_MAX_LENGTH = 60
+
+
+def story_name_from_text(user_story: str) -> str:
+    """Story name from the first line of a generated story, capped at 60 chars"""
+    story_name = user_story.split('\n')[0][:STORY_NAME_MAX_LENGTH]
+    if len(story_name) == STORY_NAME_MAX_LENGTH:
+        story_name += "..."
+    return story_name
+
+
+def idempotency_key(project_id: str, name: str, description: str) -> str:
+    """Stable key for a story: the same content in the same project maps to the same key"""
+    digest = hashlib.sha256()
+    for part in (str(project_id), name, description):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class UploadLedger(SQLiteStore):
+    """
+    Durable record of the stories this app created, by scope and idempotency key.
+
+    Stored in SQLite (WAL mode, one connection per thread) rather than the
+    response cache, so entries survive eviction and restarts. Entries older
+    than ``ttl`` seconds are ignored and pruned on open.
+    """
+
+    def __init__(self, path: str = DEFAULT_UPLOAD_LEDGER_PATH, ttl: float = LEDGER_TTL):
+        super().__init__(path)
+        self.ttl = ttl
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS upload_ledger (
+                    scope TEXT NOT NULL,
+                    idempotency_key TEXT NOT NULL,
+                    formatted_id TEXT,
+                    object_id TEXT,
+                    created_at REAL NOT NULL,
+                    PRIMARY KEY (scope, idempotency_key)
+                )
+            """)
+            conn.execute("DELETE FROM upload_ledger WHERE created_at <= ?", (time.time() - ttl,))
+
+    def get(self, scope: str, key: str) -> Optional[Dict[str, str]]:
+        """The story created for idempotency ``key`` in ``scope`` within the last ``ttl`` seconds"""
+        row = self._connect().execute(
+            "SELECT formatted_id, object_id FROM upload_ledger "
+            "WHERE scope = ? AND idempotency_key = ? AND created_at > ?",
+            (scope, key, time.time() - self.ttl)
+        ).fetchone()
+        return {"formatted_id": row[0], "object_id": row[1]} if row else None
+
+    def record(self, scope: str, key: str, created: Dict[str, str]) -> None:
+        """Remember the story created for idempotency ``key`` in ``scope``"""
+        self._connect().execute(
+            "INSERT OR REPLACE INTO upload_ledger VALUES (?, ?, ?, ?, ?)",
+            (scope, key, created.get("formatted_id"), created.get("object_id"), time.time())
+        )
+
+
+def _ledger_scope(client: RallyClient, project_id: str) -> str:
+    return f"{client.base_endpoint}|{client.key_fingerprint}|{project_id}"
+
+
+def _find_existing_story(client: RallyClient, project_id: str, name: str, description: str) -> Optional[Dict[str, str]]:
+    """Look a story up by Name in the project (uncached), preferring an exact description match"""
+    escaped = name.replace('\\', '\\\\').replace('"', '\\"')
+    matches = client.query_page(
+        "/hierarchicalrequirement",
+        {
+            "project": f"/project/{project_id}",
+            "projectScopeDown": "false",
+            "query": f"(Name = \"{escaped}\")",
+            "fetch": "ObjectID,FormattedID,Description",
+            "order": "CreationDate DESC"
+        },
+        start=1,
+        page_size=20
+    ).get('Results', [])
+    if not matches:
+        return None
+    exact = [m for m in matches if (m.get('Description') or '') == description]
+    match = (exact or matches)[0]
+    return {"formatted_id": match.get('FormattedID', 'Unknown'), "object_id": str(match.get('ObjectID', ''))}
+
+
+def create_user_story(
+    client: RallyClient,
+    ledger: UploadLedger,
+    project_id: str,
+    name: str,
+    description: str
+) -> Dict[str, Any]:
+    """
+    Create one HierarchicalRequirement unless this app already created it.
+
+    Returns a result dict with ``name``, ``status`` ("created", "existing"
+    or "failed"), ``formatted_id``, ``object_id`` and ``error``. The story
+    is skipped when its idempotency key is in the upload ledger, and an
+    ambiguous failure (timeout, 5xx) is followed by a lookup by Name before
+    any retry, so retries never create duplicates.
+    """
+    result = {"name": name, "status": "failed", "formatted_id": "", "object_id": "", "error": ""}
+    key = idempotency_key(project_id, name, description)
+    scope = _ledger_scope(client, project_id)
+
+    known = ledger.get(scope, key)
+    if known is not None:
+        result.update(known, status="existing")
+        return result
+
+    payload = {
+        "HierarchicalRequirement": {
+            "Name": name,
+            "Description": description,
+            "Project": f"/project/{project_id}"
+        }
+    }
+    for attempt in range(MAX_CREATE_ATTEMPTS):
+        try:
+            if attempt > 0:
+                existing = _find_existing_story(client, project_id, name, description)
+                if existing is not None:
+                    ledger.record(scope, key, existing)
+                    result.update(existing, status="existing", error="")
+                    return result
+
+            response = client.post("/hierarchicalrequirement/create", json=payload)
+            if response.status_code >= 500:
+                raise RallyServerError(
+                    f"Rally create failed with status {response.status_code}", response.status_code, response.url
+                )
+            if response.status_code != 200:
+                result["error"] = f"Status code: {response.status_code}"
+                return result
+
+            create_result = response.json().get('CreateResult', {})
+            if create_result.get('Errors'):
+                result["error"] = "; ".join(create_result['Errors'])
+                return result
+            created_story = create_result.get('Object', {})
+            created = {
+                "formatted_id": created_story.get('FormattedID', 'Unknown'),
+                "object_id": str(created_story.get('ObjectID', ''))
+            }
+            ledger.record(scope, key, created)
+            result.update(created, status="created", error="")
+            return result
+
+        except (RallyConnectionError, RallyServerError) as e:
+            print(f"Create of story '{name}' may not have completed (attempt {attempt + 1}): {str(e)}")
+            result["error"] = str(e)
+        except RallyAPIError as e:
+            result["error"] = str(e)
+            return result
+    return result
+
+
+def iter_create_user_stories(
+    client: RallyClient,
+    ledger: UploadLedger,
+    project_id: str,
+    stories: List[Dict[str, str]],
+    max_workers: Optional[int] = None
+) -> Iterator[Tuple[Dict[str, Any], int, int]]:
+    """
+    Create many stories through a bounded worker pool.
+
+    ``stories`` are dicts with ``name`` and ``description``. Yields
+    ``(result, done, total)`` on the calling thread as each create finishes,
+    where ``result`` is the ``create_user_story`` dict plus the story's
+    ``index`` in the input. Stories repeated in the batch are created once;
+    the repeats report the first one as "existing". Throughput is bounded
+    by the client's rate limit.
+    """
+    total = len(stories)
+    if not total:
+        return
+    # Indexes of each distinct story, by idempotency key, in input order
+    batches: Dict[str, List[int]] = {}
+    for index, story in enumerate(stories):
+        key = idempotency_key(project_id, story["name"], story.get("description", ""))
+        batches.setdefault(key, []).append(index)
+    workers = min(max_workers or DEFAULT_UPLOAD_WORKERS, client.pool_maxsize, len(batches))
+    done = 0
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="rally-create") as executor:
+        futures = {
+            executor.submit(
+                create_user_story, client, ledger, project_id,
+                stories[indexes[0]]["name"], stories[indexes[0]].get("description", "")
+            ): indexes
+            for indexes in batches.values()
+        }
+        try:
+            for future in as_completed(futures):
+                result = future.result()
+                indexes = futures[future]
+                done += 1
+                yield dict(result, index=indexes[0]), done, total
+                repeat_status = "failed" if result["status"] == "failed" else "existing"
+                for index in indexes[1:]:
+                    done += 1
+                    yield dict(result, index=index, status=repeat_status), done, total
+        finally:
+            for future in futures:
+                future.cancel()
+            client.cache.invalidate("/hierarchicalrequirement", project=f"/project/{project_id}")
@@ -0,0 +1,172 @@
+import threading
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+import numpy as np
+import pandas as pd
+from time_buckets import TimeZone, bucket_labels, parse_timestamps, window_buckets
+
+HISTORY_COLUMNS = ["result_oid", "test_case_oid", "story_id", "date", "verdict", "build", "tester"]
+
+# Verdicts that count towards flakiness; other verdicts (Blocked, Inconclusive, ...)
+# neither start nor end a flip
+DECISIVE_VERDICTS = ("Pass", "Fail")
+
+
+def _test_case_oid(result: Dict[str, Any]) -> str:
+    test_case_ref = result.get('TestCase', {}) or {}
+    return str(test_case_ref.get('ObjectID') or test_case_ref.get('_ref', '').rstrip('/').split('/')[-1])
+
+
+def result_rows(results: Iterable[Dict[str, Any]], story_id: Optional[str] = None) -> List[Tuple[Any, ...]]:
+    """Raw ``/testcaseresult`` records as ``HISTORY_COLUMNS`` tuples, skipping those without a test case"""
+    rows = [
+        (
+            str(result.get('ObjectID') or ''),
+            _test_case_oid(result),
+            story_id,
+            result.get('Date'),
+            result.get('Verdict', 'N/A'),
+            result.get('Build', 'N/A'),
+            (result.get('Tester', {}) or {}).get('_refObjectName', 'N/A')
+        )
+        for result in results
+    ]
+    return [row for row in rows if row[1]]
+
+
+def _empty_frame() -> pd.DataFrame:
+    frame = pd.DataFrame({column: pd.Series(dtype=object) for column in HISTORY_COLUMNS})
+    frame["date"] = pd.Series(dtype="datetime64[ns, UTC]")
+    return frame
+
+
+class ResultHistory:
+    """
+    In-memory frame of Rally test case results (one row per run).
+
+    Runs are added in bulk as ``result_rows`` tuples, de-duplicated by result
+    ObjectID and kept sorted by test case and date, so per-test statistics
+    and trends are computed as group-bys over real run history rather than
+    ``LastVerdict`` snapshots.
+    """
+
+    def __init__(self):
+        self._frame = _empty_frame()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._frame)
+
+    def add_rows(self, rows: List[Tuple[Any, ...]]) -> int:
+        """Add runs given as ``HISTORY_COLUMNS`` tuples (dates as ISO strings); returns how many were new"""
+        if not rows:
+            return 0
+        batch = pd.DataFrame(rows, columns=HISTORY_COLUMNS, dtype=object)
+        batch["date"] = parse_timestamps(batch["date"], "UTC")
+
+        with self._lock:
+            before = len(self._frame)
+            frame = pd.concat([self._frame, batch], ignore_index=True) if before else batch
+            # Results without an ObjectID can't be matched, so they are never merged
+            keyed = frame["result_oid"] != ''
+            duplicate = frame["result_oid"].duplicated(keep="last") & keyed
+            frame = frame[~duplicate.to_numpy()]
+            self._frame = frame.sort_values(["test_case_oid", "date"], kind="stable", ignore_index=True)
+            return len(self._frame) - before
+
+    def results(self, story_id: Optional[str] = None, test_case_oids: Optional[Iterable[Any]] = None) -> pd.DataFrame:
+        """Stored runs, optionally limited to a story and/or test cases, sorted by test case and date"""
+        with self._lock:
+            frame = self._frame
+        mask = np.ones(len(frame), dtype=bool)
+        if story_id is not None:
+            mask &= (frame["story_id"] == story_id).to_numpy()
+        if test_case_oids is not None:
+            mask &= frame["test_case_oid"].isin({str(oid) for oid in test_case_oids}).to_numpy()
+        return frame[mask]
+
+    def test_case_stats(self, story_id: Optional[str] = None, test_case_oids: Optional[Iterable[Any]] = None) -> pd.DataFrame:
+        """
+        Per test case run statistics.
+
+        Columns: runs, failures, passes, failure_rate (%), flakiness (% of
+        consecutive Pass/Fail runs whose verdict flipped), last_verdict and
+        last_run; indexed by test case ObjectID.
+        """
+        frame = self.results(story_id, test_case_oids)
+        columns = ["runs", "failures", "passes", "failure_rate", "flakiness", "last_verdict", "last_run"]
+        if frame.empty:
+            return pd.DataFrame(columns=columns, index=pd.Index([], name="test_case_oid"))
+
+        test_case = frame["test_case_oid"].to_numpy()
+        verdict = frame["verdict"].to_numpy()
+        decisive = np.isin(verdict, DECISIVE_VERDICTS)
+        # Rows are sorted by test case and date, so the previous row is the previous
+        # run of the same test case whenever the ObjectIDs match
+        pair = np.zeros(len(frame), dtype=bool)
+        pair[1:] = (test_case[1:] == test_case[:-1]) & decisive[1:] & decisive[:-1]
+        flip = np.zeros(len(frame), dtype=bool)
+        flip[1:] = pair[1:] & (verdict[1:] != verdict[:-1])
+
+        counts = pd.DataFrame({
+            "test_case_oid": test_case,
+            "runs": 1,
+            "failures": verdict == 'Fail',
+            "passes": verdict == 'Pass',
+            "pairs": pair,
+            "flips": flip
+        }).groupby("test_case_oid", sort=False).sum()
+        last = frame.groupby("test_case_oid", sort=False).tail(1).set_index("test_case_oid")
+
+        stats = counts[["runs", "failures", "passes"]].astype(int)
+        stats["failure_rate"] = stats["failures"] / stats["runs"] * 100
+        stats["flakiness"] = (counts["flips"] / counts["pairs"].where(counts["pairs"] > 0)).fillna(0) * 100
+        stats["last_verdict"] = last["verdict"]
+        stats["last_run"] = last["date"]
+        return stats
+
+    def trend(
+        self,
+        trend_days: int,
+        granularity: str = "day",
+        tz: TimeZone = None,
+        now: Optional[datetime] = None,
+        story_id: Optional[str] = None,
+        test_case_oids: Optional[Iterable[Any]] = None
+    ) -> Dict[str, Dict[str, Any]]:
+        """
+        Runs and failures per bucket over the last ``trend_days`` days, newest bucket first.
+
+        Each bucket has ``total`` runs, ``failed`` runs, ``failure_rate`` (%)
+        and ``failing_tests`` (distinct test cases with a failed run).
+        """
+        buckets = window_buckets(trend_days, granularity, tz, now)
+        trend = {
+            bucket: {"total": 0, "failed": 0, "failure_rate": 0, "failing_tests": 0}
+            for bucket in buckets
+        }
+        frame = self.results(story_id, test_case_oids)
+        if frame.empty:
+            return trend
+
+        labels = bucket_labels(frame["date"], granularity, tz)
+        in_window = labels.isin(buckets).to_numpy()
+        window = pd.DataFrame({
+            "bucket": labels.to_numpy()[in_window],
+            "failed": (frame["verdict"].to_numpy() == 'Fail')[in_window],
+            "test_case_oid": frame["test_case_oid"].to_numpy()[in_window]
+        })
+        if window.empty:
+            return trend
+
+        totals = window.groupby("bucket").agg(total=("failed", "size"), failed=("failed", "sum"))
+        failing = window[window["failed"]].groupby("bucket")["test_case_oid"].nunique()
+        for bucket, row in totals.iterrows():
+            total, failed = int(row["total"]), int(row["failed"])
+            trend[bucket].update(
+                total=total,
+                failed=failed,
+                failure_rate=(failed / total) * 100,
+                failing_tests=int(failing.get(bucket, 0))
+            )
+        return trend
@@ -0,0 +1,29 @@
+import os
+import sqlite3
+import threading
+
+
+class SQLiteStore:
+    """
+    Base for the app's SQLite files: one WAL-mode connection per thread.
+
+    WAL allows concurrent readers alongside a writer across processes, so
+    every app process on the machine can share the file. SQLite connections
+    can't be shared between threads, so each thread opens its own on first
+    use. The file's directory is created if it doesn't exist.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
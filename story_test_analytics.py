@@ -0,0 +1,182 @@
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+import pandas as pd
+from time_buckets import TimeZone, bucket_labels, window_buckets
+
+# Days (ending today) covered by the failure trend by default
+FAILURE_TREND_DAYS = 10
+
+# Columns of a test case record, in the order the dashboards expect them
+TEST_CASE_COLUMNS = [
+    "test_case_id", "test_case_name", "tcr_id", "date_time", "verdict", "LastBuild", "Duration", "Owner"
+]
+
+# Failure detail fields and the test case columns they come from; a failure
+# is listed once per trend bucket per distinct combination of these values
+FAILURE_DETAIL_COLUMNS = {
+    "test_case_id": "test_case_id",
+    "test_case_name": "test_case_name",
+    "build": "LastBuild",
+    "execution_time": "Duration",
+    "owner": "Owner"
+}
+
+
+def empty_test_data() -> Dict[str, Any]:
+    return {
+        "total_tests": 0,
+        "passed": 0,
+        "failed": 0,
+        "other": 0,
+        "test_cases": [],
+        "defects": [],
+        "pass_percentage": 0,
+        "statistics": {},
+        "failure_trend": {},
+        "daily_trend": {}
+    }
+
+
+def test_case_row(record: Any) -> Optional[Tuple[Any, ...]]:
+    """
+    Values of a raw Rally test case record in ``TEST_CASE_COLUMNS`` order.
+
+    Returns None for records that are not dicts or have no FormattedID.
+    """
+    if not isinstance(record, dict) or not record.get('FormattedID'):
+        return None
+    return (
+        record['FormattedID'],
+        record.get('Name', 'Unnamed Test'),
+        record.get('ObjectID', 'N/A'),
+        record.get('LastRun', 'N/A'),
+        # LastVerdict mirrors the verdict of LastResult, so the result itself isn't fetched
+        record.get('LastVerdict', 'No Run'),
+        record.get('LastBuild', 'Unknown'),
+        record.get('Duration', 'N/A'),
+        (record.get('Owner', {}) or {}).get('_refObjectName', 'Unassigned')
+    )
+
+
+def aggregate_test_data(
+    frame: pd.DataFrame,
+    trend_days: int = FAILURE_TREND_DAYS,
+    granularity: str = "day",
+    tz: TimeZone = None,
+    now: Optional[datetime] = None
+) -> Dict[str, Any]:
+    """
+    Compute the story test dashboard data from a test case frame.
+
+    Verdict counts, pass percentage and the per-bucket totals and failures
+    of the failure trend (last ``trend_days`` days by day, week or month in
+    ``tz``) are vectorised over the frame; only the failing rows in the
+    window are visited to build the de-duplicated failure details.
+    """
+    test_data = empty_test_data()
+    trend_buckets = window_buckets(trend_days, granularity, tz, now)
+    for bucket in trend_buckets:
+        test_data["failure_trend"][bucket] = {
+            "total": 0,
+            "failed": 0,
+            "failure_rate": 0,
+            "failure_details": []
+        }
+
+    total_tests = len(frame)
+    if not total_tests:
+        return test_data
+
+    is_fail = (frame["verdict"].to_numpy() == 'Fail')
+    test_data["total_tests"] = total_tests
+    test_data["passed"] = int((frame["verdict"].to_numpy() == 'Pass').sum())
+    test_data["failed"] = int(is_fail.sum())
+    test_data["other"] = total_tests - test_data["passed"] - test_data["failed"]
+    test_data["pass_percentage"] = (test_data["passed"] / total_tests) * 100
+    test_data["test_cases"] = [
+        dict(zip(TEST_CASE_COLUMNS, row)) for row in frame.itertuples(index=False, name=None)
+    ]
+
+    labels = bucket_labels(frame["date_time"], granularity, tz)
+    buckets = labels.where(labels.isin(trend_buckets))
+    in_window = buckets.notna().to_numpy()
+    totals = buckets[in_window].value_counts()
+    failures = buckets[in_window & is_fail].value_counts()
+    for bucket, total in totals.items():
+        total, failed = int(total), int(failures.get(bucket, 0))
+        trend = test_data["failure_trend"][bucket]
+        trend["total"] = total
+        trend["failed"] = failed
+        trend["failure_rate"] = (failed / total) * 100
+
+    # Failures are listed once per bucket per distinct detail, in test case order
+    failed_rows = frame.loc[in_window & is_fail, list(FAILURE_DETAIL_COLUMNS.values())]
+    failed_buckets = buckets[in_window & is_fail]
+    seen = set()
+    for bucket, row in zip(failed_buckets, failed_rows.itertuples(index=False, name=None)):
+        if (bucket, row) not in seen:
+            seen.add((bucket, row))
+            test_data["failure_trend"][bucket]["failure_details"].append(dict(zip(FAILURE_DETAIL_COLUMNS, row)))
+
+    return test_data
+
+
+def failure_rollup(frame: pd.DataFrame, keys: Dict[str, str], limit: int = 10) -> List[Dict[str, Any]]:
+    """
+    Test case counts per group, worst first.
+
+    ``keys`` maps output field names to frame columns to group by. Each
+    group reports ``total``, ``failed`` and ``failure_rate`` (%); groups
+    are ranked by failed tests, then failure rate, and only groups with a
+    failure are kept.
+    """
+    if frame.empty:
+        return []
+    grouped = pd.DataFrame({field: frame[column].fillna('N/A') for field, column in keys.items()})
+    grouped["failed"] = (frame["verdict"].to_numpy() == 'Fail')
+    rollup = grouped.groupby(list(keys), sort=False).agg(total=("failed", "size"), failed=("failed", "sum"))
+    rollup = rollup[rollup["failed"] > 0].reset_index()
+    rollup["failure_rate"] = rollup["failed"] / rollup["total"] * 100
+    rollup = rollup.sort_values(["failed", "failure_rate"], ascending=False, kind="stable").head(limit)
+    return [
+        dict(row, total=int(row["total"]), failed=int(row["failed"]), failure_rate=float(row["failure_rate"]))
+        for row in rollup.to_dict("records")
+    ]
+
+
+def project_failure_rollups(
+    frame: pd.DataFrame,
+    trend_days: int = FAILURE_TREND_DAYS,
+    granularity: str = "day",
+    tz: TimeZone = None,
+    now: Optional[datetime] = None,
+    limit: int = 10
+) -> Dict[str, Any]:
+    """
+    Project-level failure rollups over a frame of every story's test cases.
+
+    The frame has ``TEST_CASE_COLUMNS`` plus ``story_id`` and ``story_name``.
+
+    Returns:
+        ``worst_stories`` and ``worst_owners`` (see ``failure_rollup``) and
+        ``hot_spots``: failed tests per trend bucket (oldest first) for each
+        of the worst stories, as ``{story_id: {bucket: failed}}``
+    """
+    worst_stories = failure_rollup(frame, {"story_id": "story_id", "story_name": "story_name"}, limit)
+    worst_owners = failure_rollup(frame, {"owner": "Owner"}, limit)
+
+    buckets = window_buckets(trend_days, granularity, tz, now)[::-1]
+    hot_spots = {story["story_id"]: dict.fromkeys(buckets, 0) for story in worst_stories}
+    if hot_spots:
+        rows = (frame["verdict"].to_numpy() == 'Fail') & frame["story_id"].isin(hot_spots).to_numpy()
+        labels = bucket_labels(frame.loc[rows, "date_time"], granularity, tz)
+        counts = pd.DataFrame({"story_id": frame.loc[rows, "story_id"], "bucket": labels})
+        counts = counts[counts["bucket"].isin(buckets)].value_counts()
+        for (story_id, bucket), failed in counts.items():
+            hot_spots[story_id][bucket] = int(failed)
+
+    return {
+        "worst_stories": worst_stories,
+        "worst_owners": worst_owners,
+        "hot_spots": hot_spots
+    }
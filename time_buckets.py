@@ -0,0 +1,103 @@
+from datetime import datetime, tzinfo
+from typing import Any, Iterable, List, Optional, Union
+import numpy as np
+import pandas as pd
+
+# Trend windows offered by the dashboards, in days
+TREND_WINDOWS = {
+    "Last 7 days": 7,
+    "Last 10 days": 10,
+    "Last 30 days": 30,
+    "Last 90 days": 90,
+    "Last 365 days": 365
+}
+
+GRANULARITIES = ("day", "week", "month")
+
+# Bucket label formats; week buckets are labelled by their Monday
+LABEL_FORMATS = {
+    "day": "%Y-%m-%d",
+    "week": "%Y-%m-%d",
+    "month": "%Y-%m"
+}
+
+TimeZone = Union[str, tzinfo, None]
+
+
+def resolve_timezone(tz: TimeZone = None) -> Union[str, tzinfo]:
+    """The given zone (name or tzinfo), or the machine's local zone when None"""
+    return tz if tz is not None else datetime.now().astimezone().tzinfo
+
+
+def parse_timestamps(values: Iterable[Any], tz: TimeZone = None) -> pd.Series:
+    """
+    Parse Rally timestamps in one vectorised pass into tz-aware datetimes.
+
+    ISO 8601 timestamps keep their offset ("Z" for Rally) and are converted
+    to ``tz``. Plain dates (``2024-03-10``) are already calendar days, so
+    they become midnight in ``tz``; other naive values are taken as UTC.
+    Missing or unparseable values become NaT.
+    """
+    zone = resolve_timezone(tz)
+    series = values if isinstance(values, pd.Series) else pd.Series(list(values), dtype=object)
+    date_only = series.astype(str).str.fullmatch(r"\d{4}-\d{2}-\d{2}")
+    parsed = pd.to_datetime(series.mask(date_only), utc=True, errors="coerce", format="ISO8601").dt.tz_convert(zone)
+    if date_only.any():
+        dates = pd.to_datetime(series[date_only], errors="coerce", format="%Y-%m-%d")
+        parsed[date_only] = dates.dt.tz_localize(
+            zone, ambiguous=np.zeros(len(dates), dtype=bool), nonexistent="shift_forward"
+        )
+    return parsed
+
+
+def floor_to_bucket(timestamps: pd.Series, granularity: str = "day") -> pd.Series:
+    """Start of the day, week (Monday) or month each tz-aware timestamp falls in"""
+    if granularity not in GRANULARITIES:
+        raise ValueError(f"Unknown granularity {granularity!r}; expected one of {GRANULARITIES}")
+    # Flooring the wall-clock time keeps bucket edges at local midnight across DST changes
+    local = timestamps.dt.tz_localize(None).dt.normalize()
+    if granularity == "week":
+        local = local - pd.to_timedelta(local.dt.weekday, unit="D")
+    elif granularity == "month":
+        local = local - pd.to_timedelta(local.dt.day - 1, unit="D")
+    return local
+
+
+def window_buckets(
+    days: int,
+    granularity: str = "day",
+    tz: TimeZone = None,
+    now: Optional[datetime] = None
+) -> List[str]:
+    """
+    Labels of the buckets covering the last ``days`` days up to ``now``, newest first.
+
+    A day window of 10 is today and the 9 days before it; week and month
+    windows include every (partial) week or month those days touch.
+    """
+    zone = resolve_timezone(tz)
+    end = pd.Timestamp(now) if now is not None else pd.Timestamp.now(tz=zone)
+    end = end.tz_convert(zone) if end.tzinfo is not None else end.tz_localize(zone)
+    days_in_window = pd.Series(pd.date_range(end=end.normalize(), periods=max(days, 1), freq="D"))
+    starts = floor_to_bucket(days_in_window, granularity).drop_duplicates()
+    label = LABEL_FORMATS[granularity]
+    return [start.strftime(label) for start in reversed(starts.tolist())]
+
+
+def bucket_labels(
+    values: Iterable[Any],
+    granularity: str = "day",
+    tz: TimeZone = None
+) -> pd.Series:
+    """
+    Bucket label of each timestamp (None where it has none).
+
+    Parsing and flooring are vectorised; only the distinct bucket starts are
+    formatted, so long histories cost little more than short ones.
+    """
+    starts = floor_to_bucket(parse_timestamps(values, tz), granularity)
+    codes, uniques = pd.factorize(starts)
+    label = LABEL_FORMATS[granularity]
+    # Missing timestamps get code -1, which picks the trailing None
+    labels = np.array([start.strftime(label) for start in uniques] + [None], dtype=object)
+    return pd.Series(labels[codes], index=starts.index, dtype=object)
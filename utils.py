@@ -1,36 +1,279 @@
-import openai
-import json
-import requests
-from typing import Optional, Dict, Any, List, Tuple
+import os
+import re
+from typing import Optional, Dict, Any, Iterator, List, Tuple
 import logging
+import threading
 import urllib3
-import warnings
-from datetime import datetime, timedelta
+import pandas as pd
+from analytics_store import DEFAULT_ANALYTICS_DB_PATH, AnalyticsStore, defect_row
+from document_extraction import DEFAULT_EXTRACTION_CACHE_DIR, DEFAULT_EXTRACTION_WORKERS
+from llm_client import (
+    DEFAULT_COMPLETION_TOKENS,
+    DEFAULT_MAX_CONCURRENCY,
+    DEFAULT_TOKENS_PER_MINUTE,
+    LLMClientPool,
+    TokenBudget,
+    llm_pool
+)
+from llm_cache import DEFAULT_LLM_CACHE_MAX_BYTES, DEFAULT_LLM_CACHE_PATH, LLMResponseCache, completion_cache_key
+from rally_cache import DEFAULT_CACHE_TTLS, response_cache
+from rally_client import RallyAPIError, RallyClient, shared_client
+from rally_fields import fetch_fields
+from rally_history import fetch_test_case_results
+from rally_sync import sync_story_test_cases
+from rally_upload import (
+    DEFAULT_UPLOAD_LEDGER_PATH,
+    UploadLedger,
+    create_user_story,
+    iter_create_user_stories,
+    story_name_from_text
+)
+from result_history import ResultHistory, result_rows
+from story_test_analytics import (
+    FAILURE_TREND_DAYS,
+    TEST_CASE_COLUMNS,
+    aggregate_test_data,
+    empty_test_data,
+    project_failure_rollups
+)
+from time_buckets import bucket_labels
  
 # Disable SSL warnings globally
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
  
 # Configuration dictionary
-config: Dict[str, str] = {
+config: Dict[str, Any] = {
     "rally_endpoint": "",
     "rally_api_key": "",
     "openai_api_key": "",
     "selected_workspace": "",
-    "selected_project": ""
+    "selected_project": "",
+    "rally_pool_maxsize": 16,
+    "rally_query_workers": 4,
+    # Client-side cap on Rally requests per second, shared by all sessions
+    "rally_rate_limit": 10.0,
+    # Concurrent story creates during a backlog import
+    "rally_upload_workers": 8,
+    # SQLite file recording the stories this app created, so re-runs skip them
+    "upload_ledger_path": os.getenv("UPLOAD_LEDGER_PATH", DEFAULT_UPLOAD_LEDGER_PATH),
+    # Seconds to cache Rally metadata per entity type; 0 disables caching
+    "rally_cache_ttls": dict(DEFAULT_CACHE_TTLS),
+    # Optional SQLite file shared by all app processes as a second cache tier
+    "rally_cache_path": os.getenv("RALLY_CACHE_PATH", ""),
+    # Keep per-story test case snapshots and only fetch changes (LastUpdateDate)
+    "rally_delta_sync": True,
+    # Reuse identical LLM generations from a local on-disk cache
+    "llm_cache_enabled": True,
+    "llm_cache_path": os.getenv("LLM_CACHE_PATH", DEFAULT_LLM_CACHE_PATH),
+    "llm_cache_max_bytes": DEFAULT_LLM_CACHE_MAX_BYTES,
+    # Concurrent model calls when a large document is processed in chunks
+    "llm_max_workers": 4,
+    # Extracted document text, cached by file hash; worker processes for large PDFs
+    "extraction_cache_dir": os.getenv("EXTRACTION_CACHE_DIR", DEFAULT_EXTRACTION_CACHE_DIR),
+    "extraction_workers": DEFAULT_EXTRACTION_WORKERS,
+    # LLM provider: "openai", or "azure" with the Azure OpenAI settings below
+    "llm_provider": os.getenv("LLM_PROVIDER", "openai"),
+    "azure_openai_endpoint": os.getenv("AZURE_OPENAI_ENDPOINT", ""),
+    "azure_openai_key": os.getenv("AZURE_OPENAI_KEY", ""),
+    "azure_openai_api_version": os.getenv("AZURE_OPENAI_API_VERSION", "2024-02-01"),
+    "azure_deployment_name": os.getenv("AZURE_DEPLOYMENT_NAME", ""),
+    # Per-model caps shared by all sessions: concurrent requests, tokens per
+    # minute and the completion size reserved per call; "llm_model_limits"
+    # overrides the first two per model, e.g. {"gpt-4": {"max_concurrency": 4}}
+    "llm_max_concurrency": DEFAULT_MAX_CONCURRENCY,
+    "llm_tokens_per_minute": DEFAULT_TOKENS_PER_MINUTE,
+    "llm_completion_token_estimate": DEFAULT_COMPLETION_TOKENS,
+    "llm_model_limits": {},
+    # Batch generation: concurrent generations per run
+    "llm_batch_concurrency": 4,
+    "batch_output_dir": os.getenv("BATCH_OUTPUT_DIR", os.path.join(".cache", "batches")),
+    # Time zone (IANA name) trend buckets are cut in; empty uses the machine's local zone
+    "trend_timezone": os.getenv("TREND_TIMEZONE", ""),
+    # Local analytics database the Rally fetch layer fills and the dashboards query
+    "analytics_db_path": os.getenv("ANALYTICS_DB_PATH", DEFAULT_ANALYTICS_DB_PATH)
 }
  
-def call_openai_api(prompt: str, api_key: str, model: str = "gpt-4") -> str:
-    """Call OpenAI API with the given prompt and model"""
+# Defects carry only a handful of short fields, so RCA pages can be large
+RCA_DEFECT_PAGE_SIZE = 1000
+ 
+# Defects kept for the RCA detail table; aggregates still cover every defect
+RCA_DEFECT_TABLE_LIMIT = 1000
+ 
+# Project-wide test case loads use Rally's largest page size
+PROJECT_TEST_CASE_PAGE_SIZE = 2000
+ 
+# Story picker paging and the longest story number matched by ID prefix search
+STORY_SEARCH_PAGE_SIZE = 50
+STORY_ID_MAX_DIGITS = 7
+ 
+_upload_ledger: Optional[UploadLedger] = None
+_upload_ledger_lock = threading.Lock()
+ 
+_llm_cache: Optional[LLMResponseCache] = None
+_llm_cache_lock = threading.Lock()
+_analytics_store: Optional[AnalyticsStore] = None
+_analytics_store_lock = threading.Lock()
+ 
+def get_llm_pool() -> LLMClientPool:
+    """Return the shared LLM client pool with the limits from ``config`` applied"""
+    llm_pool.configure(
+        max_concurrency=config.get("llm_max_concurrency"),
+        tokens_per_minute=config.get("llm_tokens_per_minute"),
+        model_limits=config.get("llm_model_limits"),
+        completion_tokens=config.get("llm_completion_token_estimate")
+    )
+    return llm_pool
+ 
+def get_llm_endpoint(api_key: str, model: str) -> Tuple[Dict[str, Any], str]:
+    """
+    Provider settings and model name for a call.
+   
+    With ``llm_provider`` set to "azure" the Azure OpenAI key, endpoint and
+    deployment from ``config`` are used; otherwise OpenAI with ``api_key``.
+    """
+    if config.get("llm_provider") == "azure":
+        endpoint = {
+            "provider": "azure",
+            "api_key": config.get("azure_openai_key"),
+            "azure_endpoint": config.get("azure_openai_endpoint"),
+            "api_version": config.get("azure_openai_api_version")
+        }
+        return endpoint, config.get("azure_deployment_name") or model
+    return {"provider": "openai", "api_key": api_key}, model
+ 
+def get_llm_cache() -> Optional[LLMResponseCache]:
+    """Return the LLM response cache for the current configuration, or None when disabled"""
+    global _llm_cache
+    if not config.get("llm_cache_enabled") or not config.get("llm_cache_path"):
+        return None
+    with _llm_cache_lock:
+        if _llm_cache is None or _llm_cache.path != config["llm_cache_path"]:
+            _llm_cache = LLMResponseCache(config["llm_cache_path"])
+        _llm_cache.max_bytes = config.get("llm_cache_max_bytes", DEFAULT_LLM_CACHE_MAX_BYTES)
+        return _llm_cache
+ 
+def _cached_completion(
+    endpoint: Dict[str, Any],
+    model: str,
+    messages: List[Dict[str, Any]],
+    use_cache: bool
+) -> Tuple[Optional[LLMResponseCache], str, Optional[str]]:
+    """Look a completion up in the LLM cache; returns (cache, key, cached text)"""
+    cache = get_llm_cache() if use_cache else None
+    if cache is None:
+        return None, "", None
     try:
-        openai.api_key = api_key
-        response = openai.ChatCompletion.create(
-            model=model,  # Use the passed model parameter
-            messages=[{"role": "user", "content": prompt}]
-        )
-        return response.choices[0].message.content
+        # The API key is left out: it doesn't change the answer
+        backend = {name: value for name, value in endpoint.items() if name != "api_key"}
+        key = completion_cache_key(model, messages, backend=backend)
+        return cache, key, cache.get(key)
+    except Exception as e:
+        logging.error(f"Error reading LLM cache: {str(e)}")
+        return None, "", None
+ 
+def _store_completion(cache: Optional[LLMResponseCache], key: str, model: str, text: str) -> None:
+    if cache is None or not text:
+        return
+    try:
+        cache.set(key, model, text)
+    except Exception as e:
+        logging.error(f"Error writing LLM cache: {str(e)}")
+ 
+def stream_openai_api(prompt: str, api_key: str, model: str = "gpt-4", use_cache: bool = True) -> Iterator[str]:
+    """
+    Call OpenAI API and yield the completion text as it is generated.
+   
+    A cached completion is yielded as one chunk; a fresh one is cached once
+    the stream finishes. Errors are yielded as an ``Error: ...`` chunk,
+    mirroring ``call_openai_api``.
+    """
+    messages = [{"role": "user", "content": prompt}]
+    endpoint, model_name = get_llm_endpoint(api_key, model)
+    cache, key, cached = _cached_completion(endpoint, model_name, messages, use_cache)
+    if cached is not None:
+        yield cached
+        return
+    parts = []
+    try:
+        for chunk in get_llm_pool().stream(endpoint, model_name, messages):
+            parts.append(chunk)
+            yield chunk
+    except Exception as e:
+        logging.error(f"Error calling OpenAI API: {str(e)}")
+        yield f"Error: {str(e)}"
+        return
+    _store_completion(cache, key, model_name, "".join(parts))
+ 
+def call_openai_api(
+    prompt: str,
+    api_key: str,
+    model: str = "gpt-4",
+    stream: bool = False,
+    use_cache: bool = True,
+    budget: Optional[TokenBudget] = None
+):
+    """
+    Call OpenAI API with the given prompt and model.
+   
+    Returns the completion text, or with ``stream=True`` an iterator over
+    text chunks as they arrive (see ``stream_openai_api``). Identical
+    requests are answered from the LLM response cache unless ``use_cache``
+    is False or caching is disabled in ``config``. Calls go through the
+    shared ``LLMClientPool`` (per-model concurrency and token limits); an
+    extra ``budget`` additionally caps this caller. Cache hits are free.
+    """
+    if stream:
+        return stream_openai_api(prompt, api_key, model, use_cache)
+    messages = [{"role": "user", "content": prompt}]
+    endpoint, model_name = get_llm_endpoint(api_key, model)
+    cache, key, cached = _cached_completion(endpoint, model_name, messages, use_cache)
+    if cached is not None:
+        return cached
+    try:
+        content = get_llm_pool().complete(endpoint, model_name, messages, budget=budget)
+    except Exception as e:
+        logging.error(f"Error calling OpenAI API: {str(e)}")
+        return f"Error: {str(e)}"
+    _store_completion(cache, key, model_name, content)
+    return content
+ 
+async def acall_openai_api(
+    prompt: str,
+    api_key: str,
+    model: str = "gpt-4",
+    use_cache: bool = True,
+    budget: Optional[TokenBudget] = None
+) -> str:
+    """Awaitable ``call_openai_api`` (non-streaming) for use in coroutines"""
+    messages = [{"role": "user", "content": prompt}]
+    endpoint, model_name = get_llm_endpoint(api_key, model)
+    cache, key, cached = _cached_completion(endpoint, model_name, messages, use_cache)
+    if cached is not None:
+        return cached
+    try:
+        content = await get_llm_pool().acomplete(endpoint, model_name, messages, budget=budget)
     except Exception as e:
         logging.error(f"Error calling OpenAI API: {str(e)}")
         return f"Error: {str(e)}"
+    _store_completion(cache, key, model_name, content)
+    return content
+ 
+def get_llm_cache_stats() -> Dict[str, Any]:
+    """Hit rate and size of the LLM response cache (empty when caching is disabled)"""
+    cache = get_llm_cache()
+    return cache.stats() if cache is not None else {}
+ 
+def get_analytics_store() -> AnalyticsStore:
+    """Return the local analytics database at the configured ``analytics_db_path``"""
+    global _analytics_store
+    with _analytics_store_lock:
+        if _analytics_store is None or _analytics_store.path != config["analytics_db_path"]:
+            _analytics_store = AnalyticsStore(config["analytics_db_path"])
+        return _analytics_store
+ 
+def _analytics_scope(client: RallyClient, *parts: Any) -> str:
+    """Sync-state scope of a Rally query, e.g. a story's test cases on this endpoint"""
+    return "|".join(str(part) for part in (client.base_endpoint,) + parts)
  
 def check_rally_config() -> bool:
     """
@@ -41,67 +284,97 @@ def check_rally_config() -> bool:
     """
     return bool(config.get("rally_endpoint")) and bool(config.get("rally_api_key"))
  
+def get_rally_client() -> RallyClient:
+    """
+    Return the shared, connection-pooled Rally client for the current configuration.
+   
+    The client is cached per endpoint and API key, so every helper below reuses
+    the same keep-alive connections across calls and Streamlit reruns.
+    Throttled or failing calls are retried by the client's scheduler; the
+    helpers below let the resulting ``RallyAPIError`` reach the caller
+    instead of returning empty results.
+    """
+    response_cache.use_disk_store(config.get("rally_cache_path"))
+    return shared_client(
+        config['rally_endpoint'],
+        config['rally_api_key'],
+        pool_maxsize=config.get("rally_pool_maxsize"),
+        rate_limit=config.get("rally_rate_limit")
+    )
+ 
+def get_upload_ledger() -> UploadLedger:
+    """Return the upload ledger at the configured ``upload_ledger_path``"""
+    global _upload_ledger
+    with _upload_ledger_lock:
+        if _upload_ledger is None or _upload_ledger.path != config["upload_ledger_path"]:
+            _upload_ledger = UploadLedger(config["upload_ledger_path"])
+        return _upload_ledger
+ 
 def upload_user_story_to_rally(user_story: str, project_id: str) -> Optional[str]:
     """
     Upload a user story to Rally.
+   
+    Uploading the same story to the same project twice (e.g. a repeated
+    click) reports the existing story instead of creating a duplicate.
     """
     try:
-        base_endpoint = config['rally_endpoint'].rstrip('/')
-        if not base_endpoint.endswith('/slm/webservice/v2.0'):
-            base_endpoint = f"{base_endpoint}/slm/webservice/v2.0"
-       
-        headers = {
-            "zsessionid": config['rally_api_key'],
-            "Content-Type": "application/json"
-        }
-       
-        # Create a better story name from the first line or first few words
-        story_name = user_story.split('\n')[0][:60]  # Use first line, max 60 chars
-        if len(story_name) == 60:
-            story_name += "..."
-       
-        payload = {
-            "HierarchicalRequirement": {
-                "Name": story_name,
-                "Description": user_story,
-                "Project": f"/project/{project_id}"
-            }
-        }
-       
-        response = requests.post(
-            f"{base_endpoint}/hierarchicalrequirement/create",
-            headers=headers,
-            json=payload
+        client = get_rally_client()
+        store = get_analytics_store()
+        result = create_user_story(
+            client, get_upload_ledger(), project_id, story_name_from_text(user_story), user_story
         )
+        client.cache.invalidate("/hierarchicalrequirement", project=f"/project/{project_id}")
+        store.invalidate(_analytics_scope(client, "stories", project_id))
        
-        if response.status_code == 200:
-            response_data = response.json()
-            created_story = response_data.get('CreateResult', {}).get('Object', {})
-            formatted_id = created_story.get('FormattedID', 'Unknown')
-            return f"User story {formatted_id} successfully created"
+        if result["status"] == "created":
+            return f"User story {result['formatted_id']} successfully created"
+        elif result["status"] == "existing":
+            return f"User story {result['formatted_id']} already exists in Rally"
         else:
-            return f"Failed to upload user story. Status code: {response.status_code}"
+            return f"Failed to upload user story. {result['error']}"
            
+    except RallyAPIError:
+        raise
     except Exception as e:
         print(f"Error uploading to Rally: {str(e)}")
         return None
  
+def iter_upload_user_stories_to_rally(
+    stories: List[Dict[str, str]],
+    project_id: str
+) -> Iterator[Tuple[Dict[str, Any], int, int]]:
+    """
+    Upload a backlog of stories (dicts with ``name`` and ``description``).
+   
+    Creates run on a bounded worker pool; yields ``(result, done, total)``
+    per finished story so the caller can show progress. Each result has
+    ``index``, ``name``, ``status`` ("created", "existing" or "failed"),
+    ``formatted_id`` and ``error``.
+    """
+    client = get_rally_client()
+    store = get_analytics_store()
+    try:
+        yield from iter_create_user_stories(
+            client,
+            get_upload_ledger(),
+            project_id,
+            stories,
+            max_workers=config.get("rally_upload_workers")
+        )
+    finally:
+        # The next story list load refills the store with the new stories
+        store.invalidate(_analytics_scope(client, "stories", project_id))
+ 
 def test_rally_connection(endpoint: str, api_key: str) -> Tuple[bool, str]:
     """Test connection to Rally and validate credentials"""
     try:
-        session = requests.Session()
-        session.verify = False
-        session.headers.update({
-            "zsessionid": api_key,
-            "Content-Type": "application/json",
-            "Accept": "application/json"
-        })
-       
-        base_endpoint = endpoint.rstrip('/')
-        if not base_endpoint.endswith('/slm/webservice/v2.0'):
-            base_endpoint = f"{base_endpoint}/slm/webservice/v2.0"
-       
-        response = session.get(f"{base_endpoint}/subscription")
+        client = shared_client(
+            endpoint,
+            api_key,
+            pool_maxsize=config.get("rally_pool_maxsize"),
+            rate_limit=config.get("rally_rate_limit")
+        )
+        response = client.get("/subscription")
        
         if response.status_code == 200:
             return True, "Successfully connected to Rally"
@@ -111,58 +384,51 @@ def test_rally_connection(endpoint: str, api_key: str) -> Tuple[bool, str]:
     except Exception as e:
         return False, f"Connection error: {str(e)}"
  
+def _cache_ttl(entity: str) -> float:
+    """Configured cache TTL in seconds for a Rally entity type (0 disables caching)"""
+    return config.get("rally_cache_ttls", DEFAULT_CACHE_TTLS).get(entity, 0)
+ 
 def get_rally_workspaces() -> List[Dict[str, str]]:
     """
     Fetch available workspaces from Rally
     """
     try:
-        # Ensure endpoint is properly formatted
-        base_endpoint = config['rally_endpoint'].rstrip('/')
-        if not base_endpoint.endswith('/slm/webservice/v2.0'):
-            base_endpoint = f"{base_endpoint}/slm/webservice/v2.0"
- 
-        headers = {
-            "zsessionid": config['rally_api_key'],
-            "Content-Type": "application/json",
-            "Accept": "application/json"
-        }
+        client = get_rally_client()
        
-        response = requests.get(
-            f"{base_endpoint}/workspace",
-            headers=headers,
-            params={"fetch": "Name,ObjectID,Description"},
-            verify=True
-        )
-       
-        print(f"Workspace API Response Status: {response.status_code}")
+        try:
+            response_data = client.get_json(
+                "/workspace",
+                params={"fetch": fetch_fields("workspace", "list")},
+                ttl=_cache_ttl("workspace"),
+                verify=True
+            )
+        except RallyAPIError as e:
+            print(f"Workspace API Response Status: {e.status_code}")
+            raise
        
-        if response.status_code == 200:
-            try:
-                response_data = response.json()
-                workspaces = response_data.get('QueryResult', {}).get('Results', [])
-                workspace_list = []
-                for workspace in workspaces:
-                    # Print workspace data for debugging
-                    print(f"Processing workspace data: {workspace}")
-                   
-                    workspace_id = workspace.get('ObjectID')
-                    workspace_name = workspace.get('Name')
-                    if workspace_id and workspace_name:
-                        workspace_list.append({
-                            "id": str(workspace_id),
-                            "name": workspace_name
-                        })
-                print(f"Found workspaces: {workspace_list}")
-                return workspace_list
-            except json.JSONDecodeError as je:
-                print(f"JSON Decode Error: {str(je)}")
-                return []
-            except Exception as e:
-                print(f"Error processing workspaces: {str(e)}")
-                print(f"Full workspace data: {workspaces}")
-                return []
-        return []
+        try:
+            workspaces = response_data.get('QueryResult', {}).get('Results', [])
+            workspace_list = []
+            for workspace in workspaces:
+                # Print workspace data for debugging
+                print(f"Processing workspace data: {workspace}")
+               
+                workspace_id = workspace.get('ObjectID')
+                workspace_name = workspace.get('Name')
+                if workspace_id and workspace_name:
+                    workspace_list.append({
+                        "id": str(workspace_id),
+                        "name": workspace_name
+                    })
+            print(f"Found workspaces: {workspace_list}")
+            return workspace_list
+        except Exception as e:
+            print(f"Error processing workspaces: {str(e)}")
+            print(f"Full workspace data: {response_data}")
+            return []
            
+    except RallyAPIError:
+        raise
     except Exception as e:
         print(f"Error fetching workspaces: {str(e)}")
         return []
@@ -172,36 +438,23 @@ def get_rally_projects(workspace_id: str) -> List[Dict[str, str]]:
     Fetch available projects for a workspace from Rally
     """
     try:
-        # Ensure endpoint is properly formatted
-        base_endpoint = config['rally_endpoint'].rstrip('/')
-        if not base_endpoint.endswith('/slm/webservice/v2.0'):
-            base_endpoint = f"{base_endpoint}/slm/webservice/v2.0"
-       
-        # Remove any hash fragments from the URL
-        base_endpoint = base_endpoint.split('#')[0]
-       
-        headers = {
-            "zsessionid": config['rally_api_key'],
-            "Content-Type": "application/json",
-            "Accept": "application/json"
-        }
+        client = get_rally_client()
        
         # First get the workspace details
-        workspace_url = f"{base_endpoint}/workspace/{workspace_id}"
+        workspace_url = client.url(f"/workspace/{workspace_id}")
         print(f"Fetching workspace details from: {workspace_url}")
        
-        workspace_response = requests.get(
-            workspace_url,
-            headers=headers,
-            verify=True
-        )
-       
-        if workspace_response.status_code != 200:
-            print(f"Failed to fetch workspace. Status: {workspace_response.status_code}")
-            return []
+        try:
+            workspace_data = client.get_json(
+                f"/workspace/{workspace_id}",
+                ttl=_cache_ttl("workspace"),
+                verify=True
+            )
+        except RallyAPIError as e:
+            print(f"Failed to fetch workspace. Status: {e.status_code}")
+            raise
            
         try:
-            workspace_data = workspace_response.json()
             workspace_ref = workspace_data.get('Workspace', {}).get('_ref', '')
            
             if not workspace_ref:
@@ -209,322 +462,331 @@ def get_rally_projects(workspace_id: str) -> List[Dict[str, str]]:
                 return []
                
             # Now fetch projects using the workspace reference
-            query_url = f"{base_endpoint}/project"
             params = {
                 "workspace": workspace_ref,
-                "fetch": "Name,ObjectID,Description",
+                "fetch": fetch_fields("project", "list"),
                 "pagesize": 100
             }
            
-            print(f"Querying projects with URL: {query_url}")
+            print(f"Querying projects with URL: {client.url('/project')}")
             print(f"Query parameters: {params}")
            
-            response = requests.get(
-                query_url,
-                headers=headers,
+            response_data = client.get_json(
+                "/project",
                 params=params,
+                ttl=_cache_ttl("project"),
                 verify=True
             )
            
-            print(f"Projects API Response Status: {response.status_code}")
-            print(f"Full URL called: {response.url}")
+            if 'Errors' in response_data.get('QueryResult', {}) and response_data['QueryResult']['Errors']:
+                print(f"API returned errors: {response_data['QueryResult']['Errors']}")
+                return []
            
-            if response.status_code == 200:
-                response_data = response.json()
-                if 'Errors' in response_data.get('QueryResult', {}) and response_data['QueryResult']['Errors']:
-                    print(f"API returned errors: {response_data['QueryResult']['Errors']}")
-                    return []
-               
-                projects = response_data.get('QueryResult', {}).get('Results', [])
-                project_list = []
-                for project in projects:
-                    project_id = project.get('ObjectID') or project.get('_ref', '').split('/')[-1]
-                    project_name = project.get('Name', 'Unknown Project')
-                    project_list.append({
-                        "id": project_id,
-                        "name": project_name
-                    })
-                print(f"Found projects: {project_list}")
-                return project_list
+            projects = response_data.get('QueryResult', {}).get('Results', [])
+            project_list = []
+            for project in projects:
+                project_id = project.get('ObjectID') or project.get('_ref', '').split('/')[-1]
+                project_name = project.get('Name', 'Unknown Project')
+                project_list.append({
+                    "id": project_id,
+                    "name": project_name
+                })
+            print(f"Found projects: {project_list}")
+            return project_list
                
-        except json.JSONDecodeError as je:
-            print(f"JSON Decode Error: {str(je)}")
-            print(f"Response content: {workspace_response.text}")
-            return []
+        except RallyAPIError as e:
+            print(f"Projects API Response Status: {e.status_code}")
+            print(f"Full URL called: {e.url}")
+            raise
         except Exception as e:
             print(f"Error processing response: {str(e)}")
-            print(f"Response content: {workspace_response.text}")
+            print(f"Workspace data: {workspace_data}")
             return []
            
+    except RallyAPIError:
+        raise
     except Exception as e:
         print(f"Error fetching projects: {str(e)}")
         print(f"Full error: {str(e.__class__.__name__)}: {str(e)}")
         return []
  
 def get_rally_user_stories(workspace_id: str, project_id: str) -> List[Dict[str, Any]]:
-    """Fetch user stories from Rally"""
+    """
+    Fetch every user story of a project, newest first.
+   
+    Only FormattedID, Name and ObjectID are fetched; use
+    ``get_user_story_description`` to load the description of the stories
+    that are actually needed. Pages are fetched concurrently and cached.
+    """
     try:
-        base_endpoint = config['rally_endpoint'].rstrip('/')
-        if not base_endpoint.endswith('/slm/webservice/v2.0'):
-            base_endpoint = f"{base_endpoint}/slm/webservice/v2.0"
-       
-        headers = {
-            "zsessionid": config['rally_api_key'],
-            "Content-Type": "application/json",
-            "Accept": "application/json"
-        }
+        client = get_rally_client()
        
         params = {
             "workspace": f"/workspace/{workspace_id}",
             "project": f"/project/{project_id}",
-            "fetch": "Name,Description,FormattedID,ObjectID,PlanEstimate,Owner,Tags",
-            "pagesize": 100,
+            "fetch": fetch_fields("hierarchicalrequirement", "list"),
             "order": "CreationDate DESC"
         }
        
-        print(f"Fetching user stories from: {base_endpoint}/hierarchicalrequirement")
+        print(f"Fetching user stories from: {client.url('/hierarchicalrequirement')}")
         print(f"Query parameters: {params}")
        
-        response = requests.get(
-            f"{base_endpoint}/hierarchicalrequirement",
-            headers=headers,
-            params=params,
-            verify=False
-        )
-       
-        print(f"User Stories API Response Status: {response.status_code}")
-        print(f"Full URL called: {response.url}")
+        try:
+            stories = client.query_all(
+                "/hierarchicalrequirement",
+                params=params,
+                max_workers=config.get("rally_query_workers"),
+                ttl=_cache_ttl("hierarchicalrequirement")
+            )
+        except RallyAPIError as e:
+            print(f"User Stories API Response Status: {e.status_code}")
+            print(f"Full URL called: {e.url}")
+            raise
        
-        if response.status_code == 200:
-            response_data = response.json()
-            stories = response_data.get('QueryResult', {}).get('Results', [])
-            story_list = []
-            for story in stories:
-                story_id = story.get('FormattedID', '')
-                story_name = story.get('Name', 'Untitled Story')
-                story_desc = story.get('Description', '')
-               
-                # Create a formatted story entry
-                story_list.append({
-                    "id": story_id,  # Changed to use FormattedID instead of ObjectID
-                    "formatted_id": story_id,
-                    "name": story_name,
-                    "description": story_desc,
-                    "display_name": f"{story_id}: {story_name}"
-                })
+        story_list = []
+        for story in stories:
+            story_id = story.get('FormattedID', '')
+            story_name = story.get('Name', 'Untitled Story')
            
-            print(f"Found {len(story_list)} user stories")
-            return story_list
+            # Create a formatted story entry
+            story_list.append({
+                "id": story_id,  # Changed to use FormattedID instead of ObjectID
+                "formatted_id": story_id,
+                "object_id": str(story.get('ObjectID', '')),
+                "name": story_name,
+                "display_name": f"{story_id}: {story_name}"
+            })
+       
+        print(f"Found {len(story_list)} user stories")
+        # Rewrite the stored list at most once per TTL, not on every cache hit
+        store = get_analytics_store()
+        scope = _analytics_scope(client, "stories", project_id)
+        if not store.synced_within(scope, _cache_ttl("hierarchicalrequirement")):
+            store.replace_stories(scope, workspace_id, project_id, stories)
+        return story_list
            
+    except RallyAPIError:
+        raise
     except Exception as e:
         print(f"Error fetching user stories: {str(e)}")
         return []
  
-def get_user_story_test_data(workspace_id: str, project_id: str, story_id: str) -> Dict[str, Any]:
+def _rally_string(value: str) -> str:
+    """Quote a value for use in a Rally query expression"""
+    return '"' + value.replace('\\', '\\\\').replace('"', '\\"') + '"'
+ 
+def _combine_rally_query(clauses: List[str], operator: str = "AND") -> str:
+    """Join query clauses; Rally requires every binary expression to be parenthesised"""
+    query = ""
+    for clause in clauses:
+        query = clause if not query else f"({query} {operator} {clause})"
+    return query
+ 
+def _formatted_id_prefix_query(digits: str, max_digits: int = STORY_ID_MAX_DIGITS) -> str:
+    """
+    Match FormattedIDs whose number starts with ``digits`` (e.g. 12 -> 12, 120-129,
+    1200-1299, ...), expressed as numeric ranges Rally can evaluate server side.
+    Story numbers never start with 0, so ``digits`` with a leading zero (or all
+    zeros) only match that exact number instead of every ID.
+    """
+    number = int(digits)
+    if digits.startswith("0"):
+        return f"(FormattedID = {number})"
+    ranges = []
+    for extra in range(max(max_digits - len(digits), 0) + 1):
+        low = number * 10 ** extra
+        high = (number + 1) * 10 ** extra - 1
+        if low == high:
+            ranges.append(f"(FormattedID = {low})")
+        else:
+            ranges.append(f"((FormattedID >= {low}) AND (FormattedID <= {high}))")
+    return _combine_rally_query(ranges, "OR")
+ 
+def search_rally_user_stories(
+    workspace_id: str,
+    project_id: str,
+    search: str = "",
+    iteration: str = "",
+    owner: str = "",
+    cursor: Optional[int] = None,
+    page_size: int = STORY_SEARCH_PAGE_SIZE
+) -> Dict[str, Any]:
+    """
+    Search user stories with Rally-side filters, one page at a time.
+   
+    ``search`` matches story names (contains) and, when it looks like an ID
+    such as ``US12`` or ``12``, FormattedIDs starting with that number.
+    ``iteration`` and ``owner`` match the iteration name and owner display
+    name. ``cursor`` is the opaque value returned as ``next_cursor`` by the
+    previous page.
+   
+    Returns:
+        Dict with ``stories`` (same shape as ``get_rally_user_stories``),
+        ``next_cursor`` (None on the last page) and ``total``
+    """
+    result = {"stories": [], "next_cursor": None, "total": 0}
     try:
-        session = requests.Session()
-        session.verify = False
-        session.headers.update({
-            "zsessionid": config['rally_api_key'],
-            "Content-Type": "application/json",
-            "Accept": "application/json"
-        })
+        client = get_rally_client()
        
-        base_endpoint = config['rally_endpoint'].rstrip('/')
-        if not base_endpoint.endswith('/slm/webservice/v2.0'):
-            base_endpoint = f"{base_endpoint}/slm/webservice/v2.0"
+        clauses = []
+        search = (search or "").strip()
+        if search:
+            search_clause = f"(Name contains {_rally_string(search)})"
+            id_match = re.fullmatch(r"(?i)(?:US)?(\d+)", search)
+            if id_match:
+                search_clause = f"({search_clause} OR {_formatted_id_prefix_query(id_match.group(1))})"
+            clauses.append(search_clause)
+        if iteration and iteration.strip():
+            clauses.append(f"(Iteration.Name contains {_rally_string(iteration.strip())})")
+        if owner and owner.strip():
+            clauses.append(f"(Owner.DisplayName contains {_rally_string(owner.strip())})")
        
-        # Initialize default test data structure
-        test_data = {
-            "total_tests": 0,
-            "passed": 0,
-            "failed": 0,
-            "other": 0,
-            "test_cases": [],
-            "defects": [],
-            "pass_percentage": 0,
-            "statistics": {},
-            "failure_trend": {},
-            "daily_trend": {}
+        start = int(cursor or 1)
+        params = {
+            "workspace": f"/workspace/{workspace_id}",
+            "project": f"/project/{project_id}",
+            "fetch": fetch_fields("hierarchicalrequirement", "list"),
+            "order": "CreationDate DESC"
         }
+        if clauses:
+            params["query"] = _combine_rally_query(clauses)
        
-        # Fetch all test cases with pagination
-        all_test_cases = []
-        start = 1
-        page_size = 200
+        page = client.query_page(
+            "/hierarchicalrequirement",
+            params,
+            start=start,
+            page_size=page_size,
+            ttl=_cache_ttl("hierarchicalrequirement")
+        )
        
-        while True:
-            test_case_params = {
-                "workspace": f"/workspace/{workspace_id}",
-                "project": f"/project/{project_id}",
-                "query": f"(WorkProduct.FormattedID = \"{story_id}\")",
-                "fetch": ("FormattedID,Name,LastVerdict,LastRun,ObjectID,Type,Duration,Method," +
-                        "Priority,Owner,TestCaseStatus,LastBuild,LastResult,Results," +
-                        "LastRun,LastResultDate,LastUpdateDate"),
-                "pagesize": page_size,
-                "start": start,
-                "order": "FormattedID ASC"
-            }
-           
-            print(f"Fetching test cases for story {story_id}")
-            print(f"Query parameters: {test_case_params}")
-           
-            test_case_response = session.get(
-                f"{base_endpoint}/testcase",
-                params=test_case_params
-            )
-           
-            if test_case_response.status_code == 200:
-                result_data = test_case_response.json().get('QueryResult', {})
-                page_test_cases = result_data.get('Results', [])
-                total_results = result_data.get('TotalResultCount', 0)
-               
-                print(f"Found {len(page_test_cases)} test cases on this page")
-                print(f"Total results available: {total_results}")
-               
-                if not page_test_cases:
-                    break
-                   
-                all_test_cases.extend(page_test_cases)
-               
-                if len(all_test_cases) >= total_results:
-                    break
-                   
-                start += page_size
-            else:
-                print(f"Error fetching test cases: {test_case_response.status_code}")
-                print(f"Response: {test_case_response.text}")
-                break
+        for story in page.get('Results', []):
+            story_id = story.get('FormattedID', '')
+            story_name = story.get('Name', 'Untitled Story')
+            result["stories"].append({
+                "id": story_id,
+                "formatted_id": story_id,
+                "object_id": str(story.get('ObjectID', '')),
+                "name": story_name,
+                "display_name": f"{story_id}: {story_name}"
+            })
+       
+        result["total"] = page.get('TotalResultCount', 0)
+        if start + page_size <= result["total"]:
+            result["next_cursor"] = start + page_size
+        return result
        
-        # Add debug logging
+    except RallyAPIError:
+        raise
+    except Exception as e:
+        print(f"Error searching user stories: {str(e)}")
+        return result
+ 
+def get_user_story_description(story_object_id: str) -> str:
+    """
+    Fetch the description of a single user story on demand.
+   
+    Results are cached like other story metadata, so switching back and forth
+    between stories in a selector does not refetch them.
+    """
+    try:
+        client = get_rally_client()
+        response_data = client.get_json(
+            f"/hierarchicalrequirement/{story_object_id}",
+            params={"fetch": fetch_fields("hierarchicalrequirement", "description")},
+            ttl=_cache_ttl("hierarchicalrequirement")
+        )
+        return response_data.get('HierarchicalRequirement', {}).get('Description', '') or ''
+    except RallyAPIError:
+        raise
+    except Exception as e:
+        print(f"Error fetching description for story {story_object_id}: {str(e)}")
+        return ""
+ 
+def _fetch_story_test_cases(client: RallyClient, workspace_id: str, project_id: str, story_id: str) -> List[Dict[str, Any]]:
+    """All test cases of a story; pages after the first are fetched concurrently"""
+    test_case_params = {
+        "workspace": f"/workspace/{workspace_id}",
+        "project": f"/project/{project_id}",
+        "query": f"(WorkProduct.FormattedID = \"{story_id}\")",
+        "fetch": fetch_fields("testcase", "analytics"),
+        "order": "FormattedID ASC"
+    }
+    print(f"Query parameters: {test_case_params}")
+    if config.get("rally_delta_sync"):
+        return sync_story_test_cases(
+            client,
+            workspace_id,
+            project_id,
+            story_id,
+            fetch=test_case_params["fetch"],
+            min_interval=_cache_ttl("testcase"),
+            max_workers=config.get("rally_query_workers")
+        )
+    return client.query_all(
+        "/testcase",
+        params=test_case_params,
+        page_size=200,
+        max_workers=config.get("rally_query_workers"),
+        ttl=_cache_ttl("testcase")
+    )
+ 
+def _load_story_test_cases(client: RallyClient, workspace_id: str, project_id: str, story_id: str) -> AnalyticsStore:
+    """
+    Make sure the analytics store holds a story's current test cases.
+
+    Rally is only asked again once the stored copy (from this story or a
+    project-wide load) is older than the test case cache TTL; returns the
+    store.
+    """
+    store = get_analytics_store()
+    scope = _analytics_scope(client, "testcases", project_id, story_id)
+    ttl = _cache_ttl("testcase")
+    # A recent project-wide load covers every story in the project
+    if not (store.synced_within(scope, ttl) or store.synced_within(_analytics_scope(client, "testcases", project_id), ttl)):
         print(f"Fetching test cases for story {story_id}")
-        print(f"Total test cases found: {len(all_test_cases)}")
+        try:
+            test_cases = _fetch_story_test_cases(client, workspace_id, project_id, story_id)
+        except RallyAPIError as e:
+            print(f"Error fetching test cases: {str(e)}")
+            raise
+        store.replace_story_test_cases(scope, workspace_id, project_id, story_id, test_cases)
+    return store
+ 
+def get_user_story_test_data(
+    workspace_id: str,
+    project_id: str,
+    story_id: str,
+    trend_days: int = FAILURE_TREND_DAYS,
+    granularity: str = "day"
+) -> Dict[str, Any]:
+    """
+    Test case counts and failure trend for a story.
+
+    The failure trend covers the last ``trend_days`` days, bucketed by day,
+    week or month in the configured ``trend_timezone``.
+    """
+    try:
+        client = get_rally_client()
+       
+        # Initialize default test data structure
+        test_data = empty_test_data()
+       
+        store = _load_story_test_cases(client, workspace_id, project_id, story_id)
+        frame = store.story_test_case_frame(project_id, story_id)
+        print(f"Total test cases found: {len(frame)}")
        
         # Add better error handling for test case fetching
-        if not all_test_cases:
+        if frame.empty:
             print(f"No test cases found for story {story_id}")
             return test_data
  
-        test_data["total_tests"] = len(all_test_cases)
-       
-        # Process test cases with better error handling
-        for test_case in all_test_cases:
-            try:
-                # Safely get test case data with better error handling
-                if not isinstance(test_case, dict):
-                    print(f"Invalid test case data format: {test_case}")
-                    continue
- 
-                test_case_id = test_case.get('FormattedID')
-                if not test_case_id:
-                    print("Missing test case ID, skipping...")
-                    continue
- 
-                print(f"Processing test case: {test_case_id}")
-               
-                # Get LastVerdict directly from LastResult if available
-                last_result = test_case.get('LastResult', {})
-                if isinstance(last_result, dict):
-                    verdict = last_result.get('Verdict', test_case.get('LastVerdict', 'No Run'))
-                else:
-                    verdict = test_case.get('LastVerdict', 'No Run')
- 
-                # Safely get all test case attributes with defaults
-                test_case_data = {
-                    "test_case_id": test_case_id,
-                    "test_case_name": test_case.get('Name', 'Unnamed Test'),
-                    "tcr_id": test_case.get('ObjectID', 'N/A'),
-                    "date_time": test_case.get('LastRun', 'N/A'),
-                    "verdict": verdict,
-                    "LastBuild": test_case.get('LastBuild', 'Unknown'),
-                    "Duration": test_case.get('Duration', 'N/A'),
-                    "Owner": (test_case.get('Owner', {}) or {}).get('_refObjectName', 'Unassigned'),
-                    "Results": test_case.get('Results', [])
-                }
- 
-                # Update counters based on verdict
-                if verdict == 'Pass':
-                    test_data["passed"] += 1
-                elif verdict == 'Fail':
-                    test_data["failed"] += 1
-                    print(f"Found failed test: {test_case_id}")  # Debug logging
-                else:
-                    test_data["other"] += 1
-               
-                # Add test case to the list
-                test_data["test_cases"].append(test_case_data)
-               
-            except Exception as e:
-                print(f"Error processing test case {test_case.get('FormattedID', 'Unknown')}: {str(e)}")
-                print(f"Test case data: {test_case}")
-                continue
- 
-        # Calculate pass percentage safely
-        total_tests = len(test_data["test_cases"])
-        test_data["total_tests"] = total_tests
-        if total_tests > 0:
-            test_data["pass_percentage"] = (test_data["passed"] / total_tests) * 100
- 
-        # Initialize and calculate failure trends with better error handling
-        today = datetime.now()
-        for i in range(10):
-            date = (today - timedelta(days=i)).strftime('%Y-%m-%d')
-            test_data["failure_trend"][date] = {
-                "total": 0,
-                "failed": 0,
-                "failure_rate": 0,
-                "failure_details": []
-            }
- 
-        # Process test results for trend with better error handling
-        for test_case in test_data["test_cases"]:
-            try:
-                date_time = test_case.get("date_time")
-                if date_time and date_time != 'N/A':
-                    # Handle different date formats
-                    try:
-                        if 'T' in date_time:
-                            date = date_time.split('T')[0]
-                        else:
-                            # Try to parse the date if it's in a different format
-                            parsed_date = datetime.strptime(date_time, '%Y-%m-%d')
-                            date = parsed_date.strftime('%Y-%m-%d')
-                    except ValueError:
-                        print(f"Invalid date format: {date_time}")
-                        continue
- 
-                    if date in test_data["failure_trend"]:
-                        test_data["failure_trend"][date]["total"] += 1
-                        if test_case["verdict"] == 'Fail':
-                            test_data["failure_trend"][date]["failed"] += 1
-                            # Add more detailed failure information
-                            failure_detail = {
-                                "test_case_id": test_case["test_case_id"],
-                                "test_case_name": test_case["test_case_name"],
-                                "build": test_case.get("LastBuild", "Unknown"),
-                                "execution_time": test_case.get("Duration", "N/A"),
-                                "owner": test_case.get("Owner", "Unassigned")
-                            }
-                           
-                            # Add to failure details if not already present
-                            if failure_detail not in test_data["failure_trend"][date]["failure_details"]:
-                                test_data["failure_trend"][date]["failure_details"].append(failure_detail)
-                                print(f"Added failure detail for test {test_case['test_case_id']} on {date}")  # Debug logging
- 
-            except Exception as e:
-                print(f"Error processing trend data for test case {test_case.get('test_case_id', 'Unknown')}: {str(e)}")
-                continue
- 
-        # Calculate failure rates safely
-        for date in test_data["failure_trend"]:
-            try:
-                total = test_data["failure_trend"][date]["total"]
-                failed = test_data["failure_trend"][date]["failed"]
-                if total > 0:
-                    test_data["failure_trend"][date]["failure_rate"] = (failed / total) * 100
-            except Exception as e:
-                print(f"Error calculating failure rate for date {date}: {str(e)}")
-                continue
+        # One columnar pass over the stored rows; counts and trends are group-bys
+        test_data = aggregate_test_data(
+            frame,
+            trend_days=trend_days,
+            granularity=granularity,
+            tz=config.get("trend_timezone") or None
+        )
  
         print(f"Final test data summary:")
         print(f"Total Tests: {test_data['total_tests']}")
@@ -535,99 +797,310 @@ def get_user_story_test_data(workspace_id: str, project_id: str, story_id: str)
  
         return test_data
  
+    except RallyAPIError:
+        raise
     except Exception as e:
         logging.error(f"Error fetching test data: {str(e)}")
-        return {
-            "total_tests": 0,
-            "passed": 0,
-            "failed": 0,
-            "other": 0,
-            "test_cases": [],
-            "defects": [],
-            "pass_percentage": 0,
-            "statistics": {},
-            "failure_trend": {},
-            "daily_trend": {}
-        }
+        return empty_test_data()
  
-def get_project_rca_data(workspace_id: str, project_id: str) -> Dict[str, Any]:
-    """Fetch defects and their root causes for RCA analysis"""
+def get_project_test_data(
+    workspace_id: str,
+    project_id: str,
+    trend_days: int = FAILURE_TREND_DAYS,
+    granularity: str = "day",
+    limit: int = 10
+) -> Dict[str, Any]:
+    """
+    Test case counts and failure trend across every story of a project.
+
+    All test cases linked to a story are loaded with one paged,
+    project-scoped query (pages fetched concurrently) into the analytics
+    store instead of one query per story; the result has the same shape as
+    ``get_user_story_test_data`` plus the ``worst_stories``,
+    ``worst_owners`` and ``hot_spots`` rollups of
+    ``story_test_analytics.project_failure_rollups``.
+   
+    Raises:
+        RallyAPIError: if the test cases fail to load
+    """
     try:
-        base_endpoint = config['rally_endpoint'].rstrip('/')
-        if not base_endpoint.endswith('/slm/webservice/v2.0'):
-            base_endpoint = f"{base_endpoint}/slm/webservice/v2.0"
-       
-        headers = {
-            "zsessionid": config['rally_api_key'],
-            "Content-Type": "application/json"
-        }
+        client = get_rally_client()
+        store = get_analytics_store()
+        scope = _analytics_scope(client, "testcases", project_id)
+        if not store.synced_within(scope, _cache_ttl("testcase")):
+            params = {
+                "workspace": f"/workspace/{workspace_id}",
+                "project": f"/project/{project_id}",
+                "query": "(WorkProduct != null)",
+                "fetch": fetch_fields("testcase", "project_analytics"),
+                "order": "FormattedID ASC"
+            }
+            print(f"Fetching test cases for every story in project {project_id}")
+            test_cases = client.query_all(
+                "/testcase",
+                params=params,
+                page_size=PROJECT_TEST_CASE_PAGE_SIZE,
+                max_workers=config.get("rally_query_workers"),
+                ttl=_cache_ttl("testcase")
+            )
+            store.replace_project_test_cases(scope, workspace_id, project_id, test_cases)
+   
+        frame = store.project_test_case_frame(project_id)
+        print(f"Total test cases found in project {project_id}: {len(frame)}")
+        tz = config.get("trend_timezone") or None
+        test_data = aggregate_test_data(frame[TEST_CASE_COLUMNS], trend_days=trend_days, granularity=granularity, tz=tz)
+        test_data.update(project_failure_rollups(frame, trend_days=trend_days, granularity=granularity, tz=tz, limit=limit))
+        return test_data
+           
+    except RallyAPIError:
+        raise
+    except Exception as e:
+        logging.error(f"Error fetching project test data: {str(e)}")
+        return dict(empty_test_data(), worst_stories=[], worst_owners=[], hot_spots={})
+ 
+def get_user_story_test_history(
+    workspace_id: str,
+    project_id: str,
+    story_id: str,
+    trend_days: int = FAILURE_TREND_DAYS,
+    granularity: str = "day"
+) -> Dict[str, Any]:
+    """
+    Run-history analytics for a story's test cases.
+
+    Test case results are loaded in bulk into the analytics store; after the
+    first load only results dated on or after the story's newest stored run
+    are fetched, and only once the last sync is older than the
+    ``testcaseresult`` cache TTL. Statistics are computed over the story's
+    stored runs. Unlike ``get_user_story_test_data`` (which reads each test
+    case's ``LastVerdict``), every recorded run counts.
+
+    Returns:
+        Dict with ``runs`` and ``failed`` run totals, a ``trend`` of
+        ``{bucket: {total, failed, failure_rate, failing_tests}}`` and
+        ``test_cases``: per test case ``runs``, ``failures``,
+        ``failure_rate``, ``flakiness`` and last verdict, most failures first
+
+    Raises:
+        RallyAPIError: if the test cases or their results fail to load
+    """
+    client = get_rally_client()
+    store = _load_story_test_cases(client, workspace_id, project_id, story_id)
+    test_cases = {
+        str(row["tcr_id"]): row
+        for row in store.story_test_case_frame(project_id, story_id).to_dict("records")
+    }
+    scope = _analytics_scope(client, "results", project_id, story_id)
+    if not store.synced_within(scope, _cache_ttl("testcaseresult")):
+        since = store.latest_result_date(project_id, story_id)
+        results_by_oid = fetch_test_case_results(
+            client,
+            workspace_id,
+            story_id=story_id,
+            since=since,
+            max_workers=config.get("rally_query_workers")
+        )
+        rows = result_rows((result for results in results_by_oid.values() for result in results), story_id)
+        store.add_results(workspace_id, project_id, rows)
+        store.mark_synced(scope)
+        print(f"Loaded {len(rows)} test results for story {story_id} (since {since or 'the beginning'})")
+
+    history = ResultHistory()
+    history.add_rows(store.story_results(project_id, story_id))
+    tz = config.get("trend_timezone") or None
+    stats = history.test_case_stats(story_id, test_cases.keys())
+    stats = stats.sort_values(["failures", "flakiness"], ascending=False)
+    return {
+        "runs": int(stats["runs"].sum()),
+        "failed": int(stats["failures"].sum()),
+        "trend": history.trend(trend_days, granularity, tz, story_id=story_id, test_case_oids=test_cases.keys()),
+        "test_cases": [
+            {
+                "test_case_id": test_cases[oid]["test_case_id"],
+                "test_case_name": test_cases[oid]["test_case_name"],
+                "runs": int(row.runs),
+                "failures": int(row.failures),
+                "failure_rate": float(row.failure_rate),
+                "flakiness": float(row.flakiness),
+                "last_verdict": row.last_verdict,
+                "last_run": row.last_run.isoformat() if not pd.isna(row.last_run) else 'N/A'
+            }
+            for oid, row in stats.iterrows()
+        ]
+    }
+ 
+def get_project_top_failing_tests(project_id: str, limit: int = 10, since: Optional[str] = None) -> List[Dict[str, Any]]:
+    """
+    Test cases with the most failed runs across every story of a project.
+
+    Answered from the analytics store without calling Rally, so it covers
+    the stories whose run history has been loaded.
+    """
+    try:
+        return get_analytics_store().top_failing_tests(project_id, limit, since)
+    except Exception as e:
+        logging.error(f"Error reading failing tests: {str(e)}")
+        return []
+ 
+def get_user_story_defects(workspace_id: str, project_id: str, story_id: str) -> List[Dict[str, Any]]:
+    """Fetch the defects linked to a user story"""
+    try:
+        client = get_rally_client()
        
-        # Fetch all defects for the project with RCA information
-        defect_query_url = f"{base_endpoint}/defect"
         defect_params = {
             "workspace": f"/workspace/{workspace_id}",
-            "query": f"(Project.ObjectID = {project_id})",
-            "fetch": "ObjectID,Name,State,Priority,Severity,c_RCARootCauseUS,CreationDate",
-            "pagesize": 200,
+            "project": f"/project/{project_id}",
+            "query": f"(Requirement.FormattedID = \"{story_id}\")",
+            "fetch": fetch_fields("defect", "list"),
             "order": "CreationDate DESC"
         }
        
-        response = requests.get(
-            defect_query_url,
-            headers=headers,
+        defects = client.query_all(
+            "/defect",
             params=defect_params,
-            verify=False
+            max_workers=config.get("rally_query_workers"),
+            ttl=_cache_ttl("defect")
         )
        
-        if response.status_code == 200:
-            defects = response.json().get('QueryResult', {}).get('Results', [])
-           
-            rca_data = {
-                "defects": [],
-                "rca_summary": {},
-                "monthly_trend": {},
-                "severity_distribution": {},
-                "priority_distribution": {},
-                "state_distribution": {}
+        return [
+            {
+                "defect_id": defect.get('FormattedID', ''),
+                "name": defect.get('Name', 'Unnamed Defect'),
+                "priority": defect.get('Priority', 'None'),
+                "severity": defect.get('Severity', 'None'),
+                "state": defect.get('State', 'None'),
+                "creation_date": defect.get('CreationDate', '').split('T')[0]
             }
+            for defect in defects
+        ]
+       
+    except RallyAPIError:
+        raise
+    except Exception as e:
+        print(f"Error fetching defects for story {story_id}: {str(e)}")
+        return []
+ 
+def _empty_rca_data() -> Dict[str, Any]:
+    return {
+        "total_defects": 0,
+        "defects": [],
+        "rca_summary": {},
+        "monthly_trend": {},
+        "severity_distribution": {},
+        "priority_distribution": {},
+        "state_distribution": {}
+    }
+ 
+def _add_defects_to_rca_data(rca_data: Dict[str, Any], defects: List[Dict[str, Any]]) -> None:
+    """Fold one page of raw Rally defects into the running RCA aggregates (keeping at most ``RCA_DEFECT_TABLE_LIMIT`` defects)"""
+    # Month buckets for the whole page in one pass, in the configured time zone
+    months = bucket_labels(
+        [defect.get('CreationDate') for defect in defects],
+        "month",
+        config.get("trend_timezone") or None
+    ).tolist()
+    rca_data["total_defects"] += len(defects)
+    for defect, month in zip(defects, months):
+        creation_date = defect.get('CreationDate', '').split('T')[0]
+        root_cause = defect.get('c_RCARootCauseUS', 'Unspecified')
+        severity = defect.get('Severity', 'None')
+        priority = defect.get('Priority', 'None')
+        state = defect.get('State', 'None')
+       
+        # Add to defects list
+        if len(rca_data["defects"]) < RCA_DEFECT_TABLE_LIMIT:
+            rca_data["defects"].append({
+                "name": defect.get('Name', 'Unnamed Defect'),
+                "root_cause": root_cause,
+                "severity": severity,
+                "priority": priority,
+                "state": state,
+                "creation_date": creation_date
+            })
+       
+        # Update RCA summary
+        rca_data["rca_summary"][root_cause] = rca_data["rca_summary"].get(root_cause, 0) + 1
+       
+        # Update monthly trend
+        month = month or creation_date[:7]
+        if month not in rca_data["monthly_trend"]:
+            rca_data["monthly_trend"][month] = {}
+        rca_data["monthly_trend"][month][root_cause] = \
+            rca_data["monthly_trend"][month].get(root_cause, 0) + 1
+       
+        # Update distributions
+        rca_data["severity_distribution"][severity] = \
+            rca_data["severity_distribution"].get(severity, 0) + 1
+        rca_data["priority_distribution"][priority] = \
+            rca_data["priority_distribution"].get(priority, 0) + 1
+        rca_data["state_distribution"][state] = \
+            rca_data["state_distribution"].get(state, 0) + 1
+ 
+def iter_project_rca_data(workspace_id: str, project_id: str) -> Iterator[Tuple[Dict[str, Any], int, int]]:
+    """
+    Stream RCA aggregates for a project page by page.
+   
+    Every defect page returned by Rally is folded into the running aggregates,
+    staged in the analytics store and discarded, then ``(rca_data, loaded,
+    total)`` is yielded so callers can render partial results while the
+    remaining pages are still in flight. The same ``rca_data`` dict is updated
+    in place on each step; it counts every defect but keeps only the first
+    ``RCA_DEFECT_TABLE_LIMIT`` of them, so memory doesn't grow with the
+    project. While the stored copy is younger than the defect cache TTL it is
+    aggregated in SQL and yielded as a single step instead.
+   
+    Raises:
+        RallyAPIError: if any defect page fails to load
+    """
+    client = get_rally_client()
+    store = get_analytics_store()
+    scope = _analytics_scope(client, "defects", project_id)
+    tz = config.get("trend_timezone") or None
+    if store.synced_within(scope, _cache_ttl("defect")):
+        rca_data = store.project_rca_data(project_id, tz, RCA_DEFECT_TABLE_LIMIT)
+        yield rca_data, rca_data["total_defects"], rca_data["total_defects"]
+        return
+   
+    # Fetch all defects for the project with RCA information
+    defect_params = {
+        "workspace": f"/workspace/{workspace_id}",
+        "query": f"(Project.ObjectID = {project_id})",
+        "fetch": fetch_fields("defect", "analytics"),
+        "order": "CreationDate DESC"
+    }
+   
+    rca_data = _empty_rca_data()
+    # Pages are staged and swapped in at the end, so an abandoned or failed
+    # load leaves the previous defect set (and its sync time) untouched
+    load_id = store.begin_defect_load()
+    loaded = 0
+    try:
+        for page in client.iter_query_pages(
+            "/defect",
+            params=defect_params,
+            page_size=RCA_DEFECT_PAGE_SIZE,
+            max_workers=config.get("rally_query_workers"),
+            ttl=_cache_ttl("defect")
+        ):
+            defects = page.get('Results', [])
+            _add_defects_to_rca_data(rca_data, defects)
+            store.stage_defects(load_id, [defect_row(defect, workspace_id, project_id, loaded + i) for i, defect in enumerate(defects)])
+            loaded += len(defects)
+            yield rca_data, loaded, page.get('TotalResultCount', loaded)
+        store.commit_defect_load(scope, load_id, project_id)
+    finally:
+        store.discard_defect_load(load_id)
+ 
+def get_project_rca_data(workspace_id: str, project_id: str) -> Dict[str, Any]:
+    """Fetch defects and their root causes for RCA analysis (the final streamed aggregates)"""
+    try:
+        rca_data = _empty_rca_data()
+        for rca_data, loaded, total in iter_project_rca_data(workspace_id, project_id):
+            print(f"Aggregated {loaded} of {total} defects")
+        return rca_data
            
-            for defect in defects:
-                creation_date = defect.get('CreationDate', '').split('T')[0]
-                root_cause = defect.get('c_RCARootCauseUS', 'Unspecified')
-                severity = defect.get('Severity', 'None')
-                priority = defect.get('Priority', 'None')
-                state = defect.get('State', 'None')
-               
-                # Add to defects list
-                rca_data["defects"].append({
-                    "name": defect.get('Name', 'Unnamed Defect'),
-                    "root_cause": root_cause,
-                    "severity": severity,
-                    "priority": priority,
-                    "state": state,
-                    "creation_date": creation_date
-                })
-               
-                # Update RCA summary
-                rca_data["rca_summary"][root_cause] = rca_data["rca_summary"].get(root_cause, 0) + 1
-               
-                # Update monthly trend
-                month = creation_date[:7]  # Get YYYY-MM
-                if month not in rca_data["monthly_trend"]:
-                    rca_data["monthly_trend"][month] = {}
-                rca_data["monthly_trend"][month][root_cause] = \
-                    rca_data["monthly_trend"][month].get(root_cause, 0) + 1
-               
-                # Update distributions
-                rca_data["severity_distribution"][severity] = \
-                    rca_data["severity_distribution"].get(severity, 0) + 1
-                rca_data["priority_distribution"][priority] = \
-                    rca_data["priority_distribution"].get(priority, 0) + 1
-                rca_data["state_distribution"][state] = \
-                    rca_data["state_distribution"].get(state, 0) + 1
-           
-            return rca_data
-           
+    except RallyAPIError:
+        raise
     except Exception as e:
         logging.error(f"Error fetching RCA data: {str(e)}")
-        return None
\ No newline at end of file
+        return None